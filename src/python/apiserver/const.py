@@ -31,11 +31,14 @@ API_VERSION_MINIMUM	= 'api-version-minimum'
 AREA			= 'area'
 AREA_MAX		= 'area-max'
 BBOX			= 'bbox'
+BINARY			= 'binary'
 BOUNDS			= 'bounds'
+CELLS			= 'cells'
 CFGSLAB			= 'cfgslab'
 CFGVERSION		= 1
 CHANGESET		= 'changeset'
 CHANGESETS		= 'changesets'
+CHANGESETS_COMPRESSION	= 'changesets-compression'
 CHANGESETS_INLINE_SIZE	= 'changesets-inline-size'
 CHANGESETS_PER_SLAB	= 'changesets-per-slab'
 CHANGESETS_MAX		= 'changesets-max'
@@ -52,14 +55,23 @@ DBJOB_QUIT		= 'dbjob-quit'
 DBNAME			= 'dbname'
 DBNAME_SUFFIXES		= 'cgnrw' # changesets, geodocs, nodes, relations, ways
 DBPORT			= 'dbport'
+DBTIMEOUT		= 'dbtimeout'
 DBURL			= 'dburl'
+DEBUG			= 'debug'
 DEFAULT			= 'DEFAULT'
 ELEMENT			= 'element'
+ETAG			= 'ETag'
 FRONT_END		= 'front-end'
+GENERATION		= 'generation'
 GENERATOR		= 'generator'
+GEO			= 'geo'
 GEODOC			= 'geodoc'
 GEODOC_LRU_SIZE		= 'geodoc-lru-size'
 GEODOC_LRU_THREADS	= 'geodoc-lru-threads'
+GEODOC_OCCUPANCY	= 'geodoc-occupancy'
+GEODOC_SUMMARY_NODES	= 'geodoc-summary-nodes'
+GEODOCS_COMPRESSION	= 'geodocs-compression'
+GEODOCS_LRU_BYTES	= 'geodocs-lru-bytes'
 GEOHASH_LENGTH		= 'geohash-length'
 ID			= 'id'
 JSON			= 'json'
@@ -70,6 +82,11 @@ LAT_MIN			= -90.0
 LON			= 'lon'
 LON_MAX			= +180.0
 LON_MIN			= -180.0
+LRU			= 'lru'
+LZ4			= 'lz4'
+MAP_CACHE_BYTES		= 'map-cache-bytes'
+MAP_CACHE_GEOHASH_LENGTH = 'map-cache-geohash-length'
+MAP_CACHE_TTL		= 'map-cache-ttl'
 MAXIMUM			= 'maximum'
 MAXIMUM_ELEMENTS	= 'maximum_elements'
 MAXGHLAT		= 89.999999999999992
@@ -82,11 +99,17 @@ MEMBERS			= 'members'
 MINIMUM			= 'minimum'
 MINLAT			= 'minlat'
 MINLON			= 'minlon'
+NEGATIVE_CACHE_SIZE	= 'negative-cache-size'
+NEGATIVE_CACHE_TTL	= 'negative-cache-ttl'
 ND			= 'nd'
 NODE			= 'node'
 NODES			= 'nodes'
+NODES_COMPRESSION	= 'nodes-compression'
 NODES_INLINE_SIZE	= 'nodes-inline-size'
+NODES_LRU_BYTES		= 'nodes-lru-bytes'
 NODES_PER_SLAB		= 'nodes-per-slab'
+NODE_INDEX		= 'node-index'
+NONE			= 'none'
 OSM			= 'osm'
 PER_PAGE		= 'per_page'
 PORT			= 'port'
@@ -96,33 +119,53 @@ REF			= 'ref'
 REFERENCES		= 'references'
 RELATION		= 'relation'
 RELATIONS		= 'relations'
+RELATIONS_COMPRESSION	= 'relations-compression'
 RELATIONS_INLINE_SIZE	= 'relations-inline-size'
+RELATIONS_LRU_BYTES	= 'relations-lru-bytes'
 RELATIONS_PER_SLAB	= 'relations-per-slab'
 ROLE			= 'role'
 SCALE_FACTOR		= 'scale-factor'
 SECONDS			= 'seconds'
 SERVER_NAME		= 'server-name'
+SERVER_TIMING		= 'Server-Timing'
 SERVER_VERSION		= 'server-version'
+SLAB_COMPRESSION	= 'slab-compression'
+SLAB_COMPRESSION_THRESHOLD = 'slab-compression-threshold'
+SLAB_GEOHASH_LENGTH	= 'slab-geohash-length'
 SLAB_INDIRECT		= 1     # Element
 SLAB_INLINE		= 0     # Element is present inline.
+SLAB_LAYOUT		= 'slab-layout'
+SLAB_LRU_BYTES		= 'slab-lru-bytes'
+SLAB_LRU_POLICY		= 'slab-lru-policy'
 SLAB_LRU_SIZE		= 'slab-lru-size'
 SLAB_LRU_THREADS	= 'slab-lru-threads'
 SLAB_NOT_PRESENT	= 2     # Element is not present in the slab.
+SNAPPY			= 'snappy'
 SOURCE_REPOSITORY	= 'source-repository'
 STATUS			= 'status'
 TAG			= 'tag'
 TAGS			= 'tags'
 TEXT_XML		= 'text/xml'
 TIMEOUT			= 'timeout'
+TIMESTAMP		= 'timestamp'
 TRACEPOINTS		= 'tracepoints'
 TRACEPOINTS_PER_PAGE	= 'tracepoints-per-page'
+TWOQ			= '2q'
 TYPE			= 'type'
+UID			= 'uid'
+USER			= 'user'
 UTF8			= 'utf-8'
 V			= 'v'
 VERSION			= 'version'
+VISIBLE			= 'visible'
 WAY			= 'way'
 WAYS			= 'ways'
+WAYS_COMPRESSION	= 'ways-compression'
 WAYS_INLINE_SIZE	= 'ways-inline-size'
+WAYS_LRU_BYTES		= 'ways-lru-bytes'
 WAYS_PER_SLAB		= 'ways-per-slab'
+WAY_INDEX		= 'way-index'
 WAYNODES		= 'waynodes'
 WAYNODES_MAX		= 'waynodes-max'
+XML_FRAGMENT_CACHE	= 'xml-fragment-cache'
+ZLIB			= 'zlib'
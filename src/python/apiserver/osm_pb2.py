@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: apiserver/osm.proto
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='apiserver/osm.proto',
+  package='osmapiserver',
+  syntax='proto2',
+  serialized_options=None,
+  create_key=_descriptor._internal_create_key,
+  serialized_pb=b'\n\x13\x61piserver/osm.proto\x12\x0cosmapiserver\"g\n\x04Slab\x12\x0f\n\x07strings\x18\x01 \x03(\x0c\x12\'\n\x08\x65lements\x18\x02 \x03(\x0b\x32\x15.osmapiserver.Element\x12\x0f\n\x03ids\x18\x03 \x03(\x04\x42\x02\x10\x01\x12\x14\n\x08indirect\x18\x04 \x03(\x04\x42\x02\x10\x01\"\xa9\x03\n\x07\x45lement\x12\n\n\x02id\x18\x01 \x01(\x04\x12\x0b\n\x03key\x18\x02 \x01(\r\x12\x0f\n\x07version\x18\x03 \x01(\r\x12\x11\n\tchangeset\x18\x04 \x01(\x04\x12\x11\n\ttimestamp\x18\x05 \x01(\x03\x12\x0c\n\x04user\x18\x06 \x01(\r\x12\x0b\n\x03uid\x18\x07 \x01(\x04\x12\x0f\n\x07visible\x18\x08 \x01(\x08\x12\x10\n\x04keys\x18\t \x03(\rB\x02\x10\x01\x12\x10\n\x04vals\x18\n \x03(\rB\x02\x10\x01\x12\x0b\n\x03lat\x18\x0b \x01(\x12\x12\x0b\n\x03lon\x18\x0c \x01(\x12\x12\x11\n\x05nodes\x18\r \x03(\x12\x42\x02\x10\x01\x12\x17\n\x0bmember_refs\x18\x0e \x03(\x12\x42\x02\x10\x01\x12\x18\n\x0cmember_roles\x18\x0f \x03(\rB\x02\x10\x01\x12\x18\n\x0cmember_types\x18\x10 \x03(\rB\x02\x10\x01\x12\x16\n\nreferences\x18\x11 \x03(\rB\x02\x10\x01\x12\x13\n\x07geo_ids\x18\x12 \x03(\x12\x42\x02\x10\x01\x12\x14\n\x08geo_lats\x18\x13 \x03(\x12\x42\x02\x10\x01\x12\x14\n\x08geo_lons\x18\x14 \x03(\x12\x42\x02\x10\x01\x12+\n\nattributes\x18\x15 \x03(\x0b\x32\x17.osmapiserver.Attribute\"<\n\tAttribute\x12\x0b\n\x03key\x18\x01 \x02(\r\x12\"\n\x05value\x18\x02 \x02(\x0b\x32\x13.osmapiserver.Value\"\xab\x01\n\x05Value\x12\x0e\n\x04none\x18\x01 \x01(\x08H\x00\x12\x11\n\x07\x62oolean\x18\x02 \x01(\x08H\x00\x12\x11\n\x07integer\x18\x03 \x01(\x12H\x00\x12\x0e\n\x04real\x18\x04 \x01(\x01H\x00\x12\x0e\n\x04text\x18\x05 \x01(\rH\x00\x12\"\n\x04list\x18\x06 \x01(\x0b\x32\x12.osmapiserver.ListH\x00\x12 \n\x03map\x18\x07 \x01(\x0b\x32\x11.osmapiserver.MapH\x00\x42\x06\n\x04kind\"*\n\x04List\x12\"\n\x05items\x18\x01 \x03(\x0b\x32\x13.osmapiserver.Value\"-\n\x03Map\x12&\n\x05items\x18\x01 \x03(\x0b\x32\x17.osmapiserver.Attribute'
+)
+
+
+
+
+_SLAB = _descriptor.Descriptor(
+  name='Slab',
+  full_name='osmapiserver.Slab',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='strings', full_name='osmapiserver.Slab.strings', index=0,
+      number=1, type=12, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='elements', full_name='osmapiserver.Slab.elements', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='ids', full_name='osmapiserver.Slab.ids', index=2,
+      number=3, type=4, cpp_type=4, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='indirect', full_name='osmapiserver.Slab.indirect', index=3,
+      number=4, type=4, cpp_type=4, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=37,
+  serialized_end=140,
+)
+
+
+_ELEMENT = _descriptor.Descriptor(
+  name='Element',
+  full_name='osmapiserver.Element',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='id', full_name='osmapiserver.Element.id', index=0,
+      number=1, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='key', full_name='osmapiserver.Element.key', index=1,
+      number=2, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='version', full_name='osmapiserver.Element.version', index=2,
+      number=3, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='changeset', full_name='osmapiserver.Element.changeset', index=3,
+      number=4, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='timestamp', full_name='osmapiserver.Element.timestamp', index=4,
+      number=5, type=3, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='user', full_name='osmapiserver.Element.user', index=5,
+      number=6, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='uid', full_name='osmapiserver.Element.uid', index=6,
+      number=7, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='visible', full_name='osmapiserver.Element.visible', index=7,
+      number=8, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='keys', full_name='osmapiserver.Element.keys', index=8,
+      number=9, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='vals', full_name='osmapiserver.Element.vals', index=9,
+      number=10, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='lat', full_name='osmapiserver.Element.lat', index=10,
+      number=11, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='lon', full_name='osmapiserver.Element.lon', index=11,
+      number=12, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='nodes', full_name='osmapiserver.Element.nodes', index=12,
+      number=13, type=18, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='member_refs', full_name='osmapiserver.Element.member_refs', index=13,
+      number=14, type=18, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='member_roles', full_name='osmapiserver.Element.member_roles', index=14,
+      number=15, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='member_types', full_name='osmapiserver.Element.member_types', index=15,
+      number=16, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='references', full_name='osmapiserver.Element.references', index=16,
+      number=17, type=13, cpp_type=3, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='geo_ids', full_name='osmapiserver.Element.geo_ids', index=17,
+      number=18, type=18, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='geo_lats', full_name='osmapiserver.Element.geo_lats', index=18,
+      number=19, type=18, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='geo_lons', full_name='osmapiserver.Element.geo_lons', index=19,
+      number=20, type=18, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=b'\020\001', file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='attributes', full_name='osmapiserver.Element.attributes', index=20,
+      number=21, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=143,
+  serialized_end=568,
+)
+
+
+_ATTRIBUTE = _descriptor.Descriptor(
+  name='Attribute',
+  full_name='osmapiserver.Attribute',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='key', full_name='osmapiserver.Attribute.key', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='value', full_name='osmapiserver.Attribute.value', index=1,
+      number=2, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=570,
+  serialized_end=630,
+)
+
+
+_VALUE = _descriptor.Descriptor(
+  name='Value',
+  full_name='osmapiserver.Value',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='none', full_name='osmapiserver.Value.none', index=0,
+      number=1, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='boolean', full_name='osmapiserver.Value.boolean', index=1,
+      number=2, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='integer', full_name='osmapiserver.Value.integer', index=2,
+      number=3, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='real', full_name='osmapiserver.Value.real', index=3,
+      number=4, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='text', full_name='osmapiserver.Value.text', index=4,
+      number=5, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='list', full_name='osmapiserver.Value.list', index=5,
+      number=6, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='map', full_name='osmapiserver.Value.map', index=6,
+      number=7, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+    _descriptor.OneofDescriptor(
+      name='kind', full_name='osmapiserver.Value.kind',
+      index=0, containing_type=None,
+      create_key=_descriptor._internal_create_key,
+    fields=[]),
+  ],
+  serialized_start=633,
+  serialized_end=804,
+)
+
+
+_LIST = _descriptor.Descriptor(
+  name='List',
+  full_name='osmapiserver.List',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='items', full_name='osmapiserver.List.items', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=806,
+  serialized_end=848,
+)
+
+
+_MAP = _descriptor.Descriptor(
+  name='Map',
+  full_name='osmapiserver.Map',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  create_key=_descriptor._internal_create_key,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='items', full_name='osmapiserver.Map.items', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  serialized_options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=850,
+  serialized_end=895,
+)
+
+_SLAB.fields_by_name['elements'].message_type = _ELEMENT
+_ELEMENT.fields_by_name['attributes'].message_type = _ATTRIBUTE
+_ATTRIBUTE.fields_by_name['value'].message_type = _VALUE
+_VALUE.fields_by_name['list'].message_type = _LIST
+_VALUE.fields_by_name['map'].message_type = _MAP
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['none'])
+_VALUE.fields_by_name['none'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['boolean'])
+_VALUE.fields_by_name['boolean'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['integer'])
+_VALUE.fields_by_name['integer'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['real'])
+_VALUE.fields_by_name['real'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['text'])
+_VALUE.fields_by_name['text'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['list'])
+_VALUE.fields_by_name['list'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_VALUE.oneofs_by_name['kind'].fields.append(
+  _VALUE.fields_by_name['map'])
+_VALUE.fields_by_name['map'].containing_oneof = _VALUE.oneofs_by_name['kind']
+_LIST.fields_by_name['items'].message_type = _VALUE
+_MAP.fields_by_name['items'].message_type = _ATTRIBUTE
+DESCRIPTOR.message_types_by_name['Slab'] = _SLAB
+DESCRIPTOR.message_types_by_name['Element'] = _ELEMENT
+DESCRIPTOR.message_types_by_name['Attribute'] = _ATTRIBUTE
+DESCRIPTOR.message_types_by_name['Value'] = _VALUE
+DESCRIPTOR.message_types_by_name['List'] = _LIST
+DESCRIPTOR.message_types_by_name['Map'] = _MAP
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+Slab = _reflection.GeneratedProtocolMessageType('Slab', (_message.Message,), {
+  'DESCRIPTOR' : _SLAB,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.Slab)
+  })
+_sym_db.RegisterMessage(Slab)
+
+Element = _reflection.GeneratedProtocolMessageType('Element', (_message.Message,), {
+  'DESCRIPTOR' : _ELEMENT,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.Element)
+  })
+_sym_db.RegisterMessage(Element)
+
+Attribute = _reflection.GeneratedProtocolMessageType('Attribute', (_message.Message,), {
+  'DESCRIPTOR' : _ATTRIBUTE,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.Attribute)
+  })
+_sym_db.RegisterMessage(Attribute)
+
+Value = _reflection.GeneratedProtocolMessageType('Value', (_message.Message,), {
+  'DESCRIPTOR' : _VALUE,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.Value)
+  })
+_sym_db.RegisterMessage(Value)
+
+List = _reflection.GeneratedProtocolMessageType('List', (_message.Message,), {
+  'DESCRIPTOR' : _LIST,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.List)
+  })
+_sym_db.RegisterMessage(List)
+
+Map = _reflection.GeneratedProtocolMessageType('Map', (_message.Message,), {
+  'DESCRIPTOR' : _MAP,
+  '__module__' : 'apiserver.osm_pb2'
+  # @@protoc_insertion_point(class_scope:osmapiserver.Map)
+  })
+_sym_db.RegisterMessage(Map)
+
+
+_SLAB.fields_by_name['ids']._options = None
+_SLAB.fields_by_name['indirect']._options = None
+_ELEMENT.fields_by_name['keys']._options = None
+_ELEMENT.fields_by_name['vals']._options = None
+_ELEMENT.fields_by_name['nodes']._options = None
+_ELEMENT.fields_by_name['member_refs']._options = None
+_ELEMENT.fields_by_name['member_roles']._options = None
+_ELEMENT.fields_by_name['member_types']._options = None
+_ELEMENT.fields_by_name['references']._options = None
+_ELEMENT.fields_by_name['geo_ids']._options = None
+_ELEMENT.fields_by_name['geo_lats']._options = None
+_ELEMENT.fields_by_name['geo_lons']._options = None
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,588 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""A compact binary encoding for OSM elements and slabs.
+
+Values are encoded as a type byte followed by the value's contents.
+Integers are written as zigzag coded 'varints', and strings that are
+decimal numbers (such as element ids) or a letter followed by a
+decimal number (such as back references) are written as numbers.
+
+A slab of elements is written as:
+
+    magic     -- SLAB_MAGIC, which includes a format version.
+    count     -- the number of elements in the slab.
+    indirect  -- the number of the slab's elements that are stored
+                 outside the slab.
+    strings   -- a table of strings used more than once in the slab:
+                 tag keys and values, user names, member roles, ...
+    ids       -- element ids, each coded as the difference from the
+                 previous id, followed by the ids of the elements
+                 stored outside the slab, coded likewise.
+    bases     -- the latitude, longitude and timestamp that those of
+                 the slab's elements are coded relative to.
+    offsets   -- a fixed size (4 byte) offset for each element.
+    records   -- the attributes of each element.
+
+The offsets allow any one element to be decoded without decoding the
+others.  Slabs written in the first version of the format have no
+'indirect' count and hold all their elements.
+
+Exported functions:
+
+    decode_binary -- return a Python value given its binary encoding.
+    encode_binary -- return the binary encoding for a Python value.
+    encode_binary_slab -- return the binary encoding for a slab.
+    is_binary_slab -- check for a binary encoded slab.
+
+Exported classes:
+
+    BinarySlab -- access the elements of a binary encoded slab.
+"""
+
+import struct
+
+import apiserver.const as C
+from apiserver.osmelement import _encode_timestamp, _decode_timestamp
+
+SLAB_MAGIC = "\xb5\x02"
+_SLAB_MAGIC_V1 = "\xb5\x01"
+
+# Type bytes for values.
+(_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STRING, _LIST, _DICT, _DECIMAL,
+ _PREFIXED) = [chr(c) for c in range(1, 11)]
+
+# Bits for the attributes present in an element's record.  The
+# attributes for bits 2 to 7 are numbers.
+(_B_VISIBLE, _B_HIDDEN, _B_VERSION, _B_CHANGESET, _B_UID, _B_LAT, _B_LON,
+ _B_TIMESTAMP, _B_USER, _B_TAGS, _B_NODES, _B_MEMBERS, _B_REFERENCES,
+ _B_OTHER) = [1 << b for b in range(14)]
+_PAYLOAD_BITS = [1 << b for b in range(2, 14)]
+_NUMBERS = [bin(b).count("1") for b in range(64)]
+
+_OFFSET = struct.Struct("<I")
+_DOUBLE = struct.Struct("<d")
+
+#
+# Integers and strings.
+#
+
+def _varint(n):
+    "Return the varint coding of a non-negative integer."
+    if n < 0x80:
+        return chr(n)
+    bits = []
+    while n >= 0x80:
+        bits.append(chr((n & 0x7F) | 0x80))
+        n >>= 7
+    bits.append(chr(n))
+    return "".join(bits)
+
+def _zigzag(n):
+    "Return the varint coding of an integer."
+    if n >= 0:
+        return _varint(n << 1)
+    return _varint((-n << 1) - 1)
+
+def _read_varint(bits, pos):
+    "Return (value, position) for the varint at 'pos'."
+    b = ord(bits[pos])
+    if b < 0x80:
+        return (b, pos + 1)
+    n = b & 0x7F
+    shift = 7
+    while True:
+        pos += 1
+        b = ord(bits[pos])
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return (n, pos + 1)
+        shift += 7
+
+def _read_varints(bits, pos, count):
+    "Return (values, position) for 'count' varints starting at 'pos'."
+    values = []
+    append = values.append
+    while count:
+        b = ord(bits[pos])
+        pos += 1
+        if b >= 0x80:
+            n = b & 0x7F
+            shift = 7
+            while True:
+                b = ord(bits[pos])
+                pos += 1
+                n |= (b & 0x7F) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+            b = n
+        append(b)
+        count -= 1
+    return (values, pos)
+
+def _accumulate(values):
+    "Return the running sums of a list of zigzag coded differences."
+    total = 0
+    sums = []
+    append = sums.append
+    for n in values:
+        if n & 1:
+            total -= (n + 1) >> 1
+        else:
+            total += n >> 1
+        append(total)
+    return sums
+
+def _read_zigzag(bits, pos):
+    "Return (value, position) for the zigzag coded integer at 'pos'."
+    n, pos = _read_varint(bits, pos)
+    if n & 1:
+        return (-((n + 1) >> 1), pos)
+    return (n >> 1, pos)
+
+def _is_decimal(s):
+    "Return True if string 's' is the canonical form of a number."
+    return s.isdigit() and (s[0] != "0" or len(s) == 1)
+
+def _utf8(s):
+    "Return the UTF-8 bytes for a string."
+    if type(s) is unicode:
+        return s.encode(C.UTF8)
+    return s
+
+def _text(bits):
+    "Return a string for UTF-8 bytes, as the JSON decoder would."
+    try:
+        bits.decode('ascii')
+        return bits
+    except UnicodeDecodeError:
+        return bits.decode(C.UTF8)
+
+#
+# Values.
+#
+
+def _encode_value(out, v):
+    "Append the encoding of value 'v' to list 'out'."
+    t = type(v)
+    if v is None:
+        out.append(_NONE)
+    elif t is bool:
+        out.append(_TRUE if v else _FALSE)
+    elif t is int or t is long:
+        out.append(_INT)
+        out.append(_zigzag(v))
+    elif t is float:
+        out.append(_FLOAT)
+        out.append(_DOUBLE.pack(v))
+    elif t is str and v and _is_decimal(v):
+        out.append(_DECIMAL)
+        out.append(_varint(int(v)))
+    elif t is str and len(v) > 1 and not v[0].isdigit() and \
+            _is_decimal(v[1:]):
+        out.append(_PREFIXED)
+        out.append(v[0])
+        out.append(_varint(int(v[1:])))
+    elif t is str or t is unicode:
+        v = _utf8(v)
+        out.append(_STRING)
+        out.append(_varint(len(v)))
+        out.append(v)
+    elif isinstance(v, (list, tuple, set, frozenset)):
+        out.append(_LIST)
+        out.append(_varint(len(v)))
+        for item in v:
+            _encode_value(out, item)
+    elif isinstance(v, dict):
+        out.append(_DICT)
+        out.append(_varint(len(v)))
+        for (k, item) in v.iteritems():
+            _encode_value(out, k)
+            _encode_value(out, item)
+    else:
+        raise TypeError, "Cannot encode values of type %s" % t
+
+def _decode_value(bits, pos):
+    "Return (value, position) for the value at 'pos'."
+    t = bits[pos]
+    pos += 1
+    if t == _DECIMAL:
+        n, pos = _read_varint(bits, pos)
+        return (str(n), pos)
+    elif t == _PREFIXED:
+        prefix = bits[pos]
+        n, pos = _read_varint(bits, pos + 1)
+        return (prefix + str(n), pos)
+    elif t == _STRING:
+        n, pos = _read_varint(bits, pos)
+        return (_text(bits[pos:pos + n]), pos + n)
+    elif t == _INT:
+        return _read_zigzag(bits, pos)
+    elif t == _LIST:
+        n, pos = _read_varint(bits, pos)
+        items = []
+        for _ in xrange(n):
+            v, pos = _decode_value(bits, pos)
+            items.append(v)
+        return (items, pos)
+    elif t == _DICT:
+        n, pos = _read_varint(bits, pos)
+        d = {}
+        for _ in xrange(n):
+            k, pos = _decode_value(bits, pos)
+            d[k], pos = _decode_value(bits, pos)
+        return (d, pos)
+    elif t == _NONE:
+        return (None, pos)
+    elif t == _FALSE:
+        return (False, pos)
+    elif t == _TRUE:
+        return (True, pos)
+    elif t == _FLOAT:
+        return (_DOUBLE.unpack_from(bits, pos)[0], pos + _DOUBLE.size)
+    raise ValueError, "Unknown type byte %d at %d" % (ord(t), pos - 1)
+
+def encode_binary(obj):
+    "Returns the binary representation for a Python object."
+    out = []
+    _encode_value(out, obj)
+    return "".join(out)
+
+def decode_binary(bits):
+    "Returns a Python object, given its binary representation."
+    v, pos = _decode_value(bits, 0)
+    if pos != len(bits):
+        raise ValueError, "Trailing bytes in binary value."
+    return v
+
+#
+# Slabs.
+#
+
+def _is_count(v):
+    "Return True if 'v' can be written as a varint."
+    return (type(v) is int or type(v) is long) and v >= 0
+
+def _is_text(v):
+    return type(v) is str or type(v) is unicode
+
+def _count_strings(mappings):
+    "Return the strings in 'mappings' that may go into a string table."
+    counts = {}
+    def _count(s):
+        if _is_text(s):
+            counts[s] = counts.get(s, 0) + 1
+    for m in mappings:
+        for (k, v) in m.iteritems():
+            if k == C.USER:
+                _count(v)
+            elif k == C.TAGS and isinstance(v, dict):
+                for (tk, tv) in v.iteritems():
+                    _count(tk)
+                    _count(tv)
+            elif k == C.MEMBERS and isinstance(v, (list, tuple)):
+                for member in v:
+                    if len(member) == 3:
+                        _count(member[1])
+                        _count(member[2])
+            elif k != C.ID:
+                _count(k)
+    return counts
+
+class _SlabEncoder(object):
+    "Write the records for a slab's elements."
+
+    def __init__(self, mappings):
+        counts = _count_strings(mappings)
+        self.strings = sorted([s for (s, n) in counts.iteritems() if n > 1],
+                              key=lambda s: -counts[s])
+        self.index = dict([(s, i) for (i, s) in enumerate(self.strings)])
+        self.base = [0, 0, 0]
+        for (i, k) in enumerate([C.LAT, C.LON]):
+            for m in mappings:
+                if type(m.get(k)) is int:
+                    self.base[i] = m[k]
+                    break
+        for m in mappings:
+            ts = _encode_timestamp(m.get(C.TIMESTAMP))
+            if type(ts) is int:
+                self.base[2] = ts
+                break
+
+    def strref(self, s):
+        """Return a reference to a string.
+
+        References with an even value name an entry in the string
+        table; odd values are followed by the string's contents."""
+        i = self.index.get(s)
+        if i is not None:
+            return _varint(i << 1)
+        s = _utf8(s)
+        return _varint((len(s) << 1) | 1) + s
+
+    def record(self, m):
+        """Return the encoding of the attributes in mapping 'm'.
+
+        A record holds a varint with a bit set for each attribute that
+        is present, the numeric attributes, and then the remaining
+        attributes, in the order of their bits.  Attributes without a
+        bit of their own, or with values of an unexpected type, are
+        written with their names."""
+        strref = self.strref
+        baselat, baselon, basets = self.base
+        flags = 0
+        fields = {}
+        others = []
+        for (k, v) in m.iteritems():
+            b = None
+            if k == C.ID:
+                continue
+            elif k == C.VISIBLE and type(v) is bool:
+                flags |= _B_VISIBLE if v else _B_HIDDEN
+                continue
+            elif k == C.VERSION and _is_count(v):
+                b, bits = _B_VERSION, _varint(v)
+            elif k == C.CHANGESET and _is_count(v):
+                b, bits = _B_CHANGESET, _varint(v)
+            elif k == C.UID and _is_count(v):
+                b, bits = _B_UID, _varint(v)
+            elif k == C.LAT and type(v) is int:
+                b, bits = _B_LAT, _zigzag(v - baselat)
+            elif k == C.LON and type(v) is int:
+                b, bits = _B_LON, _zigzag(v - baselon)
+            elif k == C.TIMESTAMP and _is_text(v) and \
+                    type(_encode_timestamp(v)) is int:
+                b, bits = _B_TIMESTAMP, _zigzag(_encode_timestamp(v) - basets)
+            elif k == C.USER and _is_text(v):
+                b, bits = _B_USER, strref(v)
+            elif k == C.TAGS and isinstance(v, dict) and \
+                    all([_is_text(tk) and _is_text(tv)
+                         for (tk, tv) in v.iteritems()]):
+                out = [_varint(len(v))]
+                for (tk, tv) in v.iteritems():
+                    out.append(strref(tk))
+                    out.append(strref(tv))
+                b, bits = _B_TAGS, "".join(out)
+            elif k == C.NODES and isinstance(v, (list, tuple)) and \
+                    all([type(n) is int for n in v]):
+                out = [_varint(len(v))]
+                previous = 0
+                for n in v:
+                    out.append(_zigzag(n - previous))
+                    previous = n
+                b, bits = _B_NODES, "".join(out)
+            elif k == C.MEMBERS and isinstance(v, (list, tuple)) and \
+                    all([len(mb) == 3 and _is_text(mb[1]) and _is_text(mb[2])
+                         for mb in v]):
+                out = [_varint(len(v))]
+                for (ref, role, mtype) in v:
+                    _encode_value(out, ref)
+                    out.append(strref(role))
+                    out.append(strref(mtype))
+                b, bits = _B_MEMBERS, "".join(out)
+            elif k == C.REFERENCES and isinstance(v, (list, tuple)):
+                out = []
+                _encode_value(out, v)
+                b, bits = _B_REFERENCES, "".join(out)
+            if b is None:
+                others.append((k, v))
+            else:
+                flags |= b
+                fields[b] = bits
+        if others:
+            out = [_varint(len(others))]
+            for (k, v) in others:
+                out.append(strref(k))
+                _encode_value(out, v)
+            flags |= _B_OTHER
+            fields[_B_OTHER] = "".join(out)
+
+        out = [_varint(flags)]
+        for b in _PAYLOAD_BITS:
+            if flags & b:
+                out.append(fields[b])
+        return "".join(out)
+
+def encode_binary_slab(mappings, indirect=()):
+    """Return the binary representation of a slab.
+
+    mappings -- the mapping representations of the elements present
+                in the slab.  Element ids should be decimal numbers.
+    indirect -- the ids of the slab's elements that are stored
+                outside the slab.
+    """
+
+    encoder = _SlabEncoder(mappings)
+
+    out = [SLAB_MAGIC, _varint(len(mappings)), _varint(len(indirect)),
+           _varint(len(encoder.strings))]
+    for s in encoder.strings:
+        s = _utf8(s)
+        out.append(_varint(len(s)))
+        out.append(s)
+
+    previous = 0
+    for m in mappings:
+        elemid = m[C.ID]
+        if type(elemid) is not str or not _is_decimal(elemid):
+            raise ValueError, "Element id '%s' is not a number" % elemid
+        out.append(_zigzag(int(elemid) - previous))
+        previous = int(elemid)
+
+    previous = 0
+    for elemid in indirect:
+        out.append(_zigzag(int(elemid) - previous))
+        previous = int(elemid)
+
+    for b in encoder.base:
+        out.append(_zigzag(b))
+
+    records = [encoder.record(m) for m in mappings]
+    offset = 0
+    for r in records:
+        out.append(_OFFSET.pack(offset))
+        offset += len(r)
+    out.extend(records)
+
+    return "".join(out)
+
+def is_binary_slab(bits):
+    "Return True if 'bits' is a binary encoded slab."
+    return bits.startswith(SLAB_MAGIC) or bits.startswith(_SLAB_MAGIC_V1)
+
+class BinarySlab(object):
+    """Access the elements in a binary encoded slab.
+
+    The header of the slab is decoded when the object is created;
+    individual elements are decoded by 'mapping()'.
+    """
+
+    __slots__ = ('ids', 'indirect', '_bits', '_strings', '_base',
+                 '_offsets')
+
+    def __init__(self, bits):
+        if bits.startswith(SLAB_MAGIC):
+            count, pos = _read_varint(bits, len(SLAB_MAGIC))
+            nindirect, pos = _read_varint(bits, pos)
+        elif bits.startswith(_SLAB_MAGIC_V1):
+            count, pos = _read_varint(bits, len(_SLAB_MAGIC_V1))
+            nindirect = 0
+        else:
+            raise ValueError, "Not a binary slab."
+        nstrings, pos = _read_varint(bits, pos)
+        strings = []
+        for _ in xrange(nstrings):
+            n, pos = _read_varint(bits, pos)
+            strings.append(_text(bits[pos:pos + n]))
+            pos += n
+        deltas, pos = _read_varints(bits, pos, count + nindirect + 3)
+        ids = _accumulate(deltas[:count])
+        indirect = _accumulate(deltas[count:count + nindirect])
+        base = [n >> 1 if not n & 1 else -((n + 1) >> 1)
+                for n in deltas[count + nindirect:]]
+        offsets = struct.unpack_from("<%dI" % count, bits, pos)
+        pos += count * _OFFSET.size
+
+        self.ids = map(str, ids)
+        self.indirect = map(str, indirect)
+        self._bits = bits
+        self._strings = strings
+        self._base = base
+        self._offsets = [pos + o for o in offsets]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _strref(self, pos):
+        "Return (string, position) for the string reference at 'pos'."
+        n, pos = _read_varint(self._bits, pos)
+        if n & 1:
+            n >>= 1
+            return (_text(self._bits[pos:pos + n]), pos + n)
+        return (self._strings[n >> 1], pos)
+
+    def mapping(self, slot):
+        "Return the mapping representation of the element at 'slot'."
+        bits = self._bits
+        strref = self._strref
+        m = {C.ID: self.ids[slot]}
+        flags, pos = _read_varint(bits, self._offsets[slot])
+        if flags & _B_VISIBLE:
+            m[C.VISIBLE] = True
+        elif flags & _B_HIDDEN:
+            m[C.VISIBLE] = False
+
+        numbers, pos = _read_varints(bits, pos, _NUMBERS[(flags >> 2) & 0x3F])
+        if numbers:
+            numbers.reverse()
+            pop = numbers.pop
+            if flags & _B_VERSION:
+                m[C.VERSION] = pop()
+            if flags & _B_CHANGESET:
+                m[C.CHANGESET] = pop()
+            if flags & _B_UID:
+                m[C.UID] = pop()
+            if flags & _B_LAT:
+                n = pop()
+                m[C.LAT] = ((n >> 1) ^ -(n & 1)) + self._base[0]
+            if flags & _B_LON:
+                n = pop()
+                m[C.LON] = ((n >> 1) ^ -(n & 1)) + self._base[1]
+            if flags & _B_TIMESTAMP:
+                n = pop()
+                m[C.TIMESTAMP] = _decode_timestamp(((n >> 1) ^ -(n & 1)) +
+                                                   self._base[2])
+        if flags < _B_USER:
+            return m
+
+        if flags & _B_USER:
+            m[C.USER], pos = strref(pos)
+        if flags & _B_TAGS:
+            n, pos = _read_varint(bits, pos)
+            tags = {}
+            for _ in xrange(n):
+                k, pos = strref(pos)
+                tags[k], pos = strref(pos)
+            m[C.TAGS] = tags
+        if flags & _B_NODES:
+            n, pos = _read_varint(bits, pos)
+            deltas, pos = _read_varints(bits, pos, n)
+            m[C.NODES] = _accumulate(deltas)
+        if flags & _B_MEMBERS:
+            n, pos = _read_varint(bits, pos)
+            members = []
+            for _ in xrange(n):
+                ref, pos = _decode_value(bits, pos)
+                role, pos = strref(pos)
+                mtype, pos = strref(pos)
+                members.append((ref, role, mtype))
+            m[C.MEMBERS] = members
+        if flags & _B_REFERENCES:
+            m[C.REFERENCES], pos = _decode_value(bits, pos)
+        if flags & _B_OTHER:
+            n, pos = _read_varint(bits, pos)
+            for _ in xrange(n):
+                k, pos = strref(pos)
+                m[k], pos = _decode_value(bits, pos)
+        return m
@@ -28,12 +28,24 @@ Exported functions:
     init_osm_factory -- initialize the factory.
 """
 
+import calendar
 import geohash
 import math
+import time
 import types
+import weakref
 
 import cjson
 
+from bisect import bisect_left
+from itertools import izip
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from lxml import etree as ET
 
 import apiserver.const as C
@@ -44,12 +56,13 @@ _server_name = None
 _scale_factor = None
 _fraction_width = None
 _coordinate_format = None
+_xml_fragment_cache = False
 
 def init_osm_factory(config):
     """Initialize the factory for OSM elements."""
 
     global _coordinate_format, _fraction_width, _scale_factor, _server_name
-    global _server_version
+    global _server_version, _xml_fragment_cache
 
     _scale_factor = config.getint(C.DATASTORE, C.SCALE_FACTOR)
     _fraction_width = math.trunc(math.log10(_scale_factor))
@@ -58,6 +71,16 @@ def init_osm_factory(config):
     _server_version = config.get(C.FRONT_END, C.SERVER_VERSION)
     _server_name = config.get(C.FRONT_END, C.SERVER_NAME)
 
+    if config.has_option(C.FRONT_END, C.XML_FRAGMENT_CACHE):
+        _xml_fragment_cache = config.getboolean(C.FRONT_END,
+                                                C.XML_FRAGMENT_CACHE)
+    else:
+        _xml_fragment_cache = False
+
+def osm_xml_fragment_cache():
+    "Return True if elements memoize their XML representation."
+    return _xml_fragment_cache
+
 def encode_coordinate(coordinate):
     """Encode a latitude or longitude as an integral value.
 
@@ -107,11 +130,140 @@ def new_osm_response():
     return osm
 
 
-class OSMElement(dict):
-    """A representation of an OSM Element"""
+#
+# Compact representations of attribute values.
+#
+
+_timestamp_days = {}             # Day number -> "YYYY-MM-DDT".
+_timestamp_dates = {}            # "YYYY-MM-DDT" -> day number.
+
+def _intern(s):
+    "Return a shared copy of string 's'."
+    if type(s) is str:
+        return intern(s)
+    return s
+
+def _encode_int(value):
+    "Store numeric attributes as integers."
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+def _encode_timestamp(value):
+    "Store an OSM timestamp as seconds since the epoch, if possible."
+    if not isinstance(value, basestring) or len(value) != 20 or \
+            value[13] != ':' or value[16] != ':' or value[19] != 'Z':
+        return value
+    days = _timestamp_dates.get(value[0:11])
+    if days is None:
+        try:
+            days = calendar.timegm((int(value[0:4]), int(value[5:7]),
+                                    int(value[8:10]), 0, 0, 0)) / 86400
+        except ValueError:
+            return value
+        if _decode_timestamp(days * 86400)[0:11] != value[0:11]:
+            return value
+        _timestamp_dates[value[0:11]] = days
+    hms = value[11:13] + value[14:16] + value[17:19]
+    if not hms.isdigit():
+        return value
+    hours, minutes, seconds = int(hms[0:2]), int(hms[2:4]), int(hms[4:6])
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return value
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def _decode_timestamp(value):
+    "Return the OSM representation of a timestamp."
+    if type(value) is not int:
+        return value
+    days, seconds = divmod(value, 86400)
+    day = _timestamp_days.get(days)
+    if day is None:
+        day = "%04d-%02d-%02dT" % time.gmtime(days * 86400)[0:3]
+        _timestamp_days[days] = day
+    minutes, seconds = divmod(seconds, 60)
+    return "%s%02d:%02d:%02dZ" % (day, minutes / 60, minutes % 60, seconds)
+
+def _encode_members(members):
+    "Store relation members as a tuple of (ref, role, type) tuples."
+    return tuple([(ref, _intern(role), _intern(mtype))
+                  for (ref, role, mtype) in members])
+
+class _SharedTags(dict):
+    """A read-only tag dictionary shared by elements with identical tags.
+
+    Tags read from the datastore are held in these; code that needs
+    to change an element's tags should assign a new dictionary."""
+
+    __slots__ = ('__weakref__',)
+
+    def _readonly(self, *args, **kw):
+        raise TypeError, "Shared tags cannot be modified."
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+_shared_tags = weakref.WeakValueDictionary()
+
+def _encode_tags(tags):
+    "Return a shared dictionary with the contents of 'tags'."
+    items = tuple(sorted([(_intern(k), _intern(v))
+                          for (k, v) in tags.iteritems()]))
+    shared = _shared_tags.get(items)
+    if shared is None:
+        shared = _SharedTags(items)
+        _shared_tags[items] = shared
+    return shared
+
+
+class OSMElement(object):
+    """A representation of an OSM Element
+
+    Elements behave as mappings from attribute names to values.  The
+    standard OSM attributes are held in slots using compact
+    representations (for example, timestamps are held as integers and
+    way node lists as tuples); other attributes are held in a
+    dictionary.  An attribute whose value is None is absent.
+
+    Elements read from the datastore share their tag dictionaries
+    with other elements that have the same tags; these dictionaries
+    cannot be changed in place.  Back references are held in a tuple
+    until they are retrieved using '[]', which converts them to a set
+    that may be changed.
+
+    If enabled by the 'xml-fragment-cache' configuration option, the
+    XML text for an element is computed once by 'xml_fragment()' and
+    kept with the element.  It is discarded when the element is
+    changed using the mapping interface; code that changes a nested
+    value (for example, a tag) in place must call 'invalidate()'.
+    """
+
+    __slots__ = ('id', 'visible', 'version', 'changeset', 'timestamp',
+                 'user', 'uid', 'tags', 'references', '_extra', '_xml')
 
+    namespace = None
     ignoredkeys = [C.TAGS, C.REFERENCES]
 
+    # Attributes held in slots, in the order used in XML output.
+    fields = (C.ID, C.VISIBLE, C.VERSION, C.CHANGESET, C.TIMESTAMP, C.USER,
+              C.UID, C.TAGS, C.REFERENCES)
+    fieldset = frozenset(fields)
+    # Slot attributes translated to XML attributes by 'add_attributes()'.
+    attributes = fields[:-2]
+    # Translations applied to attribute values when they are stored.
+    encoders = {
+        C.CHANGESET: _encode_int,
+        C.TIMESTAMP: _encode_timestamp,
+        C.UID: _encode_int,
+        C.USER: _intern,
+        C.VERSION: _encode_int
+        }
+    # Translations applied to attribute values when they are read.
+    decoders = {
+        C.TIMESTAMP: _decode_timestamp
+        }
+
     def __init__(self, namespace, elemid):
         """Initialize an OSMElement object.
 
@@ -119,39 +271,170 @@ class OSMElement(dict):
         elemid    -- the element id in the namespace.
         """
 
-        assert namespace in _namespace_to_factory.keys()
+        assert namespace == self.namespace
         assert isinstance(elemid, basestring)
 
-        super(OSMElement, self).__init__()
-        super(OSMElement, self).__setitem__(C.ID, elemid)
-        super(OSMElement, self).__setitem__(C.REFERENCES, set())
-        self.namespace = namespace
+        for k in self.fields:
+            setattr(self, k, None)
         self.id = elemid
-        self.slabkey = slabutil_make_slabkey(namespace, elemid)
+        self._extra = None
+        self._xml = None
+
+    @property
+    def slabkey(self):
+        "The key for the slab holding this element."
+        return slabutil_make_slabkey(self.namespace, self.id)
 
     def __repr__(self):
         'Return a human-friendly representation of an OSMElement.'
-        docstr = super(OSMElement, self).__repr__()
-        return "OSMElement<%s>%s" % (self.namespace, docstr)
+        return "OSMElement<%s>%s" % (self.namespace, dict(self.items()))
+
+    def __eq__(self, other):
+        if not isinstance(other, OSMElement):
+            return NotImplemented
+        return self.namespace == other.namespace and \
+            self._comparable() == other._comparable()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def _comparable(self):
+        d = dict(self.items())
+        d[C.REFERENCES] = set(d[C.REFERENCES])
+        return d
+
+    # The mapping interface.
+
+    def __getitem__(self, key):
+        if key == C.REFERENCES:
+            refs = self.references
+            if not isinstance(refs, set): # Allow changes by the caller.
+                self.references = refs = set(refs or ())
+            return refs
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError, key
+        return value
+
+    def __setitem__(self, key, value):
+        self._xml = None
+        if key in self.fieldset:
+            encoder = self.encoders.get(key)
+            if encoder:
+                value = encoder(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        self._xml = None
+        if key in self.fieldset:
+            if getattr(self, key) is None:
+                raise KeyError, key
+            setattr(self, key, None)
+        elif self._extra is not None:
+            del self._extra[key]
+        else:
+            raise KeyError, key
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        "Return the value for 'key', without side effects."
+        if key in self.fieldset:
+            value = getattr(self, key)
+            if value is None:
+                if key == C.REFERENCES:
+                    return ()
+                return default
+            if key in self.decoders:
+                return self.decoders[key](value)
+            return value
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def keys(self):
+        keys = [k for k in self.fields
+                if k == C.REFERENCES or getattr(self, k) is not None]
+        if self._extra:
+            keys.extend(self._extra.keys())
+        return keys
+
+    def items(self):
+        return [(k, self.get(k, None)) for k in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def values(self):
+        return [v for (k, v) in self.items()]
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError, key
+
+    def update(self, *args, **kw):
+        for (k, v) in dict(*args, **kw).iteritems():
+            self[k] = v
+
+    def invalidate(self):
+        "Discard the cached XML text for the element."
+        self._xml = None
 
     def from_mapping(self, d):
         "Translate between a mapping to an OSM element."
-        setter = super(OSMElement, self).__setitem__
+        self._xml = None
+        fields = self.fields
+        encoders = self.encoders
         for k in d:
-            if k == C.ID:
-                assert self.id == str(d[k])
-                continue
-            if k == C.REFERENCES:
-                v = set(d[k])
+            v = d[k]
+            if k not in fields:
+                self[k] = v
+            elif k == C.ID:
+                assert self.id == str(v)
+            elif k == C.REFERENCES:
+                if v:
+                    self.references = tuple(v)
+            elif k == C.TAGS:
+                if v:
+                    self.tags = _encode_tags(v)
+            elif k in encoders:
+                setattr(self, k, encoders[k](v))
             else:
-                v = d[k]
-            setter(k, v)
+                setattr(self, k, v)
 
     def as_mapping(self):
         "Translate to a Python mapping."
         d = {}
         for (k,v) in self.items():
-            if isinstance(v, set): # Convert sets to lists.
+            if isinstance(v, (set, tuple)): # Convert to lists.
                 v = [r for r in v]
             d[k] = v
         return d
@@ -160,14 +443,38 @@ class OSMElement(dict):
         "Return an XML representation of an element."
         raise TypeError, "Abstract method was invoked."
 
+    def xml_fragment(self):
+        """Return the UTF-8 encoded XML text for the element.
+
+        The text is that of the element in a pretty-printed <osm>
+        response, including indentation and the trailing newline."""
+        xml = self._xml
+        if xml is None:
+            osm = ET.Element(C.OSM)
+            self.build_response(osm)
+            xml = ET.tostring(osm, encoding=C.UTF8, pretty_print=True,
+                              xml_declaration=False)
+            # Drop the start and end tags of the <osm> element.
+            xml = xml[xml.index("\n") + 1:-len("</%s>\n" % C.OSM)]
+            if _xml_fragment_cache:
+                self._xml = xml
+        return xml
+
     def add_attributes(self, element, ignoredkeys=[]):
         "Translate from dictionary keys to XML attributes."
-        for (k, v) in self.items():
-            if k in ignoredkeys:
+        attrib = element.attrib
+        decoders = self.decoders
+        for k in self.attributes:
+            v = getattr(self, k)
+            if v is None:
                 continue
-            if k in OSMElement.ignoredkeys:
-                continue
-            element.attrib[k] = str(v)
+            if k in decoders:
+                v = decoders[k](v)
+            attrib[k] = str(v)
+        if self._extra:
+            for (k, v) in self._extra.items():
+                if k not in ignoredkeys:
+                    attrib[k] = str(v)
 
     def add_tags(self, element):
         "Add <tag> children to an XML element."
@@ -177,6 +484,10 @@ class OSMElement(dict):
             t.attrib[C.V] = v
 
 class OSMChangeSet(OSMElement):
+
+    __slots__ = ()
+    namespace = C.CHANGESET
+
     def __init__(self, elemid):
         super(OSMChangeSet, self).__init__(C.CHANGESET, elemid)
 
@@ -190,13 +501,24 @@ class OSMChangeSet(OSMElement):
         return osm
 
 class OSMDatastoreConfig(OSMElement):
+
+    __slots__ = ()
+    namespace = C.DATASTORE_CONFIG
+
     def __init__(self, elemid):
         OSMElement.__init__(self, C.DATASTORE_CONFIG, elemid)
 
 class OSMGeoDoc(OSMElement):
     """A geodoc references nodes which fall into a given geographic area."""
+
+    __slots__ = ('nodes', 'bbox', '_nodearrays')
+    namespace = C.GEODOC
+    fields = OSMElement.fields + (C.NODES, C.BBOX)
+    fieldset = frozenset(fields)
+
     def __init__(self, region):
         super(OSMGeoDoc, self).__init__(C.GEODOC, region)
+        self._nodearrays = None
         # Fill in default values for 'standard' fields.
         self.__setitem__(C.NODES, set())
         self.__setitem__(C.BBOX, geohash.bbox(region))
@@ -208,8 +530,81 @@ class OSMGeoDoc(OSMElement):
         "Return node ids and (lat, lon) coordinates in this document."
         return self[C.NODES]
 
+    def _node_arrays(self):
+        """Return the ids, (lat, lon) locations, latitudes and
+        longitudes of the nodes in this document, in order of
+        latitude.
+
+        The arrays are NumPy arrays if NumPy is available, and lists
+        otherwise.  They are built once for each list of nodes, and
+        are kept along with the geodoc in the element cache."""
+        nodes = self.nodes
+        if self._nodearrays is not None and self._nodearrays[0] is nodes:
+            return self._nodearrays[1:]
+
+        # Geodocs are written in order of latitude, but older data
+        # stores may hold unordered geodocs.
+        if numpy is None:
+            ordered = sorted(nodes, key=itemgetter(1))
+            arrays = ([n[0] for n in ordered],
+                      [(n[1], n[2]) for n in ordered],
+                      [n[1] for n in ordered], [n[2] for n in ordered])
+        else:
+            ordered = list(nodes)
+            count = len(ordered)
+            lats = numpy.fromiter([n[1] for n in ordered], numpy.int64, count)
+            lons = numpy.fromiter([n[2] for n in ordered], numpy.int64, count)
+            if (lats[1:] < lats[:-1]).any():
+                order = lats.argsort(kind='mergesort')
+                ordered = [ordered[i] for i in order.tolist()]
+                lats, lons = lats[order], lons[order]
+            ids = numpy.empty(count, dtype=object)
+            locations = numpy.empty(count, dtype=object)
+            # Assigning a list of tuples to an object array is slow,
+            # as NumPy looks for nested sequences.
+            for (i, n) in enumerate(ordered):
+                ids[i] = n[0]
+                locations[i] = (n[1], n[2])
+            arrays = (ids, locations, lats, lons)
+        self._nodearrays = (nodes,) + arrays
+        return arrays
+
+    def get_nodes(self):
+        "Return the nodes in this document as (id, (lat, lon)) pairs."
+        ids, locations, lats, lons = self._node_arrays()
+        if numpy is not None:
+            ids, locations = ids.tolist(), locations.tolist()
+        return izip(ids, locations)
+
+    def get_nodes_in_bbox(self, w, s, e, n):
+        """Return the nodes lying in a bounding box.
+
+        The bounding box is given by encoded coordinates, and holds
+        nodes with w <= lon < e and s <= lat < n.  The nodes are
+        returned as an iterable of (id, (lat, lon)) pairs.  Only the
+        nodes within the latitudes of the box are examined.
+        """
+        ids, locations, lats, lons = self._node_arrays()
+        if numpy is None:
+            return [(ids[i], locations[i]) for i in
+                    xrange(bisect_left(lats, s), bisect_left(lats, n))
+                    if w <= lons[i] < e]
+
+        first, last = lats.searchsorted((s, n))
+        ids, locations, lons = ids[first:last], locations[first:last], \
+            lons[first:last]
+        inside = (lons >= w) & (lons < e)
+        if not inside.all():
+            ids, locations = ids[inside], locations[inside]
+        return izip(ids.tolist(), locations.tolist())
+
 class OSMNode(OSMElement):
 
+    __slots__ = ('lat', 'lon')
+    namespace = C.NODE
+    fields = OSMElement.fields + (C.LAT, C.LON)
+    fieldset = frozenset(fields)
+
     special_attributes = [C.LAT, C.LON]
 
     def __init__(self, elemid):
@@ -230,9 +625,17 @@ class OSMNode(OSMElement):
         return osm
 
 class OSMWay(OSMElement):
+
+    __slots__ = ('nodes',)
+    namespace = C.WAY
+    fields = OSMElement.fields + (C.NODES,)
+    fieldset = frozenset(fields)
+    encoders = dict(OSMElement.encoders)
+    encoders[C.NODES] = tuple
+
     def __init__(self, elemid):
         super(OSMWay, self).__init__(C.WAY, elemid)
-        super(OSMWay, self).__setitem__(C.NODES, set())
+        self.nodes = ()
 
     def build_response(self, osm):
         "Incorporate an XML representation for a <way>."
@@ -252,12 +655,20 @@ class OSMWay(OSMElement):
 
     def get_node_ids(self):
         "Return ids for the nodes associated with a way."
-        return [str(n) for n in self[C.NODES]]
+        return [str(n) for n in self.nodes]
 
 class OSMRelation(OSMElement):
+
+    __slots__ = ('members',)
+    namespace = C.RELATION
+    fields = OSMElement.fields + (C.MEMBERS,)
+    fieldset = frozenset(fields)
+    encoders = dict(OSMElement.encoders)
+    encoders[C.MEMBERS] = _encode_members
+
     def __init__(self, elemid):
         super(OSMRelation, self).__init__(C.RELATION, elemid)
-        super(OSMRelation, self).__setitem__(C.MEMBERS, [])
+        self.members = ()
 
     def build_response(self, osm):
         "Incorporate an XML representation for a <relation>."
@@ -279,7 +690,7 @@ class OSMRelation(OSMElement):
     def get_member_ids(self, namespace):
         "Return a set of members in the specified namespace."
 
-        return set([str(mid) for (mid, mrole, mtype) in self[C.MEMBERS]])
+        return set([str(mid) for (mid, mrole, mtype) in self.members])
 
 
 #
@@ -317,25 +728,3 @@ def decode_json(jsonvalue):
 def encode_json(obj):
     "Returns the JSON representation for a Python object."
     return cjson.encode(obj)
-
-#
-# Protobuf handling.
-#
-
-try:
-    import protobuf
-
-    def _notimplemented(_):
-        raise NotImplementedError, "Protobuf support has not been written"
-        
-    decode_protobuf = _notimplemented
-    encode_protobuf = _notimplemented
-
-except ImportError:
-
-    def _noprotobufs(pbuf):
-        "Returns an OSM element given its Protobuf representation."
-        raise NotImplementedError, "Protobuf libraries are not present"
-
-    decode_protobuf = _noprotobufs
-    encode_protobuf = _noprotobufs
@@ -0,0 +1,353 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""The 'protobuf' encoding for OSM elements and slabs.
+
+Elements and slabs are written using the messages defined in
+'osm.proto'.  A single element is written as a 'Slab' message holding
+one element; slabs of elements written by the datastore are prefixed
+by SLAB_MAGIC, so that they can be told apart from slabs in other
+encodings.
+
+Exported functions:
+
+    decode_protobuf -- return a mapping given its protobuf encoding.
+    encode_protobuf -- return the protobuf encoding for a mapping.
+    encode_protobuf_slab -- return the protobuf encoding for a slab.
+
+Exported classes:
+
+    ProtobufSlab -- access the elements of a protobuf encoded slab.
+
+If the protobuf libraries are not present, these raise
+NotImplementedError.
+
+Protobuf slabs are three to four times smaller than JSON ones.  A slab
+is parsed in one call, but the mapping for each element is then built
+in Python, at about four times the cost of 'cjson'.  Reading a slab of
+nodes is about as fast as with JSON; slabs of ways and relations take
+up to twice as long (see 'benchmarks/bench_encoding.py').
+"""
+
+import apiserver.const as C
+
+from apiserver.osmbinary import _is_count, _is_decimal, _is_text, _text, \
+    _utf8
+from apiserver.osmelement import _encode_timestamp
+
+try:
+    from apiserver import osm_pb2
+except ImportError:
+    osm_pb2 = None
+
+SLAB_MAGIC = "\xb6\x01"
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_UINT32_MAX = (1 << 32) - 1
+_UINT64_MAX = (1 << 64) - 1
+
+def _is_int64(v):
+    return (type(v) is int or type(v) is long) and \
+        _INT64_MIN <= v <= _INT64_MAX
+
+def _deltas(values):
+    "Return the differences between successive values."
+    previous = 0
+    deltas = []
+    for v in values:
+        deltas.append(v - previous)
+        previous = v
+    return deltas
+
+def _sums(deltas):
+    "Return the running sums of a list of differences."
+    total = 0
+    values = []
+    for d in deltas:
+        total += d
+        values.append(int(total))
+    return values
+
+class _StringTable(object):
+    "Add strings to the string table of a 'Slab' message."
+
+    def __init__(self, table):
+        self.table = table
+        self.index = {}
+
+    def __call__(self, s):
+        "Return the index for string 's'."
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.table)
+            self.table.append(_utf8(s))
+        return i
+
+#
+# Encoding.
+#
+
+def _fill_value(pv, v, strings):
+    "Fill in a 'Value' message."
+    t = type(v)
+    if v is None:
+        pv.none = True
+    elif t is bool:
+        pv.boolean = v
+    elif _is_int64(v):
+        pv.integer = v
+    elif t is float:
+        pv.real = v
+    elif _is_text(v):
+        pv.text = strings(v)
+    elif isinstance(v, (list, tuple, set, frozenset)):
+        pv.list.SetInParent()
+        items = pv.list.items
+        for item in v:
+            _fill_value(items.add(), item, strings)
+    elif isinstance(v, dict):
+        pv.map.SetInParent()
+        items = pv.map.items
+        for (k, item) in v.iteritems():
+            if not _is_text(k):
+                raise TypeError, "Cannot encode key %r" % k
+            attribute = items.add()
+            attribute.key = strings(k)
+            _fill_value(attribute.value, item, strings)
+    else:
+        raise TypeError, "Cannot encode values of type %s" % t
+
+def _is_geonode(n):
+    "Return True for (id, lat, lon) entries in a geodoc."
+    return isinstance(n, (list, tuple)) and len(n) == 3 and \
+        type(n[0]) is str and _is_decimal(n[0]) and \
+        _is_int64(n[1]) and _is_int64(n[2])
+
+def _fill_element(e, m, strings):
+    "Fill in an 'Element' message from the mapping for an element."
+    others = []
+    for (k, v) in m.iteritems():
+        if k == C.ID and type(v) is str and _is_decimal(v) and \
+                int(v) <= _UINT64_MAX:
+            e.id = int(v)
+        elif k == C.ID and _is_text(v):
+            e.key = strings(v)
+        elif k == C.VERSION and _is_count(v) and v <= _UINT32_MAX:
+            e.version = v
+        elif k == C.CHANGESET and _is_count(v) and v <= _UINT64_MAX:
+            e.changeset = v
+        elif k == C.TIMESTAMP and _is_text(v) and \
+                type(_encode_timestamp(v)) is int:
+            e.timestamp = _encode_timestamp(v)
+        elif k == C.USER and _is_text(v):
+            e.user = strings(v)
+        elif k == C.UID and _is_count(v) and v <= _UINT64_MAX:
+            e.uid = v
+        elif k == C.VISIBLE and type(v) is bool:
+            e.visible = v
+        elif k == C.LAT and _is_int64(v):
+            e.lat = v
+        elif k == C.LON and _is_int64(v):
+            e.lon = v
+        elif k == C.TAGS and isinstance(v, dict) and \
+                all([_is_text(tk) and _is_text(tv)
+                     for (tk, tv) in v.iteritems()]):
+            for (tk, tv) in v.iteritems():
+                e.keys.append(strings(tk))
+                e.vals.append(strings(tv))
+        elif k == C.NODES and isinstance(v, (list, tuple)) and v and \
+                all([_is_int64(n) for n in v]):
+            e.nodes.extend(_deltas(v))
+        elif k == C.NODES and isinstance(v, (list, tuple)) and v and \
+                all([_is_geonode(n) for n in v]):
+            e.geo_ids.extend(_deltas([int(n[0]) for n in v]))
+            e.geo_lats.extend(_deltas([n[1] for n in v]))
+            e.geo_lons.extend(_deltas([n[2] for n in v]))
+        elif k == C.MEMBERS and isinstance(v, (list, tuple)) and \
+                all([len(mb) == 3 and type(mb[0]) is str and
+                     _is_decimal(mb[0]) and _is_text(mb[1]) and
+                     _is_text(mb[2]) for mb in v]):
+            e.member_refs.extend(_deltas([int(mb[0]) for mb in v]))
+            e.member_roles.extend([strings(mb[1]) for mb in v])
+            e.member_types.extend([strings(mb[2]) for mb in v])
+        elif k == C.REFERENCES and isinstance(v, (list, tuple)) and \
+                all([_is_text(r) for r in v]):
+            e.references.extend([strings(r) for r in v])
+        else:
+            others.append((k, v))
+
+    for (k, v) in others:
+        attribute = e.attributes.add()
+        attribute.key = strings(k)
+        _fill_value(attribute.value, v, strings)
+
+def encode_protobuf(obj):
+    "Returns the protobuf representation for the mapping of an element."
+    if not isinstance(obj, dict):
+        raise TypeError, "Only mappings can be encoded, not %s" % type(obj)
+    slab = osm_pb2.Slab()
+    _fill_element(slab.elements.add(), obj, _StringTable(slab.strings))
+    return slab.SerializeToString()
+
+def encode_protobuf_slab(mappings, indirect=()):
+    """Return the protobuf representation of a slab.
+
+    mappings -- the mapping representations of the elements present
+                in the slab.  Element ids should be decimal numbers.
+    indirect -- the ids of the slab's elements that are stored
+                outside the slab.
+    """
+    slab = osm_pb2.Slab()
+    strings = _StringTable(slab.strings)
+    for m in mappings:
+        elemid = m[C.ID]
+        if type(elemid) is not str or not _is_decimal(elemid):
+            raise ValueError, "Element id '%s' is not a number" % elemid
+        slab.ids.append(int(elemid))
+        _fill_element(slab.elements.add(), m, strings)
+    slab.indirect.extend([int(elemid) for elemid in indirect])
+    return SLAB_MAGIC + slab.SerializeToString()
+
+#
+# Decoding.
+#
+
+def _strings(table):
+    "Return the strings of a string table, as the JSON decoder would."
+    strings = list(table)
+    try:
+        "".join(strings).decode('ascii')
+    except UnicodeDecodeError:
+        strings = map(_text, strings)
+    return strings
+
+def _value(pv, strings):
+    "Return the Python value for a 'Value' message."
+    kind = pv.WhichOneof('kind')
+    if kind == 'text':
+        return strings[pv.text]
+    elif kind == 'integer':
+        return int(pv.integer)
+    elif kind == 'list':
+        return [_value(item, strings) for item in pv.list.items]
+    elif kind == 'map':
+        return dict([(strings[a.key], _value(a.value, strings))
+                     for a in pv.map.items])
+    elif kind == 'boolean':
+        return pv.boolean
+    elif kind == 'real':
+        return pv.real
+    elif kind == 'none':
+        return None
+    raise ValueError, "Empty value."
+
+def _mapping(e, strings):
+    """Return the mapping for an 'Element' message.
+
+    Timestamps are returned as seconds since the epoch, which is how
+    elements hold them."""
+    has = e.HasField
+    m = {}
+    if has('id'):
+        m[C.ID] = str(e.id)
+    elif has('key'):
+        m[C.ID] = strings[e.key]
+    if has('version'):
+        m[C.VERSION] = int(e.version)
+    if has('changeset'):
+        m[C.CHANGESET] = int(e.changeset)
+    if has('timestamp'):
+        m[C.TIMESTAMP] = int(e.timestamp)
+    if has('user'):
+        m[C.USER] = strings[e.user]
+    if has('uid'):
+        m[C.UID] = int(e.uid)
+    if has('visible'):
+        m[C.VISIBLE] = e.visible
+    keys = e.keys
+    if keys:
+        m[C.TAGS] = dict(zip([strings[k] for k in keys],
+                             [strings[v] for v in e.vals]))
+    if has('lat'):
+        m[C.LAT] = int(e.lat)
+    if has('lon'):
+        m[C.LON] = int(e.lon)
+    nodes = e.nodes
+    if nodes:
+        m[C.NODES] = _sums(nodes)
+    refs = e.member_refs
+    if refs:
+        m[C.MEMBERS] = zip(map(str, _sums(refs)),
+                           [strings[r] for r in e.member_roles],
+                           [strings[t] for t in e.member_types])
+    references = e.references
+    if references:
+        m[C.REFERENCES] = [strings[r] for r in references]
+    geo_ids = e.geo_ids
+    if geo_ids:
+        m[C.NODES] = zip(map(str, _sums(geo_ids)), _sums(e.geo_lats),
+                         _sums(e.geo_lons))
+    for a in e.attributes:
+        m[strings[a.key]] = _value(a.value, strings)
+    return m
+
+def decode_protobuf(bits):
+    """Returns the mapping for an element, given its protobuf representation.
+
+    Timestamps are returned as seconds since the epoch."""
+    slab = osm_pb2.Slab.FromString(bits)
+    return _mapping(slab.elements[0], _strings(slab.strings))
+
+class ProtobufSlab(object):
+    """Access the elements in a protobuf encoded slab.
+
+    The slab's index is decoded when the object is created; elements
+    are decoded by 'mapping()'.
+    """
+
+    __slots__ = ('ids', 'indirect', '_elements', '_strings')
+
+    def __init__(self, bits):
+        if not bits.startswith(SLAB_MAGIC):
+            raise ValueError, "Not a protobuf slab."
+        slab = osm_pb2.Slab.FromString(buffer(bits, len(SLAB_MAGIC)))
+        self.ids = map(str, slab.ids)
+        self.indirect = map(str, slab.indirect)
+        self._elements = slab.elements
+        self._strings = _strings(slab.strings)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mapping(self, slot):
+        "Return the mapping representation of the element at 'slot'."
+        return _mapping(self._elements[slot], self._strings)
+
+if osm_pb2 is None:
+    def _noprotobufs(*args):
+        "Report that protobuf support is not available."
+        raise NotImplementedError, "Protobuf libraries are not present"
+
+    decode_protobuf = encode_protobuf = encode_protobuf_slab = \
+        ProtobufSlab = _noprotobufs
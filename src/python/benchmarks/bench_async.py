@@ -0,0 +1,104 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Measure how many data store reads a front end keeps in flight.
+
+A fake memcached server (see 'benchmarks.fakememcached') holding node
+slabs is started locally, with a configurable delay added to each
+request.  A number of single-node lookups, each missing the cache,
+are then served: once using the blocking 'fetch()' (as the front end
+did, one request at a time on its IOLoop), and once using
+'afetch()' from a given number of concurrent clients on one IOLoop.
+
+The fake server runs in the same process, with a thread per
+connection; on machines with few CPUs it, rather than the front end,
+limits throughput at high concurrency.
+"""
+
+import time
+
+from optparse import OptionParser
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+
+from benchmarks import timed
+from benchmarks.bench_multiget import make_config, populate
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_membase import DatastoreMembase
+
+def run_blocking(config, keys):
+    "Look up keys one at a time."
+    ds = DatastoreMembase(config)
+    for k in keys:
+        assert ds.fetch(C.NODE, k) is not None
+
+def run_async(config, keys, nclients):
+    "Look up keys from 'nclients' concurrent coroutines."
+    ds = DatastoreMembase(config)
+    keys = list(keys)
+
+    @gen.coroutine
+    def _client():
+        while keys:
+            elem = yield ds.afetch(C.NODE, keys.pop())
+            assert elem is not None
+
+    @gen.coroutine
+    def _run():
+        yield [_client() for _ in xrange(nclients)]
+
+    IOLoop.current().run_sync(_run)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-c", "--concurrency", dest="concurrency", type="int",
+                      default=16, help="Maximum concurrent clients [%default]")
+    parser.add_option("-d", "--delay", dest="delay", type="float",
+                      default=2000, help="Microseconds per request [%default]")
+    parser.add_option("-r", "--requests", dest="requests", type="int",
+                      default=512, help="Lookups per run [%default]")
+    options, args = parser.parse_args()
+
+    perslab = 4
+    server = FakeMemcached()
+    config = make_config(server.start(), perslab)
+    populate(config, options.requests, perslab)
+    server.delay = options.delay / 1e6
+
+    # One lookup per slab, so that every lookup misses the cache.
+    keys = [str(s) for s in xrange(0, options.requests * perslab, perslab)]
+
+    blocking, _ = timed(run_blocking, config, keys)
+    print "%8s %10s %10s" % ("clients", "seconds", "lookups/s")
+    print "%8s %10.3f %10.1f" % ("blocking", blocking, len(keys) / blocking)
+    n = 1
+    while n <= options.concurrency:
+        elapsed, _ = timed(run_async, config, keys, n)
+        print "%8d %10.3f %10.1f" % (n, elapsed, len(keys) / elapsed)
+        n *= 4
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compare ways of selecting the nodes of geodocs that lie in a bbox.
+
+A /map request for a square bounding box in a dense city is
+simulated: the geodocs covering the box hold a given number of nodes
+each, spread uniformly over their cells.  The table shows the time
+taken to select the nodes inside the box:
+
+- 'loop': looping over the (id, lat, lon) tuples of each geodoc, as
+  the /map handler used to do;
+- 'python': the /map handler's selection without NumPy;
+- 'numpy-cold': the /map handler's selection with NumPy, for freshly
+  read geodocs whose node arrays are yet to be built;
+- 'numpy': the same, with the node arrays of the geodocs already
+  built, as for geodocs in the element cache.
+
+The /map handler takes all the nodes of geodocs inside the box, and
+only examines the nodes of boundary geodocs within the latitudes of
+the box.
+"""
+
+import random
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser
+
+import geohash
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from benchmarks import timed
+from datastore.ds_geohash import geohash_cover, init_geohash
+from frontend.maphandler import _filter_in_bbox
+
+def loop_filter(bbox, geodocs):
+    "Select nodes by looping over the node tuples of each geodoc."
+    w, s, e, n = map(O.encode_coordinate, bbox)
+    nodelocs = {}
+    for gd in geodocs:
+        for (nid, lat, lon) in gd.get_node_info():
+            if w <= lon < e and s <= lat < n:
+                nodelocs[nid] = (lat, lon)
+    return nodelocs
+
+def make_geodocs(bbox, precision, nodespercell, rng):
+    "Return geodocs covering 'bbox', as (key, node list) pairs."
+    geodocs = []
+    nodeid = 0
+    for key in sorted(geohash_cover(bbox, precision)):
+        cell = geohash.bbox(key)
+        nodes = []
+        for _ in xrange(nodespercell):
+            nodes.append([str(nodeid),
+                          O.encode_coordinate(rng.uniform(cell['s'],
+                                                          cell['n'])),
+                          O.encode_coordinate(rng.uniform(cell['w'],
+                                                          cell['e']))])
+            nodeid += 1
+        nodes.sort(key=lambda n: (n[1], n[2]))
+        geodocs.append((key, nodes))
+    return geodocs
+
+def vivify(geodocs):
+    "Return fresh geodoc elements, as read from the data store."
+    elements = []
+    for (key, nodes) in geodocs:
+        gd = O.new_osm_element(C.GEODOC, key)
+        gd[C.NODES] = nodes
+        elements.append(gd)
+    return elements
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bbox-size", dest="size", type="float",
+                      default=0.1, help="Side of the bounding box in "
+                      "degrees [%default]")
+    parser.add_option("-n", "--nodes", dest="nodes", type="int",
+                      default=5000, help="Nodes per geodoc [%default]")
+    parser.add_option("-p", "--precision", dest="precision", type="int",
+                      default=5, help="Length of geodoc keys [%default]")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=5, help="Runs of each method [%default]")
+    options, args = parser.parse_args()
+
+    config = ConfigParser()
+    config.add_section(C.DATASTORE)
+    config.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    config.add_section(C.FRONT_END)
+    config.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    config.set(C.FRONT_END, C.SERVER_NAME, 'Benchmark')
+    O.init_osm_factory(config)
+    init_geohash(options.precision, 10000000)
+
+    bbox = (13.37, 52.5, 13.37 + options.size, 52.5 + options.size)
+    geodocs = make_geodocs(bbox, options.precision, options.nodes,
+                           random.Random(0))
+    cached = vivify(geodocs)
+    plain = vivify(geodocs)
+    expected = loop_filter(bbox, cached)
+
+    print "%d geodocs, %d nodes, %d nodes in the bounding box" % \
+        (len(geodocs), len(geodocs) * options.nodes, len(expected))
+    print "%-12s %10s" % ("method", "ms")
+
+    numpy = O.numpy
+    methods = [
+        ("loop", lambda: loop_filter(bbox, cached)),
+        ("python", lambda: _filter_in_bbox(bbox, plain)),
+        ("numpy-cold", lambda: _filter_in_bbox(bbox, vivify(geodocs))),
+        ("numpy", lambda: _filter_in_bbox(bbox, cached))]
+    for (name, fn) in methods:
+        if name.startswith("numpy") and numpy is None:
+            print "%-12s %10s" % (name, "-")
+            continue
+        O.numpy = None if name == "python" else numpy
+        best = None
+        for _ in xrange(options.repeat):
+            elapsed, found = timed(fn)
+            assert found == expected
+            best = elapsed if best is None else min(best, elapsed)
+        print "%-12s %10.2f" % (name, 1000 * best)
+    O.numpy = numpy
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compare slab cache replacement policies by replaying access traces.
+
+Traces contain one slab key per line, as recorded by the front end's
+'--slab_trace' option.  Without trace files, a synthetic trace is
+used: skewed accesses to a set of 'hot' slabs, interrupted by large
+'/map' requests that scan over slabs that are used only once.
+
+    % python -m benchmarks.bench_cachepolicy [TRACEFILE]...
+"""
+
+import random
+
+from optparse import OptionParser
+
+import apiserver.const as C
+from datastore.lrucache import _POLICIES
+
+def synthetic_trace(length, nhot, scanlength, scanevery, rng):
+    """Return a list of slab keys.
+
+    A scan of 'scanlength' slabs is inserted after every 'scanevery'
+    accesses to the hot set of 'nhot' slabs."""
+    trace = []
+    scanned = 0
+    while len(trace) < length:
+        for i in xrange(scanevery):
+            # Skewed (roughly Zipf-like) accesses to the hot set.
+            trace.append("NL%d" % int(nhot * rng.random() ** 3))
+        for i in xrange(scanlength):
+            trace.append("NL%d" % (10**9 + scanned))
+            scanned += 1
+    return trace[:length]
+
+def replay(policy, size, trace):
+    "Return the hit ratio of a cache of 'size' slabs over 'trace'."
+    buf = _POLICIES[policy](size)
+    hits = 0
+    for k in trace:
+        if k in buf:
+            buf[k]
+            hits += 1
+        else:
+            buf[k] = True
+    return float(hits) / len(trace)
+
+def main():
+    parser = OptionParser(usage="%prog [options] [TRACEFILE]...")
+    parser.add_option("-l", "--length", dest="length", type="int",
+                      default=200000,
+                      help="Synthetic trace length [%default]")
+    parser.add_option("-s", "--sizes", dest="sizes", default="256,1024,4096",
+                      help="Cache sizes, in slabs [%default]")
+    options, args = parser.parse_args()
+
+    if args:
+        trace = []
+        for fn in args:
+            with open(fn) as f:
+                trace.extend(line.strip() for line in f if line.strip())
+    else:
+        trace = synthetic_trace(options.length, nhot=4096, scanlength=2000,
+                                scanevery=5000, rng=random.Random(42))
+
+    policies = sorted(_POLICIES.keys())
+    print "%d accesses, %d distinct slabs" % (len(trace), len(set(trace)))
+    print "%8s" % "size" + "".join(["%10s" % p for p in policies])
+    for size in map(int, options.sizes.split(",")):
+        print "%8d" % size + "".join(["%10.3f" % replay(p, size, trace)
+                                      for p in policies])
+
+if __name__ == '__main__':
+    main()
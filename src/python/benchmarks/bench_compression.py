@@ -0,0 +1,90 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compare the wire size of slabs with their compression costs.
+
+Slabs of elements are encoded as in 'benchmarks.bench_encoding', and
+each slab is then compressed using each of the codecs available.  The
+table shows, per slab, the bytes sent over the wire, the time taken to
+compress and to decompress the slab, and the time the slab's bytes
+take to cross a network link of the given bandwidth.  Compression pays
+off when the decompression time is smaller than the network time
+saved.
+"""
+
+from optparse import OptionParser
+
+import apiserver.const as C
+
+from benchmarks import timed
+from benchmarks.bench_elements import init
+from benchmarks.bench_encoding import ENCODINGS, make_elements, \
+    make_slabs, read_extract
+from datastore.compression import compress, compression_available, \
+    decompress
+
+CODECS = [C.NONE, C.ZLIB, C.LZ4, C.SNAPPY]
+
+def measure(codec, wire):
+    "Return (bytes, compress-seconds, decompress-seconds) for 'wire'."
+    tcompress, cwire = timed(lambda: [compress(codec, w) for w in wire])
+    tdecompress, _ = timed(lambda: [decompress(w) for w in cwire])
+    assert [decompress(w) for w in cwire] == wire
+    return (sum(len(w) for w in cwire), tcompress, tdecompress)
+
+def main():
+    parser = OptionParser(usage="%prog [options] [extract.osm[.gz|.bz2]]")
+    parser.add_option("-b", "--bandwidth", dest="bandwidth", type="float",
+                      default=1000.0,
+                      help="Network bandwidth in Mbit/s [%default]")
+    parser.add_option("-n", "--elements", dest="elements", type="int",
+                      default=20000,
+                      help="Made up elements of each kind [%default]")
+    options, args = parser.parse_args()
+
+    init()
+    if args:
+        elements = read_extract(args[0])
+    else:
+        elements = make_elements(options.elements)
+
+    codecs = [c for c in CODECS if compression_available(c)]
+    print "%10s %10s %8s %10s %10s %10s %10s" % (
+        "element", "encoding", "codec", "bytes", "comp-ms", "decomp-ms",
+        "net-ms")
+    for ns in [C.NODE, C.WAY, C.RELATION]:
+        mappings = elements.get(ns)
+        if not mappings:
+            continue
+        slabs = make_slabs(ns, mappings)
+        for (name, encoder, _) in ENCODINGS:
+            wire = [encoder(s) for s in slabs]
+            for codec in codecs:
+                size, tcompress, tdecompress = measure(codec, wire)
+                size = float(size) / len(slabs)
+                print "%10s %10s %8s %10.0f %10.4f %10.4f %10.4f" % (
+                    ns, name, codec, size, 1e3 * tcompress / len(slabs),
+                    1e3 * tdecompress / len(slabs),
+                    1e3 * size * 8 / (options.bandwidth * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Measure the memory used by OSM elements.
+
+Elements are decoded from the JSON representation that the datastore
+holds for typical nodes, ways and relations, in the way that the front
+end does when it loads slabs.  Each run happens in a child process, and
+reports the growth in the child's peak memory use per element, along
+with the size estimated by 'slabutil_footprint()'.
+"""
+
+import os
+import random
+import resource
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from datastore.slabutil import init_slabutil, slabutil_footprint
+
+def init():
+    "Initialize modules."
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, '1024')
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, '256')
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Benchmark')
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+
+def _common(rng, i):
+    "Return attributes shared by all kinds of elements."
+    return {
+        C.ID: str(i),
+        C.VERSION: rng.randint(1, 5),
+        C.CHANGESET: str(rng.randint(1, 10000000)),
+        C.TIMESTAMP: '2011-%02d-%02dT%02d:%02d:%02dZ' % (
+            rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+            rng.randint(0, 59), rng.randint(0, 59)),
+        C.UID: rng.randint(1, 1000),
+        C.USER: 'user%d' % rng.randint(1, 1000),
+        C.VISIBLE: True
+        }
+
+def make_mappings(namespace, count):
+    "Return JSON encodings of 'count' elements in 'namespace'."
+    rng = random.Random(42)
+    mappings = []
+    for i in xrange(count):
+        d = _common(rng, i)
+        if namespace == C.NODE:
+            d[C.LAT] = rng.randint(-900000000, 900000000)
+            d[C.LON] = rng.randint(-1800000000, 1800000000)
+            d[C.REFERENCES] = ['W%d' % rng.randint(1, 1000000)] \
+                if i % 2 else []
+            d[C.TAGS] = {'amenity': 'cafe', 'name': 'Cafe %d' % i} \
+                if i % 10 == 0 else {}
+        elif namespace == C.WAY:
+            d[C.NODES] = [rng.randint(1, 10000000) for _ in xrange(10)]
+            d[C.REFERENCES] = []
+            d[C.TAGS] = {'highway': 'residential', 'name': 'Street %d' % i}
+        else:
+            d[C.MEMBERS] = [[str(rng.randint(1, 1000000)), 'outer', C.WAY]
+                            for _ in xrange(5)]
+            d[C.REFERENCES] = []
+            d[C.TAGS] = {'type': 'multipolygon', 'landuse': 'forest'}
+        mappings.append(O.encode_json(d))
+    return mappings
+
+def run(namespace, count):
+    "Return (bytes of peak memory growth, estimated bytes) per element."
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        init()
+        mappings = make_mappings(namespace, count)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        elements = []
+        for m in mappings:
+            d = O.decode_json(m)
+            e = O.new_osm_element(namespace, d[C.ID])
+            e.from_mapping(d)
+            elements.append(e)
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        estimate = sum(slabutil_footprint(e) for e in elements)
+        os.write(wfd, repr(((after - before) * 1024.0 / count,
+                            float(estimate) / count)))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 4096)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return eval(result)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--elements", dest="elements", type="int",
+                      default=200000, help="Elements per run [%default]")
+    options, args = parser.parse_args()
+
+    print "%10s %12s %12s" % ("element", "rss-bytes", "est-bytes")
+    for ns in [C.NODE, C.WAY, C.RELATION]:
+        rss, estimate = run(ns, options.elements)
+        print "%10s %12.1f %12.1f" % (ns, rss, estimate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compare the size and decoding speed of slab encodings.
+
+Elements are grouped into slabs, and each slab is encoded as JSON (an
+index followed by the JSON text for each element), using the binary
+encoding in 'apiserver.osmbinary', and using the protobuf encoding in
+'apiserver.osmprotobuf'.  The elements are read from an OSM extract
+(such as one from download.geofabrik.de) when one is named on the
+command line, and are made up otherwise.
+
+Elements are first checked to survive a round trip through each
+encoding.  For each kind of element and encoding, the table then
+shows the bytes per element, and the time needed to create all the
+elements of a slab and one element of a slab, from the slab's wire
+representation.
+"""
+
+from optparse import OptionParser
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from apiserver.osmbinary import BinarySlab, encode_binary_slab
+from apiserver.osmprotobuf import ProtobufSlab, encode_protobuf_slab
+from benchmarks import timed
+from benchmarks.bench_elements import init, make_mappings
+from datastore.slabutil import slabutil_make_slabkey
+
+def read_extract(fn):
+    "Return a map from namespaces to element mappings in file 'fn'."
+    from dbmgr.dbm_input import makesource
+    from tests.test_osmelement import pytest_funcarg__config
+    config = pytest_funcarg__config(None)
+    mappings = {}
+    for elem in makesource(config, None, fn):
+        mappings.setdefault(elem.namespace, []).append(elem.as_mapping())
+    return mappings
+
+def make_elements(count):
+    "Return a map from namespaces to made up element mappings."
+    mappings = {}
+    for ns in [C.NODE, C.WAY, C.RELATION]:
+        elements = []
+        for bits in make_mappings(ns, count):
+            d = O.decode_json(bits)
+            e = O.new_osm_element(ns, d[C.ID])
+            e.from_mapping(d)
+            elements.append(e.as_mapping())
+        mappings[ns] = elements
+    return mappings
+
+def make_slabs(namespace, mappings):
+    "Group element mappings into slabs."
+    slabs = {}
+    for m in mappings:
+        slabs.setdefault(slabutil_make_slabkey(namespace, m[C.ID]),
+                         []).append(m)
+    return slabs.values()
+
+def encode_json_slab(mappings):
+    "Return the JSON wire representation of a slab."
+    bits = [O.encode_json(m) for m in mappings]
+    index = [(C.SLAB_INLINE, m[C.ID], len(b))
+             for (m, b) in zip(mappings, bits)]
+    return O.encode_json(index) + "\n" + "".join(bits)
+
+class JSONSlab(object):
+    "Access the elements of a JSON slab, as the datastore does."
+
+    def __init__(self, wirebits):
+        newline = wirebits.index("\n")
+        self.ids = []
+        self.extents = []
+        offset = newline + 1
+        for (st, key, length) in O.decode_json(wirebits[:newline]):
+            self.ids.append(key)
+            self.extents.append((offset, length))
+            offset += length
+        self.wirebits = wirebits
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mapping(self, slot):
+        offset, length = self.extents[slot]
+        return O.decode_json(self.wirebits[offset:offset + length])
+
+ENCODINGS = [
+    ("json", encode_json_slab, JSONSlab),
+    ("binary", encode_binary_slab, BinarySlab),
+    ("protobuf", encode_protobuf_slab, ProtobufSlab)
+    ]
+
+def vivify(namespace, reader, slot):
+    "Return the element at 'slot', using 'reader'."
+    kv = reader.mapping(slot)
+    e = O.new_osm_element(namespace, kv[C.ID])
+    e.from_mapping(kv)
+    return e
+
+def check(namespace, slabs, encoder, reader):
+    "Check that elements are unchanged by an encoding."
+    for s in slabs:
+        r = reader(encoder(s))
+        for (slot, m) in enumerate(s):
+            e = O.new_osm_element(namespace, m[C.ID])
+            e.from_mapping(m)
+            assert vivify(namespace, r, slot) == e, m
+
+def measure(namespace, slabs, encoder, reader):
+    "Return (bytes, all-seconds, one-seconds) totals for 'slabs'."
+    wire = [encoder(s) for s in slabs]
+    size = sum(len(w) for w in wire)
+    def _all():
+        for w in wire:
+            r = reader(w)
+            for slot in xrange(len(r)):
+                vivify(namespace, r, slot)
+    def _one():
+        for w in wire:
+            vivify(namespace, reader(w), 0)
+    tall, _ = timed(_all)
+    tone, _ = timed(_one)
+    return (size, tall, tone)
+
+def main():
+    parser = OptionParser(usage="%prog [options] [extract.osm[.gz|.bz2]]")
+    parser.add_option("-n", "--elements", dest="elements", type="int",
+                      default=20000,
+                      help="Made up elements of each kind [%default]")
+    options, args = parser.parse_args()
+
+    init()
+    if args:
+        elements = read_extract(args[0])
+    else:
+        elements = make_elements(options.elements)
+
+    print "%10s %10s %8s %10s %10s %10s" % ("element", "encoding", "count",
+                                            "bytes/el", "all-ms", "one-ms")
+    for ns in [C.NODE, C.WAY, C.RELATION]:
+        mappings = elements.get(ns)
+        if not mappings:
+            continue
+        slabs = make_slabs(ns, mappings)
+        for (name, encoder, reader) in ENCODINGS:
+            check(ns, slabs, encoder, reader)
+            size, tall, tone = measure(ns, slabs, encoder, reader)
+            print "%10s %10s %8d %10.1f %10.4f %10.4f" % (
+                ns, name, len(mappings), float(size) / len(mappings),
+                1e3 * tall / len(slabs), 1e3 * tone / len(slabs))
+
+if __name__ == '__main__':
+    main()
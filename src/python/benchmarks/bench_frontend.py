@@ -0,0 +1,205 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Measure front end throughput for /way/N/full and /map requests.
+
+A synthetic map, a square grid of nodes joined by ways and grouped
+into relations, is stored in a fake memcached server (see
+'benchmarks.fakememcached').  A front end is then run in this
+process, and a fixed number of requests for one URL are made to it
+by concurrent clients, once with the 'xml-fragment-cache' option
+disabled and once with it enabled.  Each run starts with a warm
+cache, so that the cost measured is that of building responses.
+
+The clients share the process, and the CPU, with the front end;
+the figures are useful for comparison only.
+"""
+
+import os
+import random
+import time
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser, Values
+
+import tornado.httpserver
+import tornado.netutil
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_geohash import init_geohash
+from datastore.ds_membase import DatastoreMembase
+from datastore.slabutil import init_slabutil
+from dbmgr.dbm_geotables import GeoGroupTable
+from frontend.fe import OSMFrontEndServer
+
+SPACING = 0.001                 # Degrees between grid nodes.
+ORIGIN = (10.0, 10.0)           # Latitude, longitude of node '0'.
+WAYLENGTH = 10                  # Nodes per way.
+RELATIONSIZE = 10               # Ways per relation.
+
+def make_config(port):
+    "Return the default configuration, using a local server."
+    cfg = ConfigParser()
+    cfg.read(os.path.join(os.path.dirname(__file__), '..', 'config',
+                          'osm-api-server.cfg'))
+    cfg.set(C.MEMBASE, C.DBHOST, '127.0.0.1')
+    cfg.set(C.MEMBASE, C.DBPORT, str(port))
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+    init_geohash(cfg.getint(C.DATASTORE, C.GEOHASH_LENGTH),
+                 cfg.getint(C.DATASTORE, C.SCALE_FACTOR))
+    return cfg
+
+def grid_bbox(side):
+    "Return a bounding box (w,s,e,n) covering 'side' x 'side' nodes."
+    lat, lon = ORIGIN
+    return (lon, lat, lon + side * SPACING, lat + side * SPACING)
+
+def populate(config, side, shuffle=False):
+    """Store a map of 'side' x 'side' nodes.
+
+    Each row of the grid is split into ways of WAYLENGTH nodes, and
+    consecutive ways are grouped into relations of RELATIONSIZE ways.
+    Nodes are numbered row by row, or in a random order if 'shuffle'
+    is set.  Return the number of ways stored."""
+    ds = DatastoreMembase(config, writeback=True)
+    ds.initialize()
+
+    nodeids = range(side * side)
+    if shuffle:
+        random.Random(0).shuffle(nodeids)
+
+    geotable = GeoGroupTable(config, Values({'nothreading': True}), ds)
+    wayid = 0
+    nodeid = 0
+    for row in xrange(side):
+        for col in xrange(0, side, WAYLENGTH):
+            w = O.new_osm_element(C.WAY, str(wayid))
+            w[C.TAGS] = {'highway': 'residential', 'name': 'Way %d' % wayid}
+            w[C.REFERENCES].add('R%d' % (wayid / RELATIONSIZE))
+            waynodes = []
+            for c in xrange(col, min(col + WAYLENGTH, side)):
+                nodeid = nodeids[row * side + c]
+                n = O.new_osm_element(C.NODE, str(nodeid))
+                n[C.LAT] = O.encode_coordinate(ORIGIN[0] + row * SPACING)
+                n[C.LON] = O.encode_coordinate(ORIGIN[1] + c * SPACING)
+                n[C.VERSION] = '1'
+                n['user'] = 'user%d' % (nodeid % 100)
+                if nodeid % 4 == 0:
+                    n[C.TAGS] = {'amenity': 'cafe',
+                                 'name': 'Node %d' % nodeid}
+                n[C.REFERENCES].add('W%d' % wayid)
+                waynodes.append(nodeid)
+                ds.store(n)
+                geotable.add(n)
+            w[C.NODES] = waynodes
+            ds.store(w, (O.encode_coordinate(ORIGIN[0] + row * SPACING),
+                         O.encode_coordinate(ORIGIN[1] + col * SPACING)))
+            wayid += 1
+
+    for relid in xrange(0, (wayid + RELATIONSIZE - 1) / RELATIONSIZE):
+        r = O.new_osm_element(C.RELATION, str(relid))
+        r[C.MEMBERS] = [(str(m), 'outer', C.WAY) for m in
+                        xrange(relid * RELATIONSIZE,
+                               min((relid + 1) * RELATIONSIZE, wayid))]
+        r[C.TAGS] = {'type': 'multipolygon'}
+        ds.store(r)
+
+    geotable.flush()
+    ds.finalize()
+    ds._get_connection().disconnect_all()
+    return wayid
+
+def run(config, url, nrequests, concurrency, fragments):
+    "Return the seconds taken for 'nrequests' requests for 'url'."
+    config.set(C.FRONT_END, C.XML_FRAGMENT_CACHE, str(fragments).lower())
+    O.init_osm_factory(config)
+
+    ds = DatastoreMembase(config)
+    app = OSMFrontEndServer(config, None, ds).application
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    url = 'http://127.0.0.1:%d%s' % (sockets[0].getsockname()[1], url)
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+
+    @gen.coroutine
+    def _fetch(n):
+        for _ in xrange(n):
+            r = yield client.fetch(url)
+            assert r.code == 200
+
+    @gen.coroutine
+    def _run():
+        yield _fetch(1)         # Warm the cache.
+        start = time.time()
+        yield [_fetch(nrequests / concurrency) for _ in xrange(concurrency)]
+        raise gen.Return(time.time() - start)
+
+    try:
+        return IOLoop.current().run_sync(_run)
+    finally:
+        client.close()
+        server.stop()
+        ds.aclient.close()
+        ds._get_connection().disconnect_all()
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bbox-side", dest="bboxside", type="int",
+                      default=20, help="Nodes per side of the /map "
+                      "bounding box [%default]")
+    parser.add_option("-c", "--concurrency", dest="concurrency", type="int",
+                      default=4, help="Concurrent clients [%default]")
+    parser.add_option("-g", "--grid-side", dest="side", type="int",
+                      default=100, help="Nodes per side of the map [%default]")
+    parser.add_option("-r", "--requests", dest="requests", type="int",
+                      default=400, help="Requests per run [%default]")
+    options, args = parser.parse_args()
+
+    server = FakeMemcached()
+    config = make_config(server.start())
+    nways = populate(config, options.side)
+
+    urls = [('/api/0.6/way/%d/full' % (nways / 2), 'way/N/full'),
+            ('/api/0.6/map?bbox=%f,%f,%f,%f' %
+             grid_bbox(options.bboxside), 'map')]
+
+    print "%12s %10s %10s %10s" % ("request", "fragments", "seconds",
+                                   "requests/s")
+    for (url, name) in urls:
+        for fragments in [False, True]:
+            elapsed = run(config, url, options.requests,
+                          options.concurrency, fragments)
+            print "%12s %10s %10.3f %10.1f" % (name, fragments, elapsed,
+                                               options.requests / elapsed)
+
+if __name__ == '__main__':
+    main()
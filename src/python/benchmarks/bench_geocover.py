@@ -0,0 +1,183 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compare ways of finding the geodocs covering a /map bounding box.
+
+For square bounding boxes of increasing size, the table shows the
+time taken to list the geohash cells covering the box by stepping
+from cell to cell using the 'geohash' module (the original
+algorithm), and by computing them directly (see
+'datastore.ds_geohash.geohash_cover()').  The number of cells is the
+number of geodocs looked up without summary geodocs.
+
+The last columns show the reads (round trips) made and the keys
+looked up by a front end walking the pyramid of summary geodocs
+written by 'dbmgr', for a map on which only a fraction of the cells
+hold nodes.
+"""
+
+import os
+import random
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser, Values
+
+import geohash
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from benchmarks import timed
+from datastore.ds_geohash import geohash_cover, geohash_summary_lengths, \
+    init_geohash
+from dbmgr.dbm_geotables import GeoGroupTable
+from frontend.maphandler import MapHandler, _filter_in_bbox
+
+def stepped_cover(bbox, precision):
+    "Return the cells covering 'bbox', stepping from cell to cell."
+    w, s, e, n = map(float, bbox)
+    n = min(C.MAXGHLAT, n)
+    s = min(C.MAXGHLAT, s)
+
+    gcset = set()
+    gc = geohash.encode(s, w, precision)
+    bl = geohash.bbox(gc)
+    s_ = bl['s']
+    while s_ < n:
+        w_ = bl['w']
+        gc = geohash.encode(s_, w_, precision)
+        bb_sn = geohash.bbox(gc)
+        while w_ < e:
+            gcset.add(gc)
+            w_ = geohash.bbox(gc)['e']
+            gc = geohash.encode(s_, w_, precision)
+        s_ = bb_sn['n']
+    return list(gcset)
+
+class GeodocStore:
+    "An in-memory store of geodocs, counting reads and keys looked up."
+
+    def __init__(self):
+        self.geodocs = {}
+        self.reads = 0
+        self.lookups = 0
+
+    def retrieve_element(self, namespace, key):
+        return self.geodocs.get(key)
+
+    def retrieve_elements(self, namespace, keys):
+        return dict([(k, self.geodocs.get(k)) for k in keys])
+
+    def store_element(self, namespace, key, value):
+        self.geodocs[key] = value
+
+    def afetch_keys(self, namespace, keys):
+        self.reads += 1
+        self.lookups += len(keys)
+        found = []
+        for k in keys:
+            if k in self.geodocs:
+                found.append((True, self.geodocs[k]))
+            else:
+                found.append((False, k))
+        f = Future()
+        f.set_result(found)
+        return f
+
+def make_map(precision, occupied, nodespercell, rng):
+    """Return a map with nodes in the 'occupied' cells.
+
+    Returns a GeodocStore, and a geodoc holding all the nodes."""
+    config = ConfigParser()
+    config.read(os.path.join(os.path.dirname(__file__), '..', 'config',
+                             'osm-api-server.cfg'))
+    config.set(C.DATASTORE, C.GEOHASH_LENGTH, str(precision))
+    init_geohash(precision, config.getint(C.DATASTORE, C.SCALE_FACTOR))
+    O.init_osm_factory(config)
+
+    store = GeodocStore()
+    geotable = GeoGroupTable(config, Values({'nothreading': True}), store)
+    everything = O.new_osm_element(C.GEODOC, '')
+    nodeid = 0
+    for c in occupied:
+        bb = geohash.bbox(c)
+        for _ in xrange(nodespercell):
+            n = O.new_osm_element(C.NODE, str(nodeid))
+            n[C.LAT] = O.encode_coordinate(rng.uniform(bb['s'], bb['n']))
+            n[C.LON] = O.encode_coordinate(rng.uniform(bb['w'], bb['e']))
+            geotable.add(n)
+            everything[C.NODES].add((n.id, n[C.LAT], n[C.LON]))
+            nodeid += 1
+    geotable.flush()
+    return (store, everything)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-f", "--fraction", dest="fraction", type="float",
+                      default=0.05, help="Fraction of cells holding "
+                      "nodes [%default]")
+    parser.add_option("-n", "--nodes", dest="nodes", type="int",
+                      default=10, help="Nodes per non-empty cell [%default]")
+    parser.add_option("-p", "--precision", dest="precision", type="int",
+                      default=5, help="Length of geodoc keys [%default]")
+    options, args = parser.parse_args()
+
+    origin = (10.0, 10.0)
+    sizes = [0.01, 0.05, 0.25, 1.0, 2.0, 5.0]
+
+    # Mark a random fraction of the cells in the largest box occupied.
+    rng = random.Random(0)
+    largest = (origin[0], origin[1], origin[0] + sizes[-1],
+               origin[1] + sizes[-1])
+    occupied = [c for c in geohash_cover(largest, options.precision)
+                if rng.random() < options.fraction]
+
+    handler = MapHandler.__new__(MapHandler)
+    handler.precision = options.precision
+    handler.summarylengths = geohash_summary_lengths(options.precision)
+    handler.datastore, everything = make_map(options.precision, occupied,
+                                             options.nodes, rng)
+
+    print "%8s %8s %10s %10s %8s %8s" % ("degrees", "cells", "step-ms",
+                                         "direct-ms", "reads", "lookups")
+    for size in sizes:
+        bbox = (origin[0], origin[1], origin[0] + size, origin[1] + size)
+        tstep, stepped = timed(stepped_cover, bbox, options.precision)
+        tdirect, direct = timed(geohash_cover, bbox, options.precision)
+        assert set(stepped) == set(direct)
+
+        handler.datastore.reads = handler.datastore.lookups = 0
+        geodocs = IOLoop.current().run_sync(
+            lambda: handler.get_geodocs(bbox))
+        assert _filter_in_bbox(bbox, geodocs) == \
+            _filter_in_bbox(bbox, [everything])
+
+        print "%8.2f %8d %10.2f %10.2f %8d %8d" % \
+            (size, len(direct), 1000 * tstep, 1000 * tdirect,
+             handler.datastore.reads, handler.datastore.lookups)
+
+if __name__ == '__main__':
+    main()
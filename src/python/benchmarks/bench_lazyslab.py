@@ -0,0 +1,89 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Measure the cost of decoding slabs read from the datastore.
+
+Slabs of ways are encoded in the original format (every element is
+decoded when the slab is read) and in the indexed format (elements
+are decoded when first retrieved).  The time needed to decode a slab
+and retrieve an increasing number of its elements is then compared.
+"""
+
+from optparse import OptionParser
+
+import apiserver.const as C
+
+from apiserver.osmelement import new_osm_element
+from benchmarks import timed
+from benchmarks.bench_frontend import make_config
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_membase import DatastoreMembase
+from datastore.slabutil import slabutil_get_config
+
+def make_ways(ds, nperslab):
+    "Return (original, indexed) wire representations of a slab of ways."
+    items = []
+    for k in xrange(nperslab):
+        w = new_osm_element(C.WAY, str(k))
+        w[C.NODES] = [str(n) for n in xrange(k * 16, k * 16 + 16)]
+        w[C.TAGS] = {'highway': 'residential', 'name': 'Street %d' % k}
+        items.append(w)
+    original = ds.encode([(C.SLAB_INLINE, w.as_mapping()) for w in items])
+    bits = [ds.encode(w.as_mapping()) for w in items]
+    index = [(C.SLAB_INLINE, w.id, len(b)) for (w, b) in zip(items, bits)]
+    indexed = ds.encode(index) + "\n" + "".join(bits)
+    return (original, indexed)
+
+def lookup(ds, wirebits, keys, repeat):
+    "Decode 'wirebits' 'repeat' times, retrieving 'keys' each time."
+    for _ in xrange(repeat):
+        slab = ds._make_slab(C.WAY, ds._assemble_slab(
+                C.WAY, 'WL0', ds._parse_slab(C.WAY, wirebits), {}), 'WL0')
+        for k in keys:
+            slab.get(k)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int",
+                      default=200, help="Slabs decoded per test [%default]")
+    options, args = parser.parse_args()
+
+    server = FakeMemcached()
+    config = make_config(server.start())
+    _, nperslab = slabutil_get_config(C.WAY)
+    ds = DatastoreMembase(config, writeback=True)
+    ds.initialize()
+    original, indexed = make_ways(ds, nperslab)
+
+    print "%8s %14s %14s" % ("lookups", "original-ms", "indexed-ms")
+    n = 1
+    while n <= nperslab:
+        keys = [str(k) for k in xrange(0, nperslab, nperslab / n)]
+        ot, _ = timed(lookup, ds, original, keys, options.repeat)
+        it, _ = timed(lookup, ds, indexed, keys, options.repeat)
+        print "%8d %14.3f %14.3f" % (len(keys), 1e3 * ot / options.repeat,
+                                     1e3 * it / options.repeat)
+        n *= 4
+    ds._get_connection().disconnect_all()
+
+if __name__ == '__main__':
+    main()
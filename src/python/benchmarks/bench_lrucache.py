@@ -0,0 +1,92 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Measure the per-operation cost of the slab LRU buffer.
+
+The workload mimics the front end serving '/map' requests: a few
+hundred 'hot' slabs are touched over and over, interspersed with
+touches of 'cold' slabs that force ejections.  The per-operation cost
+should stay flat as the total number of touches grows.
+"""
+
+import random
+import time
+
+from optparse import OptionParser
+
+from benchmarks import timed
+from datastore.lrucache import BoundedLRUBuffer
+
+def _workload(buf, ntouches, nhot, coldfraction, rng):
+    """Touch 'ntouches' keys in buffer 'buf'.
+
+    Returns the duration of the slowest single operation."""
+    now = time.time
+    worst = 0.0
+    coldkey = 0
+    for _ in xrange(ntouches):
+        if rng.random() < coldfraction:
+            coldkey += 1
+            k = "C%d" % coldkey
+            start = now()
+            buf[k] = coldkey                    # set + evict
+        else:
+            k = "H%d" % rng.randrange(nhot)
+            start = now()
+            if k in buf:
+                buf[k]                          # get
+            else:
+                buf[k] = k                      # set
+        worst = max(worst, now() - start)
+    return worst
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bound", dest="bound", type="int",
+                      default=1024, help="LRU bound [%default]")
+    parser.add_option("-c", "--cold", dest="cold", type="float",
+                      default=0.1, help="Fraction of cold touches [%default]")
+    parser.add_option("-H", "--hot", dest="hot", type="int",
+                      default=300, help="Number of hot slabs [%default]")
+    parser.add_option("-s", "--seed", dest="seed", type="int",
+                      default=42, help="Random seed [%default]")
+    options, args = parser.parse_args()
+
+    ejected = [0]
+    def _cb(key, value):
+        ejected[0] += 1
+
+    print "%10s %10s %10s %10s %10s" % ("touches", "seconds", "usec/op",
+                                        "max usec", "ejections")
+    for ntouches in [10000, 100000, 1000000]:
+        ejected[0] = 0
+        buf = BoundedLRUBuffer(bound=options.bound, callback=_cb)
+        rng = random.Random(options.seed)
+        elapsed, worst = timed(_workload, buf, ntouches, options.hot,
+                               options.cold, rng)
+        print "%10d %10.3f %10.3f %10.1f %10d" % (ntouches, elapsed,
+                                                  elapsed * 1e6 / ntouches,
+                                                  worst * 1e6, ejected[0])
+
+if __name__ == '__main__':
+    main()
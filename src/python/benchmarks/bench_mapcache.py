@@ -0,0 +1,169 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Replay an access log of /map requests with and without the map cache.
+
+The synthetic map of 'benchmarks.bench_frontend' is stored in a fake
+memcached server that delays each request.  The access log is read
+from a file (one bounding box per line, either as a '/map' URL or as
+"w,s,e,n"), or is made up of requests for a few popular areas, each
+slightly shifted.  The log is replayed against a front end without
+the map cache, and then against one with the cache.  The table shows
+the hit rate of the map cache, and the mean and 95th percentile
+latencies of the requests.
+"""
+
+import random
+import re
+import time
+
+from optparse import OptionParser
+
+import tornado.httpserver
+import tornado.netutil
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+
+from apiserver.osmelement import decode_json
+from benchmarks.bench_frontend import ORIGIN, SPACING, make_config, populate
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_membase import DatastoreMembase
+from frontend.fe import OSMFrontEndServer
+
+_BBOX = re.compile(r'(?:bbox=)?(-?[\d.]+,-?[\d.]+,-?[\d.]+,-?[\d.]+)')
+
+def read_log(path):
+    "Return the bounding boxes of the /map requests in a log file."
+    bboxes = []
+    for line in open(path):
+        m = _BBOX.search(line)
+        if m:
+            bboxes.append(m.group(1))
+    return bboxes
+
+def make_log(side, nrequests, nareas, bboxside):
+    """Return the bounding boxes of a synthetic access log.
+
+    Requests are for 'nareas' areas of 'bboxside' x 'bboxside' nodes
+    on a map of 'side' x 'side' nodes, chosen with a skewed
+    distribution, and shifted by up to two nodes."""
+    rnd = random.Random(0)
+    lat, lon = ORIGIN
+    areas = [(rnd.uniform(0, side - bboxside), rnd.uniform(0, side - bboxside))
+             for _ in xrange(nareas)]
+    bboxes = []
+    for _ in xrange(nrequests):
+        row, col = areas[min(int(rnd.expovariate(4.0 / nareas)),
+                             nareas - 1)]
+        row += rnd.uniform(-2, 2)
+        col += rnd.uniform(-2, 2)
+        bboxes.append("%f,%f,%f,%f" % (lon + col * SPACING,
+                                       lat + row * SPACING,
+                                       lon + (col + bboxside) * SPACING,
+                                       lat + (row + bboxside) * SPACING))
+    return bboxes
+
+def replay(config, bboxes):
+    """Replay requests for 'bboxes' against a fresh front end.
+
+    Returns the latencies of the requests in milliseconds, and the
+    status of the front end at the end of the run."""
+    ds = DatastoreMembase(config)
+    app = OSMFrontEndServer(config, None, ds).application
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    client = AsyncHTTPClient(force_instance=True)
+    base = 'http://127.0.0.1:%d' % sockets[0].getsockname()[1]
+
+    @gen.coroutine
+    def _replay():
+        latencies = []
+        for bbox in bboxes:
+            start = time.time()
+            r = yield client.fetch(base + '/api/0.6/map?bbox=' + bbox)
+            latencies.append(1000 * (time.time() - start))
+            assert r.code == 200
+        r = yield client.fetch(base + '/status')
+        raise gen.Return((latencies, decode_json(r.body)))
+
+    try:
+        return IOLoop.current().run_sync(_replay)
+    finally:
+        client.close()
+        server.stop()
+        ds.aclient.close()
+        ds._get_connection().disconnect_all()
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-a", "--areas", dest="areas", type="int",
+                      default=20, help="Popular areas in the synthetic log "
+                      "[%default]")
+    parser.add_option("-b", "--bbox-side", dest="bboxside", type="int",
+                      default=10, help="Nodes per side of the /map "
+                      "bounding boxes [%default]")
+    parser.add_option("-d", "--delay", dest="delay", type="float",
+                      default=500, help="Microseconds per request [%default]")
+    parser.add_option("-g", "--grid-side", dest="side", type="int",
+                      default=100, help="Nodes per side of the map "
+                      "[%default]")
+    parser.add_option("-l", "--log", dest="log", default=None,
+                      help="Access log to replay")
+    parser.add_option("-m", "--cache-bytes", dest="cachebytes", type="int",
+                      default=64 * 1024 * 1024, help="Size of the map cache "
+                      "[%default]")
+    parser.add_option("-r", "--requests", dest="requests", type="int",
+                      default=500, help="Requests in the synthetic log "
+                      "[%default]")
+    options, args = parser.parse_args()
+
+    server = FakeMemcached(delay=options.delay / 1e6)
+    config = make_config(server.start())
+    populate(config, options.side)
+
+    if options.log:
+        bboxes = read_log(options.log)
+    else:
+        bboxes = make_log(options.side, options.requests, options.areas,
+                          options.bboxside)
+
+    print "%-10s %10s %10s %10s" % ("map-cache", "hit-rate", "mean-ms",
+                                    "p95-ms")
+    for cachebytes in [0, options.cachebytes]:
+        config.set(C.FRONT_END, C.MAP_CACHE_BYTES, str(cachebytes))
+        latencies, status = replay(config, bboxes)
+        hits = status.get('map-cache-hits', 0)
+        lookups = hits + status.get('map-cache-misses', 0)
+        latencies.sort()
+        print "%-10s %10s %10.2f %10.2f" % (
+            "on" if cachebytes else "off",
+            "%.1f%%" % (100.0 * hits / lookups) if lookups else "-",
+            sum(latencies) / len(latencies),
+            latencies[int(0.95 * (len(latencies) - 1))])
+
+if __name__ == '__main__':
+    main()
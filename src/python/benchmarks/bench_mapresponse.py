@@ -0,0 +1,178 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compare building a /map response as one XML tree with streaming it.
+
+A synthetic set of nodes, ways and relations is serialized:
+
+- 'tree': the elements are added to one lxml tree which is then
+  pretty-printed, as the /map handler used to do;
+- 'stream': the elements are written using 'XMLResponseWriter',
+  flushing after the nodes, and after the ways, as the /map handler
+  does.
+
+Each run happens in a child process, and reports the growth in the
+child's peak memory use, the time until the first byte of the
+response is ready to be sent, and the total time taken.
+"""
+
+import os
+import random
+import resource
+import time
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from datastore.slabutil import init_slabutil
+from frontend.util import XMLResponseWriter, response_to_xml
+
+class _Sink:
+    "Count bytes written, discarding them when flushed."
+
+    def __init__(self):
+        self.start = time.time()
+        self.firstbyte = None
+        self.nbytes = 0
+        self.pending = 0
+
+    def write(self, text):
+        self.pending += len(text)
+
+    def flush(self):
+        if self.pending and self.firstbyte is None:
+            self.firstbyte = time.time() - self.start
+        self.nbytes += self.pending
+        self.pending = 0
+
+    finish = flush
+
+def init(nodes):
+    "Initialize modules, and return synthetic (nodes, ways, relations)."
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, '1024')
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, '256')
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Benchmark')
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+
+    rng = random.Random(42)
+    nodelist = []
+    for i in xrange(nodes):
+        n = O.new_osm_element(C.NODE, str(i))
+        n[C.LAT] = O.encode_coordinate(rng.uniform(-90, 90))
+        n[C.LON] = O.encode_coordinate(rng.uniform(-180, 180))
+        n['version'] = '1'
+        n['user'] = 'user%d' % (i % 100)
+        if i % 4 == 0:
+            n[C.TAGS] = {'name': 'Node %d' % i, 'amenity': 'cafe'}
+        nodelist.append(n)
+    ways = []
+    for i in xrange(nodes / 10):
+        w = O.new_osm_element(C.WAY, str(i))
+        w[C.NODES] = [rng.randrange(nodes) for _ in xrange(10)]
+        w[C.TAGS] = {'highway': 'residential', 'name': 'Way %d' % i}
+        ways.append(w)
+    relations = []
+    for i in xrange(nodes / 100):
+        r = O.new_osm_element(C.RELATION, str(i))
+        r[C.MEMBERS] = [(str(rng.randrange(nodes / 10)), 'outer', C.WAY)
+                        for _ in xrange(5)]
+        r[C.TAGS] = {'type': 'multipolygon'}
+        relations.append(r)
+    return (nodelist, ways, relations)
+
+def build_tree(nodes, ways, relations):
+    "Serialize elements using one XML tree."
+    sink = _Sink()
+    osm = O.new_osm_response()
+    for elements in [nodes, ways, relations]:
+        for e in elements:
+            e.build_response(osm)
+    sink.write(response_to_xml(osm))
+    sink.finish()
+    return sink
+
+def stream(nodes, ways, relations):
+    "Serialize elements using an XMLResponseWriter."
+    sink = _Sink()
+    out = XMLResponseWriter(sink, O.new_osm_response())
+    for elements in [nodes, ways]:
+        for e in elements:
+            out.add(e)
+        out.flush()
+    for r in relations:
+        out.add(r)
+    out.finish()
+    return sink
+
+def run(fn, nodes):
+    "Return (peak memory growth in KB, first byte, total seconds, bytes)."
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        elements = init(nodes)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        sink = fn(*elements)
+        elapsed = time.time() - start
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(wfd, repr((after - before, sink.firstbyte, elapsed,
+                            sink.nbytes)))
+        os._exit(0)
+    os.close(wfd)
+    result = os.read(rfd, 4096)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return eval(result)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--nodes", dest="nodes", type="int",
+                      default=100000, help="Maximum number of nodes [%default]")
+    options, args = parser.parse_args()
+
+    print "%8s %8s %10s %10s %10s %10s" % ("nodes", "method", "peak-KB",
+                                           "first-sec", "total-sec", "bytes")
+    n = 1000
+    while n <= options.nodes:
+        for (name, fn) in [("tree", build_tree), ("stream", stream)]:
+            kb, first, total, nbytes = run(fn, n)
+            print "%8d %8s %10d %10.3f %10.3f %10d" % (n, name, kb, first,
+                                                       total, nbytes)
+        n *= 10
+
+if __name__ == '__main__':
+    main()
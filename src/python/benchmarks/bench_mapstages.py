@@ -0,0 +1,119 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Show how the stages of /map requests overlap.
+
+The synthetic map of 'benchmarks.bench_frontend' is stored in a fake
+memcached server that delays each request, and /map requests are
+made to a front end with the 'debug' option set, each with a cold
+element cache.  The table shows the mean start time and duration of
+each stage of a request (from its 'Server-Timing' header), the sum of
+the stage durations (the time taken were stages run one after the
+other), and the mean time taken by the whole request.
+"""
+
+import re
+
+from optparse import OptionParser
+
+import tornado.httpserver
+import tornado.netutil
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+
+from benchmarks.bench_frontend import grid_bbox, make_config, populate
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_membase import DatastoreMembase
+from frontend.fe import OSMFrontEndServer
+
+_TIMING = re.compile(r'([\w-]+);desc="\+([\d.]+)";dur=([\d.]+)')
+
+def fetch_timings(config, url):
+    "Return the stage timings for a request to a fresh front end."
+    ds = DatastoreMembase(config)
+    app = OSMFrontEndServer(config, None, ds).application
+    sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+    client = AsyncHTTPClient(force_instance=True)
+
+    @gen.coroutine
+    def _fetch():
+        r = yield client.fetch('http://127.0.0.1:%d%s' %
+                               (sockets[0].getsockname()[1], url))
+        assert r.code == 200
+        raise gen.Return(r.headers[C.SERVER_TIMING])
+
+    try:
+        header = IOLoop.current().run_sync(_fetch)
+    finally:
+        client.close()
+        server.stop()
+        ds.aclient.close()
+        ds._get_connection().disconnect_all()
+    return [(name, float(start), float(elapsed))
+            for (name, start, elapsed) in _TIMING.findall(header)]
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bbox-side", dest="bboxside", type="int",
+                      default=20, help="Nodes per side of the /map "
+                      "bounding box [%default]")
+    parser.add_option("-d", "--delay", dest="delay", type="float",
+                      default=2000, help="Microseconds per request [%default]")
+    parser.add_option("-g", "--grid-side", dest="side", type="int",
+                      default=60, help="Nodes per side of the map [%default]")
+    parser.add_option("-r", "--requests", dest="requests", type="int",
+                      default=10, help="Requests made [%default]")
+    options, args = parser.parse_args()
+
+    server = FakeMemcached(delay=options.delay / 1e6)
+    config = make_config(server.start())
+    config.set(C.FRONT_END, C.DEBUG, 'true')
+    populate(config, options.side)
+
+    url = '/api/0.6/map?bbox=%f,%f,%f,%f' % grid_bbox(options.bboxside)
+    stages = []
+    totals = {}
+    for _ in xrange(options.requests):
+        for (name, start, elapsed) in fetch_timings(config, url):
+            if name not in totals:
+                stages.append(name)
+                totals[name] = [0.0, 0.0]
+            totals[name][0] += start
+            totals[name][1] += elapsed
+
+    print "%-22s %10s %10s" % ("stage", "start-ms", "ms")
+    for name in stages:
+        start, elapsed = [t / options.requests for t in totals[name]]
+        if name == 'total':
+            print "%-22s %10s %10.1f" % ("sum of stages", "",
+                sum([totals[s][1] for s in stages if s != 'total']) /
+                options.requests)
+        print "%-22s %10.1f %10.1f" % (name, start, elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compare per-slab reads with batched multi-key reads of slabs.
+
+A fake memcached server (see 'benchmarks.fakememcached') holding
+node slabs is started locally, with a configurable delay added to
+each request.  Keys spread over an increasing number of slabs are
+then fetched through the Membase datastore, once reading each slab
+with its own request and once using a single batched request.
+"""
+
+from ConfigParser import ConfigParser
+from optparse import OptionParser
+
+import apiserver.const as C
+
+from benchmarks import timed
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds import DatastoreBase
+from datastore.ds_membase import DatastoreMembase
+from apiserver.osmelement import new_osm_element
+from datastore.slabutil import init_slabutil, slabutil_make_slab, \
+    slabutil_make_slabkey
+
+class SerialDatastore(DatastoreMembase):
+    "A Membase datastore reading one slab per request (for comparison)."
+    retrieve_slabs = DatastoreBase.retrieve_slabs
+
+def make_config(port, nperslab):
+    "Return a configuration for a datastore on a local server."
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, '256')
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, str(nperslab))
+    cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, C.JSON)
+    cfg.set(C.DATASTORE, C.SLAB_LRU_SIZE, '4096')
+    cfg.add_section(C.MEMBASE)
+    cfg.set(C.MEMBASE, C.DBHOST, '127.0.0.1')
+    cfg.set(C.MEMBASE, C.DBPORT, str(port))
+    init_slabutil(cfg)
+    return cfg
+
+def populate(config, nslabs, nperslab):
+    "Store 'nslabs' slabs of nodes in the datastore."
+    ds = DatastoreMembase(config, writeback=True)
+    ds.initialize()
+    for s in xrange(0, nslabs * nperslab, nperslab):
+        items = []
+        for k in xrange(s, s + nperslab):
+            n = new_osm_element(C.NODE, str(k))
+            n[C.LAT] = n[C.LON] = k
+            items.append((n.id, n))
+        ds.store_slab(C.NODE, slabutil_make_slabkey(C.NODE, str(s)),
+                      slabutil_make_slab(C.NODE, items))
+    ds._get_connection().disconnect_all()
+
+def run(server, config, factory, nslabs, nperslab):
+    "Return (seconds, requests) to fetch one key from each of 'nslabs' slabs."
+    ds = factory(config)
+    keys = [str(s) for s in xrange(0, nslabs * nperslab, nperslab)]
+    before = server.requests
+    elapsed, elements = timed(list, ds.fetch_keys(C.NODE, keys))
+    ds._get_connection().disconnect_all()
+    assert len(elements) == nslabs and all(st for (st, _) in elements)
+    return (elapsed, server.requests - before)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-d", "--delay", dest="delay", type="float",
+                      default=1000, help="Microseconds per request [%default]")
+    parser.add_option("-n", "--per-slab", dest="perslab", type="int",
+                      default=16, help="Elements per slab [%default]")
+    parser.add_option("-s", "--slabs", dest="slabs", type="int",
+                      default=256, help="Maximum number of slabs [%default]")
+    options, args = parser.parse_args()
+
+    server = FakeMemcached()
+    config = make_config(server.start(), options.perslab)
+    populate(config, options.slabs, options.perslab)
+    server.delay = options.delay / 1e6
+
+    print "%8s %12s %12s %10s %10s" % ("slabs", "serial-sec", "batched-sec",
+                                       "serial-req", "batched-req")
+    n = 1
+    while n <= options.slabs:
+        st, sr = run(server, config, SerialDatastore, n, options.perslab)
+        bt, br = run(server, config, DatastoreMembase, n, options.perslab)
+        print "%8d %12.4f %12.4f %10d %10d" % (n, st, bt, sr, br)
+        n *= 4
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Count the slabs read by /map requests, for each slab layout.
+
+The synthetic map of 'benchmarks.bench_frontend' is stored once with
+slabs keyed by element id, and once with slabs keyed by location
+(see the 'slab-layout' configuration option).  /map requests for
+bounding boxes at random positions in the map are then made to a
+front end with an empty cache, and the slabs (and index slabs) read
+for each are counted.
+
+Node ids may be assigned in a random order ('-s'), as elements
+created over the years are numbered in OSM data.
+"""
+
+import random
+import time
+
+from optparse import OptionParser
+
+import tornado.httpserver
+import tornado.netutil
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from benchmarks.bench_frontend import SPACING, grid_bbox, make_config, \
+    populate
+from benchmarks.fakememcached import FakeMemcached
+from datastore.ds_membase import DatastoreMembase
+from datastore.slabutil import init_slabutil
+from frontend.fe import OSMFrontEndServer
+
+class CountingDatastore(DatastoreMembase):
+    "A datastore that counts the slabs read, by namespace."
+
+    def __init__(self, config, counts):
+        DatastoreMembase.__init__(self, config)
+        self.counts = counts
+
+    def aretrieve_slabs(self, namespace, slabkeys):
+        self.counts[namespace] = self.counts.get(namespace, 0) + \
+            len(slabkeys)
+        return DatastoreMembase.aretrieve_slabs(self, namespace, slabkeys)
+
+def measure(config, urls):
+    """Return slab counts and the elapsed time for requests for 'urls'.
+
+    Each request is made with an empty cache."""
+    counts = {}
+    client = AsyncHTTPClient(force_instance=True)
+    elapsed = 0.0
+    for url in urls:
+        sockets = tornado.netutil.bind_sockets(0, '127.0.0.1')
+        port = sockets[0].getsockname()[1]
+        ds = CountingDatastore(config, counts)
+        server = tornado.httpserver.HTTPServer(
+            OSMFrontEndServer(config, None, ds).application)
+        server.add_sockets(sockets)
+
+        @gen.coroutine
+        def _fetch():
+            r = yield client.fetch('http://127.0.0.1:%d%s' % (port, url))
+            assert r.code == 200
+
+        start = time.time()
+        IOLoop.current().run_sync(_fetch)
+        elapsed += time.time() - start
+
+        server.stop()
+        ds.aclient.close()
+        ds._get_connection().disconnect_all()
+    client.close()
+    return (counts, elapsed)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-b", "--bbox-side", dest="bboxside", type="int",
+                      default=20, help="Nodes per side of the /map "
+                      "bounding box [%default]")
+    parser.add_option("-g", "--grid-side", dest="side", type="int",
+                      default=200, help="Nodes per side of the map [%default]")
+    parser.add_option("-l", "--geohash-length", dest="ghlength", type="int",
+                      default=6, help="Length of the geohash cells of "
+                      "slabs with the 'geo' layout [%default]")
+    parser.add_option("-r", "--requests", dest="requests", type="int",
+                      default=20, help="Requests per layout [%default]")
+    parser.add_option("-s", "--shuffle", dest="shuffle", default=False,
+                      action="store_true",
+                      help="Number nodes in a random order [%default]")
+    options, args = parser.parse_args()
+
+    rng = random.Random(0)
+    w, s, _, _ = grid_bbox(0)
+    span = (options.side - options.bboxside) * SPACING
+    urls = []
+    for _ in xrange(options.requests):
+        x, y = rng.uniform(0, span), rng.uniform(0, span)
+        side = options.bboxside * SPACING
+        urls.append('/api/0.6/map?bbox=%f,%f,%f,%f' %
+                    (w + x, s + y, w + x + side, s + y + side))
+
+    namespaces = [C.NODE, C.WAY, C.RELATION, C.NODE_INDEX, C.WAY_INDEX]
+    print "%6s %10s %10s %10s %10s %10s %10s %10s" % \
+        ("layout", "nodes", "ways", "relations", "node-index", "way-index",
+         "total", "ms")
+    for layout in [C.ID, C.GEO]:
+        server = FakeMemcached()
+        config = make_config(server.start())
+        config.set(C.DATASTORE, C.SLAB_LAYOUT, layout)
+        config.set(C.DATASTORE, C.SLAB_GEOHASH_LENGTH, str(options.ghlength))
+        init_slabutil(config)
+        populate(config, options.side, options.shuffle)
+
+        counts, elapsed = measure(config, urls)
+        n = float(len(urls))
+        print "%6s %s %10.1f %10.1f" % \
+            (layout, " ".join(["%10.1f" % (counts.get(ns, 0) / n)
+                               for ns in namespaces]),
+             sum(counts.values()) / n, 1000 * elapsed / n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Measure contention when many threads wait for I/O on many slabs.
+
+Writer threads repeatedly mark a random slab as 'I/O in progress'
+and then complete the I/O, as the slab write-back threads do.  Reader
+threads wait for I/O on random slabs to complete.  The benchmark
+compares the per-slab latches of 'KeyedWaitTable' with a single
+condition variable shared by all slabs, and reports the time taken
+by the writers, the number of times readers were woken up, and how
+many of these wakeups were spurious (the slab was still busy).
+"""
+
+import random
+import threading
+import time
+
+from optparse import OptionParser
+
+from datastore.lrucache import KeyedWaitTable
+
+class ConditionWaitTable:
+    "A wait table using one shared condition variable (for comparison)."
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = []
+        self.wakeups = 0
+        self.spurious = 0
+
+    def acquire(self, key):
+        with self.cond:
+            while key in self.pending:
+                self._wait(key)
+            self.pending.append(key)
+
+    def end(self, key):
+        with self.cond:
+            self.pending.remove(key)
+            self.cond.notifyAll()
+
+    def wait(self, key):
+        with self.cond:
+            while key in self.pending:
+                self._wait(key)
+
+    def _wait(self, key):
+        self.cond.wait()
+        self.wakeups += 1
+        if key in self.pending:
+            self.spurious += 1
+
+class CountingWaitTable(KeyedWaitTable):
+    "A KeyedWaitTable that counts wakeups."
+
+    def __init__(self):
+        KeyedWaitTable.__init__(self)
+        self.wakeups = 0
+        self.spurious = 0
+
+    def wait(self, key):
+        with self.lock:
+            entry = self.latches.get(key)
+        if entry is not None:
+            latch = entry[0]
+            latch.acquire()
+            latch.release()
+            with self.lock:
+                self.wakeups += 1
+
+def run(table, nslabs, nreaders, nwriters, nops, iotime):
+    "Return (seconds, wakeups, spurious wakeups) for one run."
+    done = threading.Event()
+
+    def _writer(rng):
+        for _ in xrange(nops):
+            k = rng.randrange(nslabs)
+            table.acquire(k)
+            time.sleep(iotime)  # Simulate the I/O.
+            table.end(k)
+
+    def _reader(rng):
+        while not done.is_set():
+            table.wait(rng.randrange(nslabs))
+            time.sleep(iotime)  # Process the slab.
+
+    readers = [threading.Thread(target=_reader, args=(random.Random(i),))
+               for i in xrange(nreaders)]
+    writers = [threading.Thread(target=_writer,
+                                args=(random.Random(-1 - i),))
+               for i in xrange(nwriters)]
+    for t in readers:
+        t.daemon = True
+        t.start()
+    start = time.time()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    elapsed = time.time() - start
+    done.set()
+    for t in readers:
+        t.join()
+    return (elapsed, table.wakeups, table.spurious)
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-i", "--iotime", dest="iotime", type="float",
+                      default=100, help="Microseconds per I/O [%default]")
+    parser.add_option("-o", "--ops", dest="ops", type="int", default=2000,
+                      help="I/Os per writer thread [%default]")
+    parser.add_option("-r", "--readers", dest="readers", type="int",
+                      default=32, help="Reader threads [%default]")
+    parser.add_option("-s", "--slabs", dest="slabs", type="int",
+                      default=64, help="Number of slabs [%default]")
+    parser.add_option("-w", "--writers", dest="writers", type="int",
+                      default=8, help="Writer threads [%default]")
+    options, args = parser.parse_args()
+
+    print "%10s %10s %10s %10s" % ("table", "seconds", "wakeups",
+                                   "spurious")
+    for (name, table) in [("condition", ConditionWaitTable()),
+                          ("keyed", CountingWaitTable())]:
+        elapsed, wakeups, spurious = run(table, options.slabs, options.readers,
+                               options.writers, options.ops,
+                               options.iotime / 1e6)
+        print "%10s %10.3f %10d %10d" % (name, elapsed, wakeups, spurious)
+
+if __name__ == '__main__':
+    main()
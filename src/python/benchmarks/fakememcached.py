@@ -0,0 +1,118 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""An in-memory server speaking the memcached text protocol.
+
+The server supports the subset of the protocol used by the Membase
+datastore ('get', 'set', 'delete' and 'flush_all'), and may be told
+to delay each request to simulate network and server latency.
+"""
+
+import socket
+import SocketServer
+import threading
+import time
+
+class _Handler(SocketServer.StreamRequestHandler):
+    "Serve requests on one client connection."
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        try:
+            self._serve()
+        except socket.error:
+            pass                # Client went away.
+
+    def _serve(self):
+        server = self.server
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = line.split()
+            if not args:
+                continue
+            cmd = args[0]
+            if cmd in ['set', 'add', 'replace']:
+                nbytes = int(args[4])
+                data = self.rfile.read(nbytes + 2)[:-2]
+            with server.lock:
+                server.requests += 1
+            if server.delay:
+                time.sleep(server.delay)
+            if cmd in ['get', 'gets']:
+                response = []
+                for k in args[1:]:
+                    v = server.data.get(k)
+                    if v is not None:
+                        flags, value = v
+                        response.append("VALUE %s %d %d\r\n%s\r\n" %
+                                        (k, flags, len(value), value))
+                response.append("END\r\n")
+                self.wfile.write("".join(response))
+            elif cmd in ['set', 'add', 'replace']:
+                if len(args) > 5 and args[5] == 'noreply':
+                    server.data[args[1]] = (int(args[2]), data)
+                    continue
+                server.data[args[1]] = (int(args[2]), data)
+                self.wfile.write("STORED\r\n")
+            elif cmd == 'delete':
+                if server.data.pop(args[1], None) is None:
+                    self.wfile.write("NOT_FOUND\r\n")
+                else:
+                    self.wfile.write("DELETED\r\n")
+            elif cmd == 'flush_all':
+                server.data.clear()
+                self.wfile.write("OK\r\n")
+            elif cmd == 'version':
+                self.wfile.write("VERSION fakememcached\r\n")
+            else:
+                self.wfile.write("ERROR\r\n")
+
+class FakeMemcached(SocketServer.ThreadingTCPServer):
+    """A memcached server holding its data in a dictionary.
+
+    Parameters:
+
+    delay	- seconds to wait before answering each request.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, host='127.0.0.1', port=0):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), _Handler)
+        self.data = {}
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def start(self):
+        "Serve requests from a daemon thread; returns the server's port."
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return self.server_address[1]
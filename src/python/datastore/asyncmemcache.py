@@ -0,0 +1,172 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""A non-blocking client for the memcached text protocol.
+
+The client runs on a Tornado IOLoop and returns Futures, allowing a
+front end process to keep many requests to the data store in flight.
+Keys are distributed across servers in the same way as the
+'memcache' module does, so that values stored by the ingestion tool
+are found.
+
+Only retrievals are supported.
+"""
+
+import collections
+import datetime
+
+import memcache
+
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+class MemcacheError(Exception):
+    "A protocol error reported by, or seen from, a server."
+    pass
+
+class AsyncMemcacheClient:
+    """A non-blocking memcached client.
+
+    Parameters:
+
+    servers	- a list of "host:port" strings, in the same order as
+                  given to 'memcache.Client'.
+    maxidle	- the number of idle connections kept per server.
+    timeout	- the number of seconds to wait for a connection to be
+                  made, and for each read and write on it.  Requests
+                  taking longer fail with a 'MemcacheError'.
+    """
+
+    def __init__(self, servers, maxidle=16, timeout=3.0):
+        self.servers = []
+        for s in servers:
+            host, port = s.rsplit(':', 1)
+            self.servers.append((host, int(port)))
+        self.idle = [[] for s in self.servers]
+        self.maxidle = maxidle
+        self.timeout = datetime.timedelta(seconds=timeout)
+        self.tcpclient = TCPClient()
+
+    def _server_index(self, key):
+        "Return the index of the server holding a key."
+        return memcache.serverHashFunction(key) % len(self.servers)
+
+    @gen.coroutine
+    def get(self, key):
+        "Return a Future for the value of a key, or None."
+        values = yield self.get_multi([key])
+        raise gen.Return(values.get(key))
+
+    @gen.coroutine
+    def get_multi(self, keys):
+        """Return a Future for a mapping from keys to values.
+
+        Keys that are not present on the servers are absent from the
+        mapping.  Unicode keys are encoded as UTF-8.  Servers are
+        queried in parallel.
+        """
+        byserver = collections.defaultdict(list)
+        for k in keys:
+            if isinstance(k, unicode):
+                k = k.encode('utf-8')
+            byserver[self._server_index(k)].append(k)
+
+        values = {}
+        results = yield [self._get(i, ks) for (i, ks) in byserver.items()]
+        for r in results:
+            values.update(r)
+        raise gen.Return(values)
+
+    @gen.coroutine
+    def _connect(self, index):
+        "Return a Future for a connection to a server."
+        idle = self.idle[index]
+        while idle:
+            stream = idle.pop()
+            if not stream.closed():
+                raise gen.Return(stream)
+        host, port = self.servers[index]
+        connecting = self.tcpclient.connect(host, port)
+        try:
+            stream = yield gen.with_timeout(self.timeout, connecting)
+        except gen.TimeoutError:
+            # Close the connection should it be made later on.
+            connecting.add_done_callback(
+                lambda f: f.exception() is None and f.result().close())
+            raise MemcacheError, "Timed out connecting to %s:%d" % \
+                (host, port)
+        stream.set_nodelay(True)
+        raise gen.Return(stream)
+
+    @gen.coroutine
+    def _wait(self, index, future):
+        "Wait for an I/O on a connection to a server."
+        try:
+            # The I/O fails once the caller closes the connection.
+            result = yield gen.with_timeout(
+                self.timeout, future, quiet_exceptions=StreamClosedError)
+        except gen.TimeoutError:
+            raise MemcacheError, "Timed out waiting for %s:%d" % \
+                self.servers[index]
+        raise gen.Return(result)
+
+    def _release(self, index, stream):
+        "Return a connection to the idle pool."
+        if len(self.idle[index]) < self.maxidle:
+            self.idle[index].append(stream)
+        else:
+            stream.close()
+
+    def close(self):
+        "Close idle connections."
+        for idle in self.idle:
+            while idle:
+                idle.pop().close()
+
+    @gen.coroutine
+    def _get(self, index, keys):
+        "Retrieve keys residing on one server."
+        stream = yield self._connect(index)
+        values = {}
+        try:
+            yield self._wait(index,
+                             stream.write("get %s\r\n" % " ".join(keys)))
+            while True:
+                line = yield self._wait(index, stream.read_until("\r\n"))
+                if line == "END\r\n":
+                    break
+                parts = line.split()
+                if len(parts) != 4 or parts[0] != "VALUE":
+                    raise MemcacheError, "Unexpected response: %r" % line
+                key, flags, nbytes = parts[1], int(parts[2]), int(parts[3])
+                data = yield self._wait(index, stream.read_bytes(nbytes + 2))
+                if flags != 0:
+                    raise MemcacheError, \
+                        "Unsupported flags %d for key %s" % (flags, key)
+                values[key] = data[:-2]
+        except:
+            stream.close()
+            raise
+        self._release(index, stream)
+        raise gen.Return(values)
@@ -0,0 +1,101 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Compression of values written to the data store.
+
+A compressed value is written as a header, followed by the compressed
+form of the original value.  The header consists of COMPRESSION_MAGIC
+followed by a byte naming the codec used, so compressed and
+uncompressed values may be freely mixed in a data store, and a value
+may be read back regardless of the codec currently configured.
+
+The 'zlib' codec is always available; the faster 'lz4' and 'snappy'
+codecs are used if the corresponding Python modules are installed.
+
+Exported functions:
+
+    compress -- compress a value using a named codec.
+    compression_available -- check whether a codec may be used.
+    decompress -- return the original form of a value.
+"""
+
+import zlib
+
+import apiserver.const as C
+
+try:
+    import lz4.block as _lz4
+except ImportError:
+    _lz4 = None
+
+try:
+    import snappy as _snappy
+except ImportError:
+    _snappy = None
+
+# This byte is never the first byte of a JSON, binary or protobuf
+# encoded value.
+COMPRESSION_MAGIC = "\xb7"
+
+# The byte identifying each codec in a compressed value's header.
+_CODEC_BYTES = { C.LZ4: 'l', C.SNAPPY: 's', C.ZLIB: 'z' }
+_CODEC_NAMES = dict([(b, n) for (n, b) in _CODEC_BYTES.items()])
+
+# Codec name => (compressor, decompressor), for the codecs available.
+_codecs = { C.ZLIB: (zlib.compress, zlib.decompress) }
+if _lz4:
+    _codecs[C.LZ4] = (_lz4.compress, _lz4.decompress)
+if _snappy:
+    _codecs[C.SNAPPY] = (_snappy.compress, _snappy.decompress)
+
+def compression_available(codec):
+    "Return True if values may be compressed using 'codec'."
+    return codec == C.NONE or codec in _codecs
+
+def compress(codec, bits, threshold=0):
+    """Return 'bits', compressed using 'codec'.
+
+    Values shorter than 'threshold' bytes, and values that do not get
+    smaller on compression, are returned unchanged."""
+
+    if codec == C.NONE or len(bits) < threshold:
+        return bits
+    compressor, _ = _codecs[codec]
+    cbits = COMPRESSION_MAGIC + _CODEC_BYTES[codec] + compressor(bits)
+    if len(cbits) >= len(bits):
+        return bits
+    return cbits
+
+def decompress(bits):
+    "Return the original form of a value read from the data store."
+
+    if bits is None or not bits.startswith(COMPRESSION_MAGIC):
+        return bits
+    codec = _CODEC_NAMES.get(bits[1:2])
+    if codec is None:
+        raise ValueError, "Unknown compression codec %r" % bits[1:2]
+    if codec not in _codecs:
+        raise NotImplementedError, \
+            "The module for compression codec '%s' is not present" % codec
+    _, decompressor = _codecs[codec]
+    return decompressor(bits[2:])
@@ -22,18 +22,27 @@
 
 """An interface to the datastore."""
 
+import collections
+import sys
 import threading
 
+from tornado import gen
+from tornado.concurrent import Future
+
 import apiserver.const as C
 
-from apiserver.osmelement import decode_json, decode_protobuf, encode_json, \
-    encode_protobuf
-from datastore.lrucache import LRUIOCache
+from apiserver.osmbinary import decode_binary, encode_binary
+from apiserver.osmelement import decode_json, encode_json
+from apiserver.osmprotobuf import decode_protobuf, encode_protobuf
+from datastore.lrucache import KeyedWaitTable, LRUIOCache
 from datastore.slabutil import *
 
 import threading
 from Queue import Queue
 
+# Seconds for which absent slabs are remembered, by default.
+_NEGATIVE_CACHE_TTL = 300
+
 class DatastoreBase:
     """Base class for accessing a data store."""
 
@@ -41,6 +50,11 @@ class DatastoreBase:
         C.CHANGESET, C.GEODOC, C.NODE, C.RELATION, C.WAY
         ]
 
+    NAMESPACE_BYTE_BUDGETS = [
+        (C.GEODOC, C.GEODOCS_LRU_BYTES), (C.NODE, C.NODES_LRU_BYTES),
+        (C.RELATION, C.RELATIONS_LRU_BYTES), (C.WAY, C.WAYS_LRU_BYTES)
+        ]
+
     def __init__(self, config, usethreads=False, writeback=False):
         "Initialize the datastore."
         encoding = config.get(C.DATASTORE, C.DATASTORE_ENCODING)
@@ -50,9 +64,19 @@ class DatastoreBase:
         elif encoding == C.PROTOBUF:
             self.decode = decode_protobuf
             self.encode = encode_protobuf
+        elif encoding == C.BINARY:
+            self.decode = decode_binary
+            self.encode = encode_binary
         bound = config.getint(C.DATASTORE, C.SLAB_LRU_SIZE)
         if bound <= 0:
             raise ValueError, "Illegal SLAB LRU size %d" % bound
+        bytebound = self._getint(config, C.SLAB_LRU_BYTES)
+        nsbytebounds = {}
+        for (ns, k) in DatastoreBase.NAMESPACE_BYTE_BUDGETS:
+            nsbound = self._getint(config, k)
+            if nsbound:
+                nsbytebounds[ns] = nsbound
+        self.writeback = writeback
         if writeback:
             if usethreads:
                 nthreads = config.getint(C.DATASTORE, C.SLAB_LRU_THREADS)
@@ -73,7 +97,31 @@ class DatastoreBase:
                 callback = self._cbwrite
         else:
             callback = None
-        self.cache = LRUIOCache(bound=bound, callback=callback)
+        if config.has_option(C.DATASTORE, C.SLAB_LRU_POLICY):
+            policy = config.get(C.DATASTORE, C.SLAB_LRU_POLICY)
+        else:
+            policy = C.LRU
+        if config.has_option(C.DATASTORE, C.NEGATIVE_CACHE_TTL):
+            negttl = self._getint(config, C.NEGATIVE_CACHE_TTL)
+        else:
+            negttl = _NEGATIVE_CACHE_TTL
+        self.cache = LRUIOCache(bound=bound, callback=callback,
+                                bytebound=bytebound,
+                                nsbytebounds=nsbytebounds, policy=policy,
+                                negbound=self._getint(config,
+                                                      C.NEGATIVE_CACHE_SIZE),
+                                negttl=negttl)
+        self.loading = KeyedWaitTable() # Slabs being read in.
+        self.aloading = {}      # Slabs being read in asynchronously.
+
+    def _getint(self, config, key):
+        "Return an (optional) non-negative integer from the configuration."
+        if not config.has_option(C.DATASTORE, key):
+            return 0
+        v = config.getint(C.DATASTORE, key)
+        if v < 0:
+            raise ValueError, "Illegal value for %s: %d" % (key, v)
+        return v
 
     def _worker(self):
         "Helper for the threaded case."
@@ -94,7 +142,7 @@ class DatastoreBase:
             self.workqueue.task_done()
         self.cache.iodone(slabkey)
 
-    def fetch_keys(self, namespace, keys, cacheable=True):
+    def fetch_keys(self, namespace, keys, cacheable=True, locations=None):
         """Return an iterator returning values for keys.
 
         Parameters:
@@ -103,24 +151,17 @@ class DatastoreBase:
         keys		- a list of keys to retrieve.
         cacheable       - True if values from the data store are to
                           be cached.
+        locations	- an optional mapping from keys to the (lat, lon)
+			  locations of elements, used to find
+			  geographically keyed slabs without reading
+			  the namespace's index.
         """
 
         assert namespace in DatastoreBase.VALID_NAMESPACES
 
         # Retrieve the requested keys from the cache, if present
         # there.
-        keys_to_retrieve = set()
-        elements = []
-
-        for k in keys:
-            assert isinstance(k, basestring)
-            v = self.cache.get(namespace, k)
-            if v:               # Status is known.
-                assert len(v) == 2
-                assert isinstance(v, tuple)
-                elements.append(v)
-            else:               # Status is unknown.
-                keys_to_retrieve.add(k)
+        elements, keys_to_retrieve = self._fetch_cached(namespace, keys)
 
         # Return elements that were present in the cache.
         for elem in elements:
@@ -132,37 +173,36 @@ class DatastoreBase:
         # Retrieve elements that were not in cache from the backing
         # store.
         if slabutil_use_slab(namespace):
-            slabkeyset = slabutil_group_keys(namespace, keys_to_retrieve)
-
-            while len(slabkeyset) > 0:
-                elements = []
-                sk, keys = slabkeyset.popitem()
-
-                # Read in the slab from the data store.
-                items = self.retrieve_slab(namespace, sk)
+            if slabutil_use_geo_slab(namespace):
+                slabkeyset = self._group_geo_keys(namespace, keys_to_retrieve,
+                                                  locations)
+            else:
+                slabkeyset = slabutil_group_keys(namespace, keys_to_retrieve)
 
+            # Read in all the needed slabs from the data store in one
+            # batch, returning elements as each slab is decoded.
+            for (sk, slabdesc) in self._load_slabs(namespace,
+                                                   slabkeyset.keys()):
                 # Nothing to do if the entire slab missing.
-                if items is None:
+                if slabdesc is None:
                     continue
 
-                # Prepare a slab descriptor, insert its contents into the cache.
-                slabdesc = slabutil_make_slab(namespace, items)
-                self.cache.insert_slab(slabdesc)
-
                 # Bring in elements.
-                for k in keys:
-                    try:
-                        elements.append(self.cache.get(namespace, k))
-                        keys_to_retrieve.remove(k)
-                    except KeyError:
-                        assert False, "Element %s:%s not in cache" % (sk, k)
+                keys = slabkeyset[sk]
+                elements = self._slab_get(slabdesc, keys)
+                keys_to_retrieve -= keys
 
                 # Return elements from this slab.
                 for elem in elements:
                     yield elem
         else:
+            # Elements in non-slab namespaces are read-only, so
+            # they are only cached if they cannot need writing back.
+            cacheable = cacheable and not self.writeback
             for k in keys_to_retrieve:
                 elem = self.retrieve_element(namespace, k)
+                if cacheable:
+                    self._cache_element(namespace, k, elem)
                 if elem is None:
                     yield (False, k)
                 else:
@@ -174,6 +214,332 @@ class DatastoreBase:
         for k in keys_to_retrieve:
             yield (False, k)
 
+    def _fetch_cached(self, namespace, keys):
+        """Look up keys in the cache.
+
+        Returns a list of (status, value) pairs for the keys whose
+        status is known, and the set of the other keys.
+        """
+        keys_to_retrieve = set()
+        elements = []
+
+        for k in keys:
+            assert isinstance(k, basestring)
+            v = self.cache.get(namespace, k)
+            if v:               # Status is known.
+                assert len(v) == 2
+                assert isinstance(v, tuple)
+                elements.append(v)
+            else:               # Status is unknown.
+                keys_to_retrieve.add(k)
+
+        return (elements, keys_to_retrieve)
+
+    def _locate_geo_keys(self, namespace, keys, locations):
+        """Group keys in a geographically keyed namespace by slab.
+
+        Returns a mapping from slab keys to the keys with a known
+        location, and a mapping from index slab keys to the other
+        keys."""
+        slabkeyset = collections.defaultdict(set)
+        unlocated = []
+        for k in keys:
+            location = locations and locations.get(k)
+            if location:
+                slabkeyset[slabutil_make_geo_slabkey(namespace, k,
+                                                     location)].add(k)
+            else:
+                unlocated.append(k)
+        return (slabkeyset,
+                slabutil_group_keys(slabutil_index_namespace(namespace),
+                                    unlocated))
+
+    def _add_index_entries(self, slabkeyset, indexslab, keys):
+        "Add keys to 'slabkeyset' under the slab keys in their index slab."
+        keys = list(keys)
+        for (k, (st, slabkey)) in zip(keys, self._slab_get(indexslab, keys)):
+            if st:
+                slabkeyset[slabkey].add(k)
+
+    def _group_geo_keys(self, namespace, keys, locations):
+        """Group keys in a geographically keyed namespace by slab.
+
+        Slab keys are computed for elements with a known location, and
+        are read from the namespace's index for the others.  Keys that
+        are not in the index are left out."""
+        slabkeyset, indexkeyset = self._locate_geo_keys(namespace, keys,
+                                                        locations)
+        for (isk, indexslab) in self._load_slabs(
+            slabutil_index_namespace(namespace), indexkeyset.keys()):
+            if indexslab is not None:
+                self._add_index_entries(slabkeyset, indexslab,
+                                        indexkeyset[isk])
+        return slabkeyset
+
+    @gen.coroutine
+    def _agroup_geo_keys(self, namespace, keys, locations):
+        "Asynchronous version of '_group_geo_keys()'."
+        slabkeyset, indexkeyset = self._locate_geo_keys(namespace, keys,
+                                                        locations)
+        if indexkeyset:
+            indexslabs = yield self._aload_slabs(
+                slabutil_index_namespace(namespace), indexkeyset.keys())
+            for (isk, indexslab) in indexslabs.items():
+                if indexslab is not None:
+                    self._add_index_entries(slabkeyset, indexslab,
+                                            indexkeyset[isk])
+        raise gen.Return(slabkeyset)
+
+    def _cache_element(self, namespace, key, elem):
+        "Cache an element from a non-slab namespace, or its absence."
+        slabkey = slabutil_make_slabkey(namespace, key)
+        if elem is None:
+            self.cache.insert_negative(slabkey)
+        elif self.cache.lookup_slab(namespace, slabkey) is None:
+            self.cache.insert_slab(slabutil_make_slab(namespace,
+                                                      [(key, elem)]))
+
+    @gen.coroutine
+    def afetch_keys(self, namespace, keys, cacheable=True, locations=None):
+        """Asynchronous version of 'fetch_keys()'.
+
+        Returns a Future for a list of (status, value) pairs.
+        """
+
+        assert namespace in DatastoreBase.VALID_NAMESPACES
+
+        elements, keys_to_retrieve = self._fetch_cached(namespace, keys)
+        if len(keys_to_retrieve) == 0:
+            raise gen.Return(elements)
+
+        if slabutil_use_slab(namespace):
+            if slabutil_use_geo_slab(namespace):
+                slabkeyset = yield self._agroup_geo_keys(namespace,
+                                                         keys_to_retrieve,
+                                                         locations)
+            else:
+                slabkeyset = slabutil_group_keys(namespace, keys_to_retrieve)
+            slabs = yield self._aload_slabs(namespace, slabkeyset.keys())
+            for (sk, keys) in slabkeyset.items():
+                slabdesc = slabs[sk]
+                if slabdesc is None:
+                    continue
+                elements.extend(self._slab_get(slabdesc, keys))
+                keys_to_retrieve -= keys
+            elements.extend([(False, k) for k in keys_to_retrieve])
+        else:
+            cacheable = cacheable and not self.writeback
+            found = yield self.aretrieve_elements(namespace,
+                                                  list(keys_to_retrieve))
+            for k in keys_to_retrieve:
+                elem = found.get(k)
+                if cacheable:
+                    self._cache_element(namespace, k, elem)
+                if elem is None:
+                    elements.append((False, k))
+                else:
+                    elements.append((True, elem))
+
+        raise gen.Return(elements)
+
+    @gen.coroutine
+    def _aload_slabs(self, namespace, slabkeys):
+        """Asynchronously read in a set of slabs.
+
+        Slabs that are neither cached nor already being read in are
+        retrieved using one batched request.  Concurrent callers
+        needing the same slabs share the result of that request.
+
+        Returns a Future for a mapping from slab keys to slab
+        descriptors (None for slabs not in the data store).
+        """
+        slabs = {}
+        pending = {}            # Slab keys being read in by others.
+        toread = []
+        for sk in slabkeys:
+            if sk in self.aloading:
+                pending[sk] = self.aloading[sk]
+                continue
+            slabdesc = self.cache.lookup_slab(namespace, sk)
+            if slabdesc is None and not self.cache.check_negative(sk):
+                toread.append(sk)
+            else:
+                slabs[sk] = slabdesc
+
+        if toread:
+            batch = Future()
+            for sk in toread:
+                self.aloading[sk] = batch
+            try:
+                items = yield self.aretrieve_slabs(namespace, toread)
+                loaded = {}
+                for sk in toread:
+                    slabdesc = None
+                    if items.get(sk) is not None:
+                        slabdesc = self._make_slab(namespace, items[sk], sk)
+                        self.cache.insert_slab(slabdesc)
+                    else:
+                        self.cache.insert_negative(sk)
+                    loaded[sk] = slabdesc
+                batch.set_result(loaded)
+            except Exception:
+                batch.set_exc_info(sys.exc_info())
+            finally:
+                for sk in toread:
+                    del self.aloading[sk]
+            loaded = yield batch    # Raises errors seen above.
+            slabs.update(loaded)
+
+        for (sk, batch) in pending.items():
+            loaded = yield batch
+            slabs[sk] = loaded[sk]
+
+        raise gen.Return(slabs)
+
+    def _make_slab(self, namespace, items, slabkey):
+        """Return a slab descriptor for a slab read from the data store.
+
+        Backends return either a list of (key, element) pairs, or a
+        slab descriptor (for example, one that vivifies elements
+        lazily)."""
+        if isinstance(items, list):
+            return slabutil_make_slab(namespace, items, slabkey)
+        return items
+
+    def _slab_get(self, slabdesc, keys):
+        """Return (status, value) pairs for keys in a slab.
+
+        Elements that the slab creates on demand add to its size, so
+        the cache is told of the new size."""
+        footprint = slabdesc.footprint
+        elements = [slabdesc.get(k) for k in keys]
+        if slabdesc.footprint != footprint and \
+                self.cache.lookup_slab(slabdesc.namespace,
+                                       slabdesc.slabkey) is slabdesc:
+            self.cache.resize_slab(slabdesc)
+        return elements
+
+    def _load_slab(self, namespace, slabkey):
+        """Read in a slab from the data store and cache its contents.
+
+        Concurrent loads of a slab are coalesced: the first caller
+        reads the slab in, and other callers wait for, and share, its
+        result.
+
+        Returns the slab descriptor, or None if the slab is not present
+        in the data store.
+        """
+        while not self.loading.begin(slabkey):
+            result = self.loading.wait(slabkey)
+            if result is not None:
+                slabdesc, = result
+                return slabdesc
+
+        try:
+            # The slab may have been read in while we were waiting.
+            slabdesc = self.cache.lookup_slab(namespace, slabkey)
+            if slabdesc is None and not self.cache.check_negative(slabkey):
+                self._wait_for_write(slabkey)
+                items = self.retrieve_slab(namespace, slabkey)
+                if items is not None:
+                    # Prepare a slab descriptor, insert its contents
+                    # into the cache.
+                    slabdesc = self._make_slab(namespace, items, slabkey)
+                    self.cache.insert_slab(slabdesc)
+                else:
+                    self.cache.insert_negative(slabkey)
+        except:
+            self.loading.end(slabkey)
+            raise
+
+        self.loading.end(slabkey, (slabdesc,))
+        return slabdesc
+
+    def _wait_for_write(self, slabkey):
+        """Wait for a slab being written back to reach the data store.
+
+        Lookups of elements in the cache wait for these writes; slabs
+        read in by slab key need to do so explicitly."""
+        if self.writeback:
+            self.cache.iopending.wait(slabkey)
+
+    def _load_slabs(self, namespace, slabkeys):
+        """Read in a set of slabs from the data store.
+
+        Slabs that are not being read in by another caller are
+        retrieved using a single batched request; see '_load_slab()'
+        for the handling of the others.
+
+        Returns an iterator over (slabkey, slabdesc) pairs, where
+        'slabdesc' is None if the slab is not present in the data
+        store.  The slabs read in by this call are released before
+        the first pair is returned, so callers may read in slabs, or
+        store elements, while iterating.
+        """
+        claimed = []
+        others = []
+        for sk in slabkeys:
+            if self.loading.begin(sk):
+                claimed.append(sk)
+            else:
+                others.append(sk)
+
+        loaded = []
+        pending = set(claimed)
+        try:
+            toread = []
+            for sk in claimed:
+                # The slab may have been read in by another caller.
+                slabdesc = self.cache.lookup_slab(namespace, sk)
+                if slabdesc is None and not self.cache.check_negative(sk):
+                    toread.append(sk)
+                    continue
+                pending.discard(sk)
+                self.loading.end(sk, (slabdesc,))
+                loaded.append((sk, slabdesc))
+
+            if toread:
+                for sk in toread:
+                    self._wait_for_write(sk)
+                for (sk, items) in self.retrieve_slabs(namespace, toread):
+                    slabdesc = None
+                    if items is not None:
+                        slabdesc = self._make_slab(namespace, items, sk)
+                        self.cache.insert_slab(slabdesc)
+                    else:
+                        self.cache.insert_negative(sk)
+                    pending.discard(sk)
+                    self.loading.end(sk, (slabdesc,))
+                    loaded.append((sk, slabdesc))
+        finally:
+            # Release slabs left unread, on errors.
+            for sk in pending:
+                self.loading.end(sk)
+
+        for (sk, slabdesc) in loaded:
+            yield (sk, slabdesc)
+
+        for sk in others:
+            yield (sk, self._load_slab(namespace, sk))
+
+    @gen.coroutine
+    def afetch(self, namespace, key):
+        """Asynchronous version of 'fetch()'."""
+
+        if namespace not in DatastoreBase.VALID_NAMESPACES:
+            raise KeyError, namespace
+
+        elems = yield self.afetch_keys(namespace, [key])
+
+        assert len(elems) == 1, \
+            'Multiple values for ns,key="%s","%s": %s' % \
+            (namespace, key, elems)
+
+        rstatus, elem = elems[0]
+        if rstatus:
+            raise gen.Return(elem)
+        raise gen.Return(None)
+
     def fetch(self, namespace, key):
         """Retrieve one value from the datastore."""
 
@@ -195,21 +561,143 @@ class DatastoreBase:
         else:
             return None
 
-    def store(self, elem):
-        "Create a new element in the data store."
+    def store(self, elem, location=None):
+        """Create a new element in the data store.
+
+        For geographically keyed slabs, 'location' is the (lat, lon)
+        location of a way (that of its first node); nodes supply their
+        own location."""
 
         ns = elem.namespace
         elemid = elem.id
         slabdesc = self.cache.get_slab(ns, elemid)
-        if slabdesc is None:    # New slab.
-            slabdesc = slabutil_make_slab(ns, [(elemid, elem)])
-            self.cache.insert_slab(slabdesc)
+        if slabdesc is None:
+            # The element's slab may have been evicted and written
+            # back; read it in again so that its other elements are
+            # not lost.
+            if slabutil_use_geo_slab(ns):
+                slabdesc = self._load_geo_slab(elem, location)
+            else:
+                slabdesc = self._load_slab(ns,
+                                           slabutil_make_slabkey(ns, elemid))
+            if slabdesc is None:  # New slab.
+                slabdesc = slabutil_make_slab(ns, [(elemid, elem)])
+                self.cache.insert_slab(slabdesc)
+                return
+            self.cache.add_slab_key(slabdesc, elemid)
+        slabdesc.add(elemid, elem)
+        self.cache.resize_slab(slabdesc)
+
+    def _load_geo_slab(self, elem, location):
+        """Return the geographically keyed slab for an element.
+
+        The element's slab is looked up in the namespace's index, and
+        the element is added to the index if it is not present there.
+        The slab is read in from the data store if present there, and
+        is created otherwise."""
+
+        ns = elem.namespace
+        elemid = elem.id
+        if location is None and ns == C.NODE and elem.get(C.LAT) is not None:
+            location = (elem[C.LAT], elem[C.LON])
+
+        indexns = slabutil_index_namespace(ns)
+        indexslab = self._load_slab(indexns,
+                                    slabutil_make_slabkey(indexns, elemid))
+        if indexslab is None:
+            slabkey = slabutil_make_geo_slabkey(ns, elemid, location)
+            self.cache.insert_slab(slabutil_make_slab(indexns,
+                                                      [(elemid, slabkey)]))
         else:
-            slabdesc.add(elemid, elem)
+            st, slabkey = indexslab.get(elemid)
+            if not st:
+                slabkey = slabutil_make_geo_slabkey(ns, elemid, location)
+                indexslab.add(elemid, slabkey)
+                self.cache.resize_slab(indexslab)
+
+        slabdesc = self._load_slab(ns, slabkey)
+        if slabdesc is None:
+            slabdesc = slabutil_make_slab(ns, [], slabkey)
+            self.cache.insert_slab(slabdesc)
+        return slabdesc
+
+    def statistics(self):
+        "Return a mapping describing the state of the datastore."
+        return {
+            'cache-bytes': self.cache.bytes_by_namespace(),
+            'cache-slabs': len(self.cache.footprints),
+            'negative-entries': len(self.cache.negative),
+            'negative-hits': self.cache.negative_hits
+            }
+
+    def retrieve_slabs(self, namespace, slabkeys):
+        """Return an iterator over (slabkey, slab) pairs.
+
+        'slab' is None for slabs not present in the data store.
+        Backends that can batch reads should override this method.
+        """
+        for sk in slabkeys:
+            yield (sk, self.retrieve_slab(namespace, sk))
+
+    @gen.coroutine
+    def aretrieve_slabs(self, namespace, slabkeys):
+        """Return a Future for a mapping from slab keys to slabs.
+
+        Backends with a non-blocking client should override this
+        method; by default slabs are read synchronously.
+        """
+        raise gen.Return(dict(self.retrieve_slabs(namespace, slabkeys)))
+
+    def retrieve_elements(self, namespace, keys):
+        """Return a mapping from keys to elements.
+
+        Elements not present in the data store map to None.
+        Backends that can batch reads should override this method.
+        """
+        return dict([(k, self.retrieve_element(namespace, k))
+                     for k in keys])
+
+    @gen.coroutine
+    def aretrieve_elements(self, namespace, keys):
+        """Return a Future for a mapping from keys to elements.
+
+        Elements not present in the data store map to None.
+        """
+        raise gen.Return(self.retrieve_elements(namespace, keys))
+
+    @gen.coroutine
+    def aget_generation(self):
+        """Return a Future for the generation of the data store.
+
+        The generation changes whenever a load of the data store
+        completes, and is None if it has not been recorded.
+        """
+        found = yield self.aretrieve_elements(C.DATASTORE_CONFIG,
+                                              [C.CFGSLAB])
+        slabconfig = found.get(C.CFGSLAB)
+        if slabconfig is None:
+            raise gen.Return(None)
+        raise gen.Return(slabconfig.get(C.GENERATION))
 
     def _abort(self, *args, **kw):
         raise TypeError, "Abstract method invoked"
 
+    def discard_cache(self):
+        """Forget the cached slabs, and the slabs known to be absent.
+
+        Called by front ends when the data store has been reloaded.
+        The XML fragments cached on elements are dropped along with
+        their slabs."""
+        self.cache.discard()
+
+    def close(self):
+        """Release the resources held by the datastore.
+
+        The slab trace file, if any, is flushed and closed."""
+        if self.cache.trace:
+            self.cache.trace.close()
+            self.cache.trace = None
+
     def finalize(self):
         "Write back caches and finish pending I/Os."
         self.cache.flush()
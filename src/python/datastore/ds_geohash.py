@@ -23,9 +23,16 @@
 """Convenience routines for managing geo-hashes."""
 
 import geohash
+import math
 
 import apiserver.const as C
 
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Summary geodocs list the non-empty cells whose keys are this many
+# characters longer than their own.
+_SUMMARY_STEP = 2
+
 __GHKEYLENGTH = None
 __SCALEFACTOR = None
 
@@ -43,3 +50,66 @@ def geohash_key_for_element(elem):
     lon = float(elem.get(C.LON)) / __SCALEFACTOR
 
     return geohash.encode(lat, lon, precision=__GHKEYLENGTH)
+
+def geohash_summary_lengths(precision):
+    """Return the lengths of the keys of summary geodocs.
+
+    Summary geodocs form a pyramid above the geodocs (whose keys are
+    of length 'precision'): each lists the non-empty cells of the
+    level below inside its own cell.  Lengths are returned finest
+    first, and the list is empty if geodocs are too short to be
+    summarized."""
+    return range(precision - _SUMMARY_STEP, 0, -_SUMMARY_STEP)
+
+def _spread(v, vbits, nbits, first):
+    """Return the bits of a geohash holding the 'vbits' bits of 'v'.
+
+    Longitude and latitude bits alternate in a geohash of 'nbits'
+    bits, starting with longitude; 'first' is the position of the
+    most significant bit of 'v' (0 for a longitude, 1 for a
+    latitude), counting from the most significant bit."""
+    bits = 0
+    for i in xrange(vbits):
+        if v & (1 << (vbits - 1 - i)):
+            bits |= 1 << (nbits - 1 - first - 2 * i)
+    return bits
+
+def _cell_range(lo, hi, origin, extent, cellbits):
+    "Return the numbers of the cells from 'lo' up to (but excluding) 'hi'."
+    ncells = 1 << cellbits
+    size = extent / ncells
+    first = min(ncells - 1, max(0, int((lo - origin) / size)))
+    last = min(ncells - 1, int(math.ceil((hi - origin) / size)) - 1)
+    return xrange(first, max(first, last) + 1)
+
+def geohash_cover(bbox, precision):
+    """Return the keys of the geohash cells covering a bounding box.
+
+    bbox      -- the (w, s, e, n) coordinates of the box, in degrees.
+    precision -- the length of the keys.
+
+    Cells of a given length form a regular grid, so the rows and
+    columns covered are computed directly, and the key for each cell
+    is assembled from the bits of its row and column numbers.
+    """
+
+    w, s, e, n = map(float, bbox)
+    assert w <= e and s <= n
+
+    nbits = 5 * precision
+    lonbits = (nbits + 1) / 2
+    latbits = nbits / 2
+
+    columns = [_spread(x, lonbits, nbits, 0)
+               for x in _cell_range(w, e, -180.0, 360.0, lonbits)]
+    rows = [_spread(y, latbits, nbits, 1)
+            for y in _cell_range(s, n, -90.0, 180.0, latbits)]
+    shifts = range(nbits - 5, -1, -5)
+
+    keys = []
+    for r in rows:
+        for c in columns:
+            bits = r | c
+            keys.append("".join([_BASE32[(bits >> sh) & 0x1F]
+                                 for sh in shifts]))
+    return keys
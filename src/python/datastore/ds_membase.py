@@ -27,19 +27,52 @@ import apiserver.const as C
 import memcache                 # Use Memcache bindings (for now).
 memcache.SERVER_MAX_VALUE_LENGTH = C.MEMBASE_MAX_VALUE_LENGTH # Update limit.
 
+import functools
+import logging
 import types
 import threading
-
-from apiserver.osmelement import new_osm_element, OSMElement
+import uuid
+
+from tornado import gen
+
+from apiserver.osmbinary import BinarySlab, encode_binary, \
+    encode_binary_slab, is_binary_slab
+from apiserver.osmelement import decode_json, encode_json, \
+    new_osm_element, OSMElement
+from apiserver.osmprotobuf import ProtobufSlab, encode_protobuf, \
+    encode_protobuf_slab, SLAB_MAGIC as PROTOBUF_SLAB_MAGIC
+from datastore.asyncmemcache import AsyncMemcacheClient
+from datastore.compression import compress, compression_available, \
+    decompress
 from datastore.ds import DatastoreBase
 from datastore.slabutil import *
 
+# Seconds to wait for the data store, if not configured.
+_DBTIMEOUT = 3.0
+
 class DatastoreMembase(DatastoreBase):
     "An interface to a Membase (www.membase.org) datastore."
 
     SLAB_CONFIGURATION_KEYS =  [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
                                 C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]
 
+    # Optional keys describing the layout of the data store, and
+    # their values for data stores written without them.
+    LAYOUT_CONFIGURATION_DEFAULTS = {
+        C.GEODOC_OCCUPANCY: 'false',
+        C.SLAB_GEOHASH_LENGTH: None,
+        C.SLAB_LAYOUT: C.ID
+        }
+
+    # Namespaces holding the id indices of geographically keyed slabs.
+    INDEX_NAMESPACES = [C.NODE_INDEX, C.WAY_INDEX]
+
+    NAMESPACE_COMPRESSION = [
+        (C.CHANGESET, C.CHANGESETS_COMPRESSION),
+        (C.GEODOC, C.GEODOCS_COMPRESSION), (C.NODE, C.NODES_COMPRESSION),
+        (C.RELATION, C.RELATIONS_COMPRESSION), (C.WAY, C.WAYS_COMPRESSION)
+        ]
+
     def __init__(self, config, usethreads=False, writeback=False):
         "Initialize the datastore."
 
@@ -47,10 +80,25 @@ class DatastoreMembase(DatastoreBase):
 
         DatastoreBase.__init__(self, config, usethreads, writeback)
 
+        # Values written are compressed using a per-namespace codec.
+        # Values read are decompressed according to their header.
+        codec = self._get_codec(config, C.SLAB_COMPRESSION, C.NONE)
+        self.compression = {}
+        for (ns, k) in DatastoreMembase.NAMESPACE_COMPRESSION:
+            self.compression[ns] = self._get_codec(config, k, codec)
+        self.compression_threshold = \
+            self._getint(config, C.SLAB_COMPRESSION_THRESHOLD)
+
         dbhosts = config.get(C.MEMBASE, C.DBHOST)
         dbport = config.get(C.MEMBASE, C.DBPORT)
 
         self.membasehosts = [h + ':' + dbport for h in dbhosts.split()]
+        if config.has_option(C.MEMBASE, C.DBTIMEOUT):
+            self.dbtimeout = config.getfloat(C.MEMBASE, C.DBTIMEOUT)
+        else:
+            self.dbtimeout = _DBTIMEOUT
+        self.aclient = AsyncMemcacheClient(self.membasehosts,
+                                           timeout=self.dbtimeout)
 
         threads = [threading.currentThread()]
         if usethreads:
@@ -64,6 +112,9 @@ class DatastoreMembase(DatastoreBase):
             slabconfig = new_osm_element(C.DATASTORE_CONFIG, C.CFGSLAB)
             for k in DatastoreMembase.SLAB_CONFIGURATION_KEYS:
                 slabconfig[k] = config.get(C.DATASTORE, k)
+            for k in DatastoreMembase.LAYOUT_CONFIGURATION_DEFAULTS:
+                if config.has_option(C.DATASTORE, k):
+                    slabconfig[k] = config.get(C.DATASTORE, k)
             slabconfig[C.CONFIGURATION_SCHEMA_VERSION] = C.CFGVERSION
             self.slabconfig = slabconfig
         else:
@@ -77,21 +128,42 @@ class DatastoreMembase(DatastoreBase):
                         "Datastore schema version mismatch: expected %s, " \
                         "actual %s." % \
                         (str(C.CFGVERSION), str(schema_version))
+                defaults = DatastoreMembase.LAYOUT_CONFIGURATION_DEFAULTS
                 for (k,v) in slabconfig.items():
-                    if k in DatastoreMembase.SLAB_CONFIGURATION_KEYS:
+                    if k in DatastoreMembase.SLAB_CONFIGURATION_KEYS or \
+                            k in defaults:
+                        config.set(C.DATASTORE, k, v)
+                for (k,v) in defaults.items():
+                    if v is not None and slabconfig.get(k) is None:
                         config.set(C.DATASTORE, k, v)
             else:
                 raise ValueError, \
                     "Datastore is missing configuration information."
 
 
+    def _get_codec(self, config, key, default):
+        "Return an (optional) compression codec from the configuration."
+        if not config.has_option(C.DATASTORE, key):
+            return default
+        codec = config.get(C.DATASTORE, key)
+        if not compression_available(codec):
+            raise ValueError, "Unsupported compression codec for %s: %s" % \
+                (key, codec)
+        return codec
+
+    def _compress(self, namespace, bits):
+        "Return the form of 'bits' to be written to the data store."
+        return compress(self.compression.get(namespace, C.NONE), bits,
+                        self.compression_threshold)
+
     def _get_connection(self):
         return self.conndb[threading.currentThread().name]
 
     def register_threads(self, threads):
         "Register threads with the datastore module."
         for t in threads:
-            c = memcache.Client(self.membasehosts, debug=1)
+            c = memcache.Client(self.membasehosts, debug=1,
+                                socket_timeout=self.dbtimeout)
             self.conndb[t.name] = c
 
     def retrieve_element(self, namespace, key):
@@ -106,12 +178,47 @@ class DatastoreMembase(DatastoreBase):
         dskey = namespace[0].upper() + key
 
         db = self._get_connection()
-        wirebits = db.get(dskey)
+        return self._decode_element(namespace, key, db.get(dskey))
+
+    def retrieve_elements(self, namespace, keys):
+        """Return a mapping from keys to elements.
+
+        All elements are fetched using one multi-key request.
+        """
+
+        prefix = namespace[0].upper()
+        db = self._get_connection()
+        values = db.get_multi([prefix + k for k in keys])
+
+        elements = {}
+        for k in keys:
+            elements[k] = self._decode_element(namespace, k,
+                                               values.get(prefix + k))
+        return elements
+
+    @gen.coroutine
+    def aretrieve_elements(self, namespace, keys):
+        """Return a Future for a mapping from keys to elements.
+
+        All elements are fetched using one non-blocking request.
+        """
+
+        prefix = namespace[0].upper()
+        values = yield self.aclient.get_multi([prefix + k for k in keys])
+
+        elements = {}
+        for k in keys:
+            elements[k] = self._decode_element(namespace, k,
+                                               values.get(prefix + k))
+        raise gen.Return(elements)
+
+    def _decode_element(self, namespace, key, wirebits):
+        """Return the element in a wire representation, or None."""
 
         if wirebits is None:
             return None
         n = new_osm_element(namespace, key)
-        n.from_mapping(self.decode(wirebits))
+        n.from_mapping(self.decode(decompress(wirebits)))
         return n
 
     def store_element(self, namespace, key, value):
@@ -121,49 +228,276 @@ class DatastoreMembase(DatastoreBase):
 
         dskey = namespace[0].upper() + key
         db = self._get_connection()
-        db.set(dskey, self.encode(value.as_mapping()))
+        db.set(dskey, self._compress(namespace,
+                                     self.encode(value.as_mapping())))
 
     def retrieve_slab(self, namespace, slabkey):
-        """Return a slab of elements."""
+        """Return a slab of elements.
+
+        Elements stored outside the slab are fetched using one
+        multi-key request."""
 
         db = self._get_connection()
-        wirebits = db.get(slabkey)
+        slabs, indirect = self._parse_slabs(namespace,
+                                            {slabkey: db.get(slabkey)})
+        elements = db.get_multi(indirect) if indirect else {}
+        return self._assemble_slab(namespace, slabkey, slabs.get(slabkey),
+                                   elements)
+
+    def retrieve_slabs(self, namespace, slabkeys):
+        """Return an iterator over (slabkey, slab) pairs.
+
+        All slabs are fetched using one multi-key request, followed by
+        one request for the elements that the slabs hold indirectly.
+        Elements are decoded when they are first retrieved from a
+        slab.
+        """
 
-        if wirebits is None:
-            return None
+        db = self._get_connection()
+        slabs, indirect = self._parse_slabs(namespace,
+                                            db.get_multi(slabkeys))
+        elements = db.get_multi(indirect) if indirect else {}
 
-        slab = []
-        for (st, kv) in self.decode(wirebits):
-            if st == C.SLAB_NOT_PRESENT:
-                continue
+        for sk in slabkeys:
+            yield (sk, self._assemble_slab(namespace, sk, slabs.get(sk),
+                                           elements))
 
-            if st == C.SLAB_INDIRECT:
-                elem = self.retrieve_element(namespace, kv)
-                assert elem is not None, "Missing indirect element"
-            elif st == C.SLAB_INLINE:
-                elem = new_osm_element(namespace, kv[C.ID])
-                elem.from_mapping(kv)
-            else:
-                assert False, "Unknown status %d" % status
-            slab.append((elem.id, elem))
+    @gen.coroutine
+    def aretrieve_slabs(self, namespace, slabkeys):
+        """Return a Future for a mapping from slab keys to slabs.
+
+        All slabs are fetched using one non-blocking request, followed
+        by one for the elements that the slabs hold indirectly.
+        """
+
+        values = yield self.aclient.get_multi(slabkeys)
+        slabs, indirect = self._parse_slabs(namespace, values)
+        if indirect:
+            elements = yield self.aclient.get_multi(indirect)
+        else:
+            elements = {}
+
+        raise gen.Return(dict([(sk, self._assemble_slab(namespace, sk,
+                                                        slabs.get(sk),
+                                                        elements))
+                               for sk in slabkeys]))
 
-        return slab
+    def _parse_slabs(self, namespace, values):
+        """Parse the wire representations of slabs.
+
+        Return a mapping from slab keys to parsed slabs, and the
+        datastore keys of the elements held outside these slabs."""
+
+        prefix = namespace[0].upper()
+        slabs = {}
+        indirect = []
+        for (sk, wirebits) in values.items():
+            if wirebits is None:
+                continue
+            if namespace in DatastoreMembase.INDEX_NAMESPACES:
+                slabs[sk] = self._parse_index_slab(namespace, sk,
+                                                   decompress(wirebits))
+                continue
+            slab = self._parse_slab(namespace, decompress(wirebits))
+            slabs[sk] = slab
+            indirect.extend([prefix + k for k in slab[3]])
+        return (slabs, indirect)
+
+    def _parse_slab(self, namespace, wirebits):
+        """Return (wirebits, reader, handles, indirect) for a slab.
+
+        A slab is written as an index, a newline, and the wire
+        representations of its inline elements, one after another.
+        The index is a list of (status, key, length) entries for the
+        elements present in the slab.  Compressed slabs, and slabs
+        using the binary and protobuf encodings, are recognized by
+        their leading bytes; the elements of these are read using a
+        'reader'.  Slabs written in the original format are a list of
+        (status, element) pairs.
+
+        'handles' is a list of (key, handle) pairs for the inline
+        elements of the slab, and 'indirect' lists the keys of the
+        elements stored outside the slab."""
+
+        if is_binary_slab(wirebits):
+            reader = BinarySlab(wirebits)
+        elif wirebits.startswith(PROTOBUF_SLAB_MAGIC):
+            reader = ProtobufSlab(wirebits)
+        else:
+            reader = None
+        if reader is not None:
+            return (wirebits, reader,
+                    [(k, slot) for (slot, k) in enumerate(reader.ids)],
+                    reader.indirect)
+
+        handles = []
+        indirect = []
+        newline = wirebits.find("\n")
+        if newline < 0:
+            for (st, kv) in self.decode(wirebits):
+                if st == C.SLAB_INLINE:
+                    handles.append((kv[C.ID], kv))
+                elif st == C.SLAB_INDIRECT:
+                    indirect.append(kv)
+                else:
+                    assert st == C.SLAB_NOT_PRESENT, "Unknown status %d" % st
+            return (wirebits, None, handles, indirect)
+
+        offset = newline + 1
+        for (st, key, length) in self.decode(wirebits[:newline]):
+            if st == C.SLAB_INLINE:
+                handles.append((key, (offset, length)))
+                offset += length
+            elif st == C.SLAB_INDIRECT:
+                indirect.append(key)
+            else:
+                assert False, "Unknown status %d" % st
+        return (wirebits, None, handles, indirect)
+
+    def _parse_index_slab(self, namespace, slabkey, wirebits):
+        """Return the (id, slab key) items of an index slab.
+
+        An index slab is a JSON mapping holding the distinct slab keys
+        that it refers to ('slabkeys'), and a flat list of (offset,
+        count, position) triples ('runs'), each of which maps 'count'
+        consecutive ids to the slab key at 'position'."""
+
+        start = slabutil_key_to_start_index(namespace, slabkey)
+        index = decode_json(wirebits)
+        slabkeys = [str(sk) for sk in index['slabkeys']]
+        runs = index['runs']
+        items = []
+        for i in xrange(0, len(runs), 3):
+            offset, count, position = runs[i:i+3]
+            sk = slabkeys[position]
+            items.extend([(str(start + offset + n), sk)
+                          for n in xrange(count)])
+        return items
+
+    def _assemble_slab(self, namespace, slabkey, slab, elements):
+        """Return a slab, given its parsed form.
+
+        'elements' maps datastore keys to the wire representations of
+        the elements held outside the slab.  Elements missing from
+        'elements' are logged, and reported as not present.  The
+        slab's elements are vivified when they are first retrieved."""
+
+        if slab is None or isinstance(slab, list):
+            return slab
+        wirebits, reader, handles, indirect = slab
+        if indirect:
+            prefix = namespace[0].upper()
+            handles = handles[:]
+            for k in indirect:
+                elembits = elements.get(prefix + k)
+                if elembits is None:
+                    logging.warning("Slab %s: element %s is missing.",
+                                    slabkey, prefix + k)
+                    continue
+                handles.append((k, elembits))
+        if not handles:
+            return []
+        return slabutil_make_lazy_slab(namespace, wirebits, handles,
+                                       functools.partial(
+                                           self._vivify_slab_element,
+                                           namespace, reader),
+                                       slabkey)
+
+    def _vivify_slab_element(self, namespace, reader, wirebits, handle):
+        """Return an element of a slab, given its handle.
+
+        Handles are slot numbers for slabs read using a 'reader',
+        (offset, length) pairs for inline elements, mappings for
+        elements of slabs in the original format, and the wire
+        representation of elements stored outside the slab."""
+
+        if isinstance(handle, int):
+            kv = reader.mapping(handle)
+        elif isinstance(handle, tuple):
+            offset, length = handle
+            kv = self.decode(wirebits[offset:offset + length])
+        elif isinstance(handle, dict):
+            kv = handle
+        else:
+            kv = self.decode(decompress(handle))
+        elem = new_osm_element(namespace, kv[C.ID])
+        elem.from_mapping(kv)
+        return elem
 
     def store_slab(self, namespace, slabkey, slabelems):
-        """Store a slab's worth of contents."""
+        """Store a slab's worth of contents.
+
+        Elements whose wire representation is larger than the inline
+        size configured for the namespace are stored under their own
+        keys, and the slab only records their keys.  The keys of
+        elements that were stored separately and now fit inline are
+        deleted."""
 
-        _, nperslab = slabutil_get_config(namespace)
-        assert len(slabelems) == nperslab
+        if namespace in DatastoreMembase.INDEX_NAMESPACES:
+            return self._store_index_slab(namespace, slabkey, slabelems)
 
-        slab = []
+        inlinesize, nperslab = slabutil_get_config(namespace)
+        assert slabutil_use_geo_slab(namespace) or \
+            len(slabelems) == nperslab
+
+        db = self._get_connection()
+        prefix = namespace[0].upper()
+
+        _, previous = self._parse_slabs(namespace,
+                                        {slabkey: db.get(slabkey)})
+
+        inline = []
+        indirect = []
         for (st, e) in slabelems.items():
-            if st:
-                # Todo ... INDIRECT elements.
-                slab.append((C.SLAB_INLINE, e.as_mapping()))
+            if not st:
+                continue
+            m = e.as_mapping()
+            bits = self.encode(m)
+            if len(bits) > inlinesize:
+                db.set(prefix + e.id, self._compress(namespace, bits))
+                indirect.append(e.id)
+            else:
+                inline.append((m, bits))
+
+        if self.encode is encode_binary:
+            rawbits = encode_binary_slab([m for (m, _) in inline], indirect)
+        elif self.encode is encode_protobuf:
+            rawbits = encode_protobuf_slab([m for (m, _) in inline],
+                                           indirect)
+        else:
+            index = [(C.SLAB_INLINE, m[C.ID], len(bits))
+                     for (m, bits) in inline]
+            index.extend([(C.SLAB_INDIRECT, k, 0) for k in indirect])
+            rawbits = self.encode(index) + "\n" + \
+                "".join([bits for (_, bits) in inline])
+
+        db.set(slabkey, self._compress(namespace, rawbits))
+
+        stale = set(previous) & set([prefix + m[C.ID] for (m, _) in inline])
+        if stale:
+            db.delete_multi(list(stale))
+
+    def _store_index_slab(self, namespace, slabkey, slabelems):
+        "Store an index slab; see '_parse_index_slab()'."
+
+        slabkeys = []
+        positions = {}
+        runs = []
+        for (offset, (st, sk)) in enumerate(slabelems.items()):
+            if not st:
+                continue
+            position = positions.get(sk)
+            if position is None:
+                position = positions[sk] = len(slabkeys)
+                slabkeys.append(sk)
+            if runs and runs[-3] + runs[-2] == offset and \
+                    runs[-1] == position:
+                runs[-2] += 1
+            else:
+                runs.extend([offset, 1, position])
 
-        rawbits = self.encode(slab)
         db = self._get_connection()
-        db.set(slabkey, rawbits)
+        db.set(slabkey, encode_json({'slabkeys': slabkeys, 'runs': runs}))
 
     def initialize(self):
         "Initialize the database."
@@ -173,5 +507,27 @@ class DatastoreMembase(DatastoreBase):
         # Save the current slab configuration.
         self.store_element(C.DATASTORE_CONFIG, C.CFGSLAB, self.slabconfig)
 
+    def close(self):
+        "Close connections to the data store."
+        DatastoreBase.close(self)
+        self.aclient.close()
+        for db in self.conndb.values():
+            db.disconnect_all()
+
+    def finalize(self):
+        """Write back caches, and record a new generation for the data
+        store.
+
+        Front ends flush the responses that they have cached when the
+        generation changes."""
+        DatastoreBase.finalize(self)
+        if not self.writeback:
+            return
+        slabconfig = self.retrieve_element(C.DATASTORE_CONFIG, C.CFGSLAB)
+        if slabconfig is None:
+            slabconfig = self.slabconfig
+        slabconfig[C.GENERATION] = uuid.uuid4().hex
+        self.store_element(C.DATASTORE_CONFIG, C.CFGSLAB, slabconfig)
+
 
 Datastore = DatastoreMembase
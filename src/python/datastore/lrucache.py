@@ -28,10 +28,17 @@
 """
 
 import collections
+import itertools
+import sys
 import threading
+import time
 import types
 
-from .slabutil import slabutil_make_slabkey
+import apiserver.const as C
+from .slabutil import slabutil_make_slabkey, slabutil_use_geo_slab
+
+# Offsets of the fields in a BoundedLRUBuffer link.
+_PREV, _NEXT, _KEY, _VALUE, _WEIGHT = 0, 1, 2, 3, 4
 
 class BoundedLRUBuffer(collections.MutableMapping):
     """A bounded buffer with least-recently-used semantics.
@@ -82,71 +89,91 @@ class BoundedLRUBuffer(collections.MutableMapping):
     >>> b.flush()
     >>> len(b)
     0
+
+    If a 'weigher' function is specified, the bound applies to the
+    sum of 'weigher(value)' over the values in the buffer instead of
+    to the number of entries.  The most recently stored entry is never
+    ejected, even if its weight alone exceeds the bound.
+
+    >>> b = BoundedLRUBuffer(bound=4096, weigher=len)
+    >>> b['key'] = 'value'
+    >>> b.weight
+    5
     """
 
     # Methods implementing the mapping protocol.
 
-    def __init__(self, bound=65536, callback=None):
+    def __init__(self, bound=65536, callback=None, weigher=None):
 
-        assert type(bound) is types.IntType
+        assert type(bound) in (types.IntType, types.LongType)
         self.bound = bound      # Max size.
 
         self.callback = callback
-        self.indices = {}       # Map of keys to indices
-        self.values = {}        # Map of indices to values.
-        self.count = 0          # The number of entries in the buffer.
-        self.first = -1          # Smallest index in use.
-        self.next = 0  # Next index to use.
+        self.weigher = weigher
+        self.weight = 0         # Current size.
+
+        # Entries are kept on a circular doubly-linked list running
+        # from the least recently used entry (root[_NEXT]) to the most
+        # recently used one (root[_PREV]).  Each link is a list of the
+        # form [prev, next, key, value, weight].
+        self.links = {}         # Map of keys to links.
+        self.root = root = []
+        root[:] = [root, root, None, None, 0]
 
     def __str__(self):
         return "BoundedLRUBuffer(%d){%s}" % \
-            (self.bound, ",".join(self.indices.keys()))
+            (self.bound, ",".join(self.links.keys()))
 
     def __contains__(self, key):
-        return key in self.indices
+        return key in self.links
 
     def __delitem__(self, key):
-        index = self.indices[key]
-        self._remove(index)
+        link = self.links.pop(key)
+        self._unlink(link)
+        self.weight -= link[_WEIGHT]
 
     def __getitem__(self, key):
         """Retrieve the item named by 'key' from the buffer.
 
         The value returned is pushed to the head of the buffer."""
 
-        entry_index = self.indices[key]
-
-        (_, entry) = self._remove(entry_index)
+        link = self.links[key]
+        self._unlink(link)
+        self._append(link)
 
-        next_index = self._next_index(entry_index)
-        self._insert(key, entry, next_index)
-
-        return entry
+        return link[_VALUE]
 
     def __iter__(self):
-        return iter(self.indices)
+        return iter(self.links)
 
     def __len__(self):
         "Compute the number of items in the buffer."
-        v = self.count
-        assert v == len(self.indices)
-        assert v == len(self.values)
-        return v
+        return len(self.links)
 
     def __setitem__(self, key, value):
         """Store an item indexed by argument 'key'."""
 
-        if key in self.indices:
-            index = self.indices[key]
-            self._remove(index)
+        if self.weigher:
+            weight = self.weigher(value)
         else:
-            index = None
-        next_index = self._next_index(index)
-        self._insert(key, value, next_index)
-        ejected = self._maybe_eject()
+            weight = 1
 
-        if self.callback and ejected is not None:
-            self.callback(*ejected)
+        link = self.links.get(key)
+        if link is None:
+            link = [None, None, key, value, weight]
+            self.links[key] = link
+        else:
+            self._unlink(link)
+            self.weight -= link[_WEIGHT]
+            link[_VALUE] = value
+            link[_WEIGHT] = weight
+        self._append(link)
+        self.weight += weight
+
+        while self.weight > self.bound and self.root[_NEXT] is not link:
+            ejected = self._pop()
+            if self.callback:
+                self.callback(*ejected)
 
     def pop(self):
         "Return the first item in the LRU buffer."
@@ -154,78 +181,246 @@ class BoundedLRUBuffer(collections.MutableMapping):
         return (k, v)
 
 
-    # Additional method.
+    # Additional methods.
 
     def flush(self):
         "Write back the contents of the LRU buffer."
-        while self.count > 0:
+        while len(self.links) > 0:
             k, v = self._pop()
             if self.callback:
                 self.callback(k, v)
 
+    def oldest(self):
+        "Return the least recently used key, without removing it."
+        link = self.root[_NEXT]
+        if link is self.root:
+            raise IndexError, "oldest from empty buffer"
+        return link[_KEY]
+
+    def peek(self, key):
+        "Retrieve the value for 'key' without marking it as used."
+        return self.links[key][_VALUE]
+
+    def replace(self, key, value):
+        """Change the value for 'key' without marking it as used.
+
+        No ejections are performed."""
+        link = self.links[key]
+        if self.weigher:
+            weight = self.weigher(value)
+            self.weight += weight - link[_WEIGHT]
+            link[_WEIGHT] = weight
+        link[_VALUE] = value
+
 
     # Internal helper functions.
 
-    def _insert(self, key, value, lru):
-        "Insert a key/value pair at the specified LRU index."
-        self.values[lru] = (key, value)
-        self.indices[key] = lru
-        self.count += 1
-
-    def _remove(self, index):
-        "Remove the entry for key 'key'."
-        key, value = self.values.pop(index)
-        assert index == self.indices[key]
-        self.indices.pop(key)
-        self.count -= 1
-        return (key, value)
-
-    def _maybe_eject(self):
-        if self.count <= self.bound:
-            return None
+    def _append(self, link):
+        "Link an entry in at the most recently used end of the list."
+        root = self.root
+        last = root[_PREV]
+        link[_PREV] = last
+        link[_NEXT] = root
+        last[_NEXT] = root[_PREV] = link
 
-        # Find the least recently used item.
-        while self.first < self.next and not (self.first in self.values):
-            self.first += 1
-        assert self.first < self.next, "Empty buffer"
-        return self._remove(self.first)
-
-    def _next_index(self, index=None):
-        "Compute an optimal index number for storing an element."
-        # Optimize the case where we overwrite the most recently added
-        # value.
-        if index is not None and index == self.next - 1:
-            return index
-        index = self.next
-        self.next += 1
-        return index
+    def _unlink(self, link):
+        "Remove an entry from the list."
+        prev, next = link[_PREV], link[_NEXT]
+        prev[_NEXT] = next
+        next[_PREV] = prev
 
     def _pop(self):
-        "Helper function."
-        # First the first index
-        while not (self.first in self.values) and \
-                self.first < self.next:
-            self.first += 1
-        # Look for an empty buffer.
-        if self.first == self.next:
+        "Remove and return the least recently used key/value pair."
+        link = self.root[_NEXT]
+        if link is self.root:
             raise IndexError, "pop from empty buffer"
-        return self._remove(self.first)
+        self._unlink(link)
+        del self.links[link[_KEY]]
+        self.weight -= link[_WEIGHT]
+        return (link[_KEY], link[_VALUE])
+
+
+class TwoQueueBuffer(collections.MutableMapping):
+    """A bounded buffer using the scan-resistant '2Q' replacement policy.
+
+    The buffer has the same interface as 'BoundedLRUBuffer'.
+
+    New keys enter a first-in, first-out queue ('A1in') holding about
+    a quarter of the buffer.  Keys ejected from 'A1in' are remembered,
+    without their values, in a 'ghost' queue ('A1out').  Only keys
+    that are stored again while in the ghost queue enter the main LRU
+    queue ('Am').  A one-time scan over many keys thus only flushes
+    'A1in', and leaves the frequently used keys in 'Am' alone.
+
+    See: T. Johnson and D. Shasha, "2Q: A Low Overhead High Performance
+    Buffer Management Replacement Algorithm", VLDB 1994.
+
+    >>> b = TwoQueueBuffer(bound=16, callback=None)
+    >>> b['key'] = 'value'
+    >>> b['key']
+    'value'
+    """
+
+    KIN = 0.25                  # Fraction of the bound used by 'A1in'.
+    KOUT = 0.5                  # Ghost entries, relative to entries held.
+
+    def __init__(self, bound=65536, callback=None, weigher=None):
+        self.bound = bound
+        self.callback = callback
+        self.weigher = weigher
+        self.kin = max(1, int(bound * TwoQueueBuffer.KIN))
+        self.a1in = BoundedLRUBuffer(sys.maxint, None, weigher)
+        self.a1out = BoundedLRUBuffer(sys.maxint)
+        self.am = BoundedLRUBuffer(sys.maxint, None, weigher)
+
+    def __str__(self):
+        return "TwoQueueBuffer(%d){%s}" % (self.bound, ",".join(self))
+
+    def __contains__(self, key):
+        return key in self.am or key in self.a1in
+
+    def __delitem__(self, key):
+        if key in self.am:
+            del self.am[key]
+        else:
+            del self.a1in[key]
+
+    def __getitem__(self, key):
+        if key in self.am:
+            return self.am[key]
+        return self.a1in.peek(key)  # 'A1in' is not reordered by hits.
+
+    def __iter__(self):
+        return itertools.chain(self.a1in, self.am)
+
+    def __len__(self):
+        return len(self.a1in) + len(self.am)
+
+    def __setitem__(self, key, value):
+        if key in self.am:
+            self.am[key] = value
+        elif key in self.a1in:
+            self.a1in.replace(key, value)
+        elif key in self.a1out:
+            del self.a1out[key]
+            self.am[key] = value
+        else:
+            self.a1in[key] = value
+        self._reclaim(key)
+
+    def _get_weight(self):
+        return self.a1in.weight + self.am.weight
+    weight = property(_get_weight)
+
+    def pop(self):
+        "Return the next item to be ejected from the buffer."
+        if len(self.a1in):
+            return self.a1in.pop()
+        return self.am.pop()
+
+    def flush(self):
+        "Write back the contents of the buffer."
+        for q in [self.a1in, self.am]:
+            while len(q) > 0:
+                k, v = q.pop()
+                if self.callback:
+                    self.callback(k, v)
+        self.a1out = BoundedLRUBuffer(sys.maxint)
+
+    def _reclaim(self, key):
+        "Eject entries till the buffer fits, sparing 'key'."
+        while self.weight > self.bound:
+            if len(self.a1in) and (self.a1in.weight > self.kin or
+                                   len(self.am) == 0) and \
+                    self.a1in.oldest() != key:
+                k, v = self.a1in.pop()
+                self.a1out[k] = None
+                kout = max(16, int(len(self) * TwoQueueBuffer.KOUT))
+                while len(self.a1out) > kout:
+                    self.a1out.pop()
+            elif len(self.am) and self.am.oldest() != key:
+                k, v = self.am.pop()
+            else:
+                break
+            if self.callback:
+                self.callback(k, v)
+
 
+# Buffer implementations, indexed by configuration name.
+_POLICIES = {
+    C.LRU: BoundedLRUBuffer,
+    C.TWOQ: TwoQueueBuffer
+    }
+
+def _slab_footprint(slabdesc):
+    "Weigh a slab descriptor by its approximate size in bytes."
+    return slabdesc.footprint
 
 class LRUCache:
-    """...description here..."""
+    """A cache of slabs, with least-recently-used overflow.
+
+    By default the cache holds at most 'bound' slabs.  If 'bytebound'
+    is non-zero, the cache instead holds slabs whose combined
+    footprint (see 'slabutil_footprint()') is at most 'bytebound'
+    bytes.
+
+    'nsbytebounds' optionally maps namespaces to byte budgets.  Slabs
+    in these namespaces are kept in a separate LRU partition of the
+    given size, and do not compete with slabs in other namespaces.
+
+    'policy' names the replacement policy used: one of "lru"
+    (least-recently-used) or "2q" (see 'TwoQueueBuffer').
+
+    Up to 'negbound' slabs may be remembered as being absent from the
+    data store (see 'insert_negative()').  Lookups of keys in these
+    slabs return a 'not present' status.  Slabs keyed by location
+    cannot be found from an element's key, and are checked with
+    'check_negative()' instead.  If 'negttl' is non-zero, such
+    entries expire after 'negttl' seconds.  The number of lookups
+    answered 'not present' by the cache is kept in 'negative_hits'.
+
+    If 'trace' is set to a file object, the key of each slab looked up
+    is written to it, one per line.
+    """
 
-    def __init__(self, bound=65536, callback=None):
+    def __init__(self, bound=65536, callback=None, bytebound=0,
+                 nsbytebounds=None, policy=C.LRU, negbound=0, negttl=0):
+        try:
+            buffertype = _POLICIES[policy]
+        except KeyError:
+            raise ValueError, "Unknown cache policy: %s" % policy
         self.bound = bound
-        self.lru_cache = BoundedLRUBuffer(bound, self._lrucb)
+        self.bytebound = bytebound
+        if bytebound:
+            self.lru_cache = buffertype(bytebound, self._lrucb,
+                                        _slab_footprint)
+        else:
+            self.lru_cache = buffertype(bound, self._lrucb)
+        self.lru_partitions = {}
+        if nsbytebounds:
+            for (ns, nsbound) in nsbytebounds.items():
+                self.lru_partitions[ns] = buffertype(nsbound, self._lrucb,
+                                                     _slab_footprint)
+        self.trace = None
         self.lru_key = {}
+        self.footprints = {}    # Map of slab keys to accounted sizes.
+        self.nsbytes = collections.defaultdict(int)
         self.callback = callback
+        self.negbound = negbound
+        self.negttl = negttl
+        self.negative = BoundedLRUBuffer(max(negbound, 1)) # Expiry times.
+        self.negative_hits = 0
+        self.clock = time.time
 
     def __len__(self):
         return len(self.lru_key)
 
+    def _buffer(self, namespace):
+        "Return the LRU buffer holding slabs for a namespace."
+        return self.lru_partitions.get(namespace, self.lru_cache)
+
     def _lrucb(self, slabkey, slabdesc):
-        assert slabkey not in self.lru_cache
+        assert slabkey not in self._buffer(slabdesc.namespace)
         self._remove_slab_items(slabdesc)
         if self.callback:
             self.callback(slabkey, slabdesc)
@@ -234,15 +429,31 @@ class LRUCache:
         ns = slabdesc.namespace
         for k in slabdesc.keys():
             del self.lru_key[(ns,k)]
+        self.nsbytes[ns] -= self.footprints.pop(slabdesc.slabkey)
 
     def get(self, namespace, key):
         try:
             lrukey = self.lru_key[(namespace,key)]
         except KeyError:        # No such slab.
+            if self.trace or len(self.negative):
+                slabkey = slabutil_make_slabkey(namespace, key)
+                if self.trace:
+                    self.trace.write(slabkey + "\n")
+                if not slabutil_use_geo_slab(namespace) and \
+                        self.check_negative(slabkey):
+                    return (False, key)
             return None
-        slabdesc = self.lru_cache.get(lrukey)
+        if self.trace:
+            self.trace.write(lrukey + "\n")
+        slabdesc = self._buffer(namespace).get(lrukey)
         if slabdesc:
-            return slabdesc.get(key) # Get item in the slab.
+            footprint = slabdesc.footprint
+            v = slabdesc.get(key) # Get item in the slab.
+            if slabdesc.footprint != footprint: # Item was created.
+                self.resize_slab(slabdesc)
+            if not v[0]:        # Absent from a present slab.
+                self.negative_hits += 1
+            return v
         else:
             return (False, key) # No such slab.
 
@@ -252,53 +463,188 @@ class LRUCache:
             slabkey = self.lru_key[(namespace, key)]
         except KeyError:
             return None
-        return self.lru_cache[slabkey]
+        return self._buffer(namespace)[slabkey]
+
+    def check_negative(self, slabkey):
+        """Return True if a slab is known to be absent from the data store.
+
+        Such lookups are counted in 'negative_hits'."""
+        if self._is_negative(slabkey):
+            self.negative_hits += 1
+            return True
+        return False
+
+    def _is_negative(self, slabkey):
+        "Return True if a slab is known to be absent from the data store."
+        try:
+            expiry = self.negative[slabkey]
+        except KeyError:
+            return False
+        if expiry and expiry <= self.clock():
+            del self.negative[slabkey]
+            return False
+        return True
 
+    def insert_negative(self, slabkey):
+        "Remember that a slab is absent from the data store."
+        if self.negbound:
+            self.negative[slabkey] = self.negttl and self.clock() + self.negttl
+
+    def lookup_slab(self, namespace, slabkey):
+        "Return the slab descriptor for a slab key, or None."
+        return self._buffer(namespace).get(slabkey)
+
+    def bytes_by_namespace(self):
+        "Return the approximate bytes held by the cache, per namespace."
+        return dict((ns, v) for (ns, v) in self.nsbytes.items() if v)
 
     def insert_slab(self, slabdesc):
         "Insert items from a slab."
         slabkey = slabdesc.slabkey
-        if slabkey in self.lru_cache:
-            raise ValueError, "Duplicate insertion of slab: %s" % str(slabkey)
-        self.lru_cache[slabkey] = slabdesc
         ns = slabdesc.namespace
+        lru = self._buffer(ns)
+        if slabkey in lru:
+            raise ValueError, "Duplicate insertion of slab: %s" % str(slabkey)
+        if slabkey in self.negative:
+            del self.negative[slabkey]
+        self.footprints[slabkey] = slabdesc.footprint
+        self.nsbytes[ns] += slabdesc.footprint
+        lru[slabkey] = slabdesc
         for k in slabdesc.keys():
             itemkey = (ns,k)
             if itemkey in self.lru_key:
                 raise KeyError, "Duplicate insertion of (%s,%s)" % (ns,k)
             self.lru_key[itemkey] = slabkey
 
+    def add_slab_key(self, slabdesc, key):
+        "Record that an item has been added to a cached slab."
+        self.lru_key[(slabdesc.namespace, key)] = slabdesc.slabkey
+
+    def resize_slab(self, slabdesc):
+        """Re-account for a slab whose contents have changed.
+
+        The slab becomes the most recently used one in its partition."""
+        slabkey = slabdesc.slabkey
+        ns = slabdesc.namespace
+        self.nsbytes[ns] += slabdesc.footprint - self.footprints[slabkey]
+        self.footprints[slabkey] = slabdesc.footprint
+        self._buffer(ns)[slabkey] = slabdesc
+
     def remove_slab(self, slabdesc):
         "Remove a slab from the cache."
 
         slabkey = slabdesc.slabkey
-        assert slabkey in self.lru_cache
+        lru = self._buffer(slabdesc.namespace)
+        assert slabkey in lru
         self._remove_slab_items(slabdesc)
-        del self.lru_cache[slabkey]
+        del lru[slabkey]
 
     def flush(self):
         "Flush the contents of the cache."
 
         self.lru_cache.flush()
+        for lru in self.lru_partitions.values():
+            lru.flush()
+        self.negative.flush()
 
         assert len(self.lru_cache) == 0
         assert len(self.lru_key) == 0
 
+    def discard(self):
+        """Drop the contents of the cache without writing them back.
+
+        Used by readers once the data store has been reloaded."""
+        for lru in [self.lru_cache] + self.lru_partitions.values():
+            for slabkey in list(lru):
+                self.remove_slab(lru[slabkey])
+        self.negative.flush()
+
+        assert len(self.lru_key) == 0
+
+
+class KeyedWaitTable:
+    """Track keys that have an operation (such as an I/O) in progress.
+
+    Each busy key has its own latch (a lock held while the key is
+    busy), so a thread waiting for one key is only woken up when the
+    operation on that key completes.
+
+    >>> t = KeyedWaitTable()
+    >>> t.begin('key')          # Mark 'key' as busy.
+    True
+    >>> 'key' in t
+    True
+    >>> t.end('key')            # Wakes up threads in t.wait('key').
+
+    A result may be passed to 'end()'; it is returned to the threads
+    that were waiting for the key.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latches = {}       # Map of busy keys to [latch, result].
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.latches
+
+    def __len__(self):
+        with self.lock:
+            return len(self.latches)
+
+    def acquire(self, key):
+        "Wait till 'key' is not busy, and then mark it busy."
+        while not self.begin(key):
+            self.wait(key)
+
+    def begin(self, key):
+        """Mark 'key' as busy.
+
+        Returns False if the key was already busy."""
+        with self.lock:
+            if key in self.latches:
+                return False
+            latch = threading.Lock()
+            latch.acquire()
+            self.latches[key] = [latch, None]
+            return True
+
+    def end(self, key, result=None):
+        "Mark 'key' as no longer busy, waking up its waiters."
+        with self.lock:
+            entry = self.latches.pop(key)
+        entry[1] = result
+        entry[0].release()
+
+    def wait(self, key):
+        """Wait till 'key' is not busy.
+
+        Returns the result passed to 'end()', or None if the key was
+        not busy."""
+        with self.lock:
+            entry = self.latches.get(key)
+        if entry is None:
+            return None
+        latch = entry[0]
+        latch.acquire()         # Waiters wake each other in turn.
+        latch.release()
+        return entry[1]
+
 
 class LRUIOCache(LRUCache):
      """An LRU cache that tracks I/O-in-flight progress of items."""
 
-     def __init__(self, bound=65536, callback=None):
-         LRUCache.__init__(self, bound, self._iocb)
+     def __init__(self, bound=65536, callback=None, bytebound=0,
+                  nsbytebounds=None, policy=C.LRU, negbound=0, negttl=0):
+         LRUCache.__init__(self, bound, self._iocb, bytebound, nsbytebounds,
+                           policy, negbound, negttl)
          self.iocallback = callback
-         self.iocond = threading.Condition()
-         self.iopending = []
+         self.iopending = KeyedWaitTable()
 
      def _iocb(self, slabkey, slabdesc):
          assert slabkey == slabdesc.slabkey
-         with self.iocond:
-             assert slabkey not in self.iopending
-             self.iopending.append(slabkey)
+         started = self.iopending.begin(slabkey)
+         assert started, "I/O already pending for %s" % slabkey
          if self.iocallback:
              self.iocallback(slabkey, slabdesc)
 
@@ -309,22 +655,14 @@ class LRUIOCache(LRUCache):
          complete.
          """
          v = LRUCache.get(self, namespace, key)
-         if v is None:
-             slabkey = slabutil_make_slabkey(namespace, key)
-             with self.iocond:
-                 while slabkey in self.iopending:
-                     self.iocond.wait()
+         if v is None and len(self.iopending):
+             self.iopending.wait(slabutil_make_slabkey(namespace, key))
          return v
 
      def isiopending(self, slabkey):
          "Return True if I/O is pending on a slab."
-         with self.iocond:
-             status = slabkey in self.iopending
-         return status
+         return slabkey in self.iopending
 
      def iodone(self, slabkey):
          "Mark I/O on a slabkey as completed."
-         with self.iocond:
-             assert slabkey in self.iopending
-             self.iopending.remove(slabkey)
-             self.iocond.notifyAll()
+         self.iopending.end(slabkey)
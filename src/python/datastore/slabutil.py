@@ -20,29 +20,97 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-"""Utility functions used for managing slab based access."""
+"""Utility functions used for managing slab based access.
+
+Slabs are laid out in one of two ways:
+
+  - By element id ('id' layout): each slab holds a contiguous range
+    of element ids.
+  - By location ('geo' layout): nodes and ways are grouped by the
+    geohash cell they lie in (a way lies where its first node does),
+    and an index maps element ids to the keys of the slabs holding
+    them.  The index is itself held in id keyed slabs, in the
+    namespaces C.NODE_INDEX and C.WAY_INDEX.  Elements without a
+    location are grouped by element id.
+"""
 
 import collections
+import geohash
+import sys
 
 import apiserver.const as C
 
-__all__ = [ 'init_slabutil', 'slabutil_get_config', 'slabutil_group_keys',
-            'slabutil_key_to_start_index', 'slabutil_make_slabkey',
-            'slabutil_make_slab', 'slabutil_use_slab' ]
+__all__ = [ 'init_slabutil', 'slabutil_footprint', 'slabutil_get_config',
+            'slabutil_group_keys', 'slabutil_index_namespace', 'slabutil_init',
+            'slabutil_key_to_start_index', 'slabutil_make_geo_slabkey',
+            'slabutil_make_lazy_slab', 'slabutil_make_slabkey',
+            'slabutil_make_slab', 'slabutil_use_geo_slab',
+            'slabutil_use_slab' ]
 
 _slab_config = {}
+_measure_footprints = False     # Whether slabs track their sizes.
+
+# Slabs only need to know their sizes if the slab cache is bounded by
+# bytes (see 'LRUCache').
+_BYTE_BUDGETS = [C.SLAB_LRU_BYTES, C.GEODOCS_LRU_BYTES, C.NODES_LRU_BYTES,
+                 C.RELATIONS_LRU_BYTES, C.WAYS_LRU_BYTES]
+_geo_config = {}                # Namespace => (geohash length, scale).
+
+# The namespaces holding id indices for geographically keyed slabs.
+_INDEX_NAMESPACES = { C.NODE: C.NODE_INDEX, C.WAY: C.WAY_INDEX }
+_INDEX_PER_SLAB = 4096          # Index entries per index slab.
 
-def _make_numeric_slabkey(ns, nperslab, elemid):
+def _make_numeric_slabkey(ns, nperslab, elemid, kind='L'):
     slabno = (int(elemid) / nperslab) * nperslab
-    return "%sL%d" % (ns, slabno)
+    return "%s%s%d" % (ns, kind, slabno)
+
+def _slabkey_kind(namespace):
+    "Return the letter marking the slab keys of an id keyed namespace."
+    if namespace in _INDEX_NAMESPACES.values():
+        return 'X'
+    return 'L'
 
 def _make_nonnumeric_slabkey(ns, elemid):
     return "%sL%s" % (ns, elemid)
 
+def slabutil_footprint(obj):
+    """Return the approximate in-memory size of 'obj' in bytes.
+
+    Containers are walked recursively; strings shared between objects
+    are counted once per reference, so the result is an overestimate.
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for (k, v) in obj.iteritems():
+            size += slabutil_footprint(k) + slabutil_footprint(v)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += slabutil_footprint(v)
+    if hasattr(obj, '__dict__'):
+        size += slabutil_footprint(obj.__dict__)
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if not name.startswith('__') and hasattr(obj, name):
+                size += slabutil_footprint(getattr(obj, name))
+    return size
+
+def _footprint(obj):
+    "Return the footprint of a slab's item, if footprints are measured."
+    if _measure_footprints:
+        return slabutil_footprint(obj)
+    return 0
+
+def _sizeof(obj):
+    "Return the size of a slab's container, if footprints are measured."
+    if _measure_footprints:
+        return sys.getsizeof(obj)
+    return 0
+
 class _Slab:
     def __init__(self, namespace, slabkey):
         self.namespace = namespace
         self.slabkey = slabkey
+        self.footprint = 0      # Approximate size in bytes, or 0.
 
 
 class _AlphabeticKeySlab(_Slab):
@@ -51,6 +119,7 @@ class _AlphabeticKeySlab(_Slab):
         _Slab.__init__(self, namespace, slabkey)
         self._value = item
         self._key = key
+        self.footprint = _footprint(item)
 
     def __len__(self):
         return 1
@@ -77,9 +146,18 @@ class _NumericKeySlab(_Slab):
         if len(items) == 0 or not isinstance(items, list):
             raise ValueError, "items should be non-empty list."
         k, _ = items[0]
+        self._setup(namespace, k)
+        for (k,v) in items:
+            self._contents[self._index(k)] = v
+            self.footprint += _footprint(v)
+        self.footprint += _sizeof(self._contents)
+
+    def _setup(self, namespace, key):
+        "Prepare an empty slab for the slab holding 'key'."
         _, nperslab = _slab_config[namespace]
 
-        slabkey = _make_numeric_slabkey(namespace[0].upper(), nperslab, k)
+        slabkey = _make_numeric_slabkey(namespace[0].upper(), nperslab, key,
+                                        _slabkey_kind(namespace))
         start = slabutil_key_to_start_index(namespace, slabkey)
 
         _Slab.__init__(self, namespace, slabkey)
@@ -87,17 +165,19 @@ class _NumericKeySlab(_Slab):
         self._nperslab = nperslab
         self._start = start
         self._contents = [None] * nperslab
-        for (k,v) in items:
-            index = int(k)
-            if index >= start + nperslab:
-                raise ValueError, \
-                    "Index too large %s (start: %d, index: %d)" % \
-                    (slabkey, start, index)
-            index = index % nperslab
-            if self._contents[index]:
-                raise ValueError, \
-                    "Repeated insertion at %s:%d" % (slabkey, index)
-            self._contents[index] = v
+
+    def _index(self, key):
+        "Return the index for a new item with key 'key'."
+        index = int(key)
+        if index >= self._start + self._nperslab:
+            raise ValueError, \
+                "Index too large %s (start: %d, index: %d)" % \
+                (self.slabkey, self._start, index)
+        index = index % self._nperslab
+        if self._contents[index]:
+            raise ValueError, \
+                "Repeated insertion at %s:%d" % (self.slabkey, index)
+        return index
 
     def __len__(self):
         return len(self._contents)
@@ -127,10 +207,154 @@ class _NumericKeySlab(_Slab):
     def add(self, key, value):
         "Add an object at index."
         index = int(key) % self._nperslab
+        previous = self._contents[index]
+        if previous is value:   # Updated in place.
+            return
+        if previous is not None:
+            self.footprint -= _footprint(previous)
         self._contents[index] = value
+        self.footprint += _footprint(value)
+
+class _LazyNumericKeySlab(_NumericKeySlab):
+    """A slab whose items are created when they are first retrieved.
+
+    Items are described by handles, which are turned into items by a
+    'loader' function.  The loader is given the slab's 'data' (for
+    example, the wire representation of the slab) and a handle; the
+    data is released once all items have been created.
+    """
+
+    def __init__(self, namespace, data, handles, loader):
+        if len(handles) == 0 or not isinstance(handles, list):
+            raise ValueError, "handles should be non-empty list."
+        k, _ = handles[0]
+        self._setup(namespace, k)
+        self._data = data
+        self._loader = loader
+        self._pending = {}      # Map of indices to handles.
+        for (k, h) in handles:
+            index = self._index(k)
+            if index in self._pending:
+                raise ValueError, \
+                    "Repeated insertion at %s:%d" % (self.slabkey, index)
+            self._pending[index] = h
+        self.footprint = _sizeof(self._contents) + \
+            _sizeof(data) + _sizeof(self._pending) + \
+            len(handles) * _footprint(handles[0][1])
+
+    def _vivify(self, index):
+        "Create the item at 'index'."
+        data, loader = self._data, self._loader
+        handle = self._pending.get(index)
+        if handle is None or loader is None:
+            return              # Created by another thread.
+        item = loader(data, handle)
+        if self._pending.pop(index, None) is None:
+            return
+        self._contents[index] = item
+        self.footprint += _footprint(item)
+        if not self._pending:
+            self.footprint -= _sizeof(self._data)
+            self._data = self._loader = None
+
+    def items(self):
+        for index in self._pending.keys():
+            self._vivify(index)
+        return _NumericKeySlab.items(self)
+
+    def get(self, key):
+        "Retrieve an object from the slab, creating it if needed."
+        index = int(key) % self._nperslab
+        if index in self._pending:
+            self._vivify(index)
+        return _NumericKeySlab.get(self, key)
+
+    def add(self, key, value):
+        "Add an object at index."
+        self._pending.pop(int(key) % self._nperslab, None)
+        _NumericKeySlab.add(self, key, value)
+
+class _GeoKeySlab(_Slab):
+    """A slab holding the elements in a geohash cell.
+
+    Items are either supplied when the slab is created, or are
+    described by handles and created lazily, as for
+    '_LazyNumericKeySlab'.
+    """
+
+    def __init__(self, namespace, slabkey, items, data=None, handles=(),
+                 loader=None):
+        _Slab.__init__(self, namespace, slabkey)
+        self._contents = dict(items)
+        self._pending = dict(handles)
+        self._data = data
+        self._loader = loader
+        self.footprint = _sizeof(self._contents) + \
+            sum([_footprint(v) for v in self._contents.itervalues()])
+        if self._pending:
+            self.footprint += _sizeof(data) + \
+                _sizeof(self._pending) + \
+                len(handles) * _footprint(handles[0][1])
+        else:
+            self._data = self._loader = None
+
+    def _vivify(self, key):
+        "Create the item for 'key'."
+        data, loader = self._data, self._loader
+        handle = self._pending.get(key)
+        if handle is None or loader is None:
+            return              # Created by another thread.
+        item = loader(data, handle)
+        if self._pending.pop(key, None) is None:
+            return
+        self._contents[key] = item
+        self.footprint += _footprint(item)
+        if not self._pending:
+            self.footprint -= _sizeof(self._data)
+            self._data = self._loader = None
+
+    def __len__(self):
+        return len(self._contents) + len(self._pending)
+
+    def keys(self):
+        return self._contents.keys() + self._pending.keys()
+
+    def items(self):
+        for key in self._pending.keys():
+            self._vivify(key)
+        return [(True, v) for v in self._contents.values()]
+
+    def get(self, key):
+        "Retrieve an object from the slab, creating it if needed."
+        if key in self._pending:
+            self._vivify(key)
+        v = self._contents.get(key)
+        if v is not None:
+            return (True, v)
+        return (False, key)
+
+    def add(self, key, value):
+        "Add an object to the slab."
+        self._pending.pop(key, None)
+        previous = self._contents.get(key)
+        if previous is value:   # Updated in place.
+            return
+        if previous is not None:
+            self.footprint -= _footprint(previous)
+        self._contents[key] = value
+        self.footprint += _footprint(value)
 
 def init_slabutil(config):
-    "Initialize the module."
+    """Initialize the module.
+
+    Slab footprints are only measured if the configuration sets a
+    byte budget for the slab cache; they are 0 otherwise."""
+    global _measure_footprints
+    _measure_footprints = False
+    for k in _BYTE_BUDGETS:
+        if config.has_option(C.DATASTORE, k) and \
+                config.getint(C.DATASTORE, k) > 0:
+            _measure_footprints = True
     _slab_config[C.CHANGESET] = (
         config.getint(C.DATASTORE, C.CHANGESETS_INLINE_SIZE),
         config.getint(C.DATASTORE, C.CHANGESETS_PER_SLAB))
@@ -144,29 +368,83 @@ def init_slabutil(config):
         config.getint(C.DATASTORE, C.WAYS_INLINE_SIZE),
         config.getint(C.DATASTORE, C.WAYS_PER_SLAB))
 
+    for ns in _INDEX_NAMESPACES.values():
+        _slab_config.pop(ns, None)
+    _geo_config.clear()
+    if config.has_option(C.DATASTORE, C.SLAB_LAYOUT):
+        layout = config.get(C.DATASTORE, C.SLAB_LAYOUT)
+    else:
+        layout = C.ID
+    if layout == C.GEO:
+        ghlength = config.getint(C.DATASTORE, C.SLAB_GEOHASH_LENGTH)
+        scale = config.getint(C.DATASTORE, C.SCALE_FACTOR)
+        for (ns, indexns) in _INDEX_NAMESPACES.items():
+            _geo_config[ns] = (ghlength, scale)
+            _slab_config[indexns] = (0, _INDEX_PER_SLAB)
+    elif layout != C.ID:
+        raise ValueError, "Unknown slab layout: %s" % layout
+
+# The name used by the tests.
+slabutil_init = init_slabutil
+
 def slabutil_use_slab(namespace):
     "Return true of the given namespace uses slabs."
     return namespace in _slab_config
 
+def slabutil_use_geo_slab(namespace):
+    "Return true if the given namespace uses geographically keyed slabs."
+    return namespace in _geo_config
+
+def slabutil_index_namespace(namespace):
+    "Return the namespace of the id index for a geographically keyed one."
+    return _INDEX_NAMESPACES[namespace]
+
 def slabutil_make_slabkey(namespace, elemid):
-    "Prepare a slab key for a given element and namespace."
+    """Prepare a slab key for a given element and namespace.
+
+    The slab holding an element of a geographically keyed namespace
+    is only known from its location; the key returned is that of the
+    index slab for the element."""
     nsk = namespace[0].upper()
+    if namespace in _geo_config:
+        namespace = _INDEX_NAMESPACES[namespace]
     if _slab_config.has_key(namespace):
         _, nperslab = _slab_config[namespace]
-        return _make_numeric_slabkey(nsk, nperslab, elemid)
+        return _make_numeric_slabkey(nsk, nperslab, elemid,
+                                     _slabkey_kind(namespace))
     else:
         return _make_nonnumeric_slabkey(nsk, elemid)
 
+def slabutil_make_geo_slabkey(namespace, elemid, location):
+    """Return the key of the geographically keyed slab for an element.
+
+    'location' is the element's (lat, lon) pair, as scaled integers,
+    or None for elements without a location."""
+    nsk = namespace[0].upper()
+    if location is None:
+        _, nperslab = _slab_config[namespace]
+        return _make_numeric_slabkey(nsk, nperslab, elemid, 'U')
+    ghlength, scale = _geo_config[namespace]
+    lat, lon = location
+    lat = min(C.MAXGHLAT, float(lat) / scale)
+    return nsk + 'G' + geohash.encode(lat, float(lon) / scale,
+                                      precision=ghlength)
+
 def slabutil_group_keys(namespace, keys):
-    "Group keys according to slabs."
+    """Group keys according to slabs.
+
+    See 'slabutil_make_slabkey()' for geographically keyed namespaces."""
 
     slabset = collections.defaultdict(set)
     nsk = namespace[0].upper()
 
+    if namespace in _geo_config:
+        namespace = _INDEX_NAMESPACES[namespace]
     if slabutil_use_slab(namespace):
         _, nperslab = _slab_config[namespace]
+        kind = _slabkey_kind(namespace)
         for k in keys:
-            sk = _make_numeric_slabkey(nsk, nperslab, k)
+            sk = _make_numeric_slabkey(nsk, nperslab, k, kind)
             slabset[sk].add(k)
     else:
         for k in keys:
@@ -181,16 +459,38 @@ def slabutil_get_config(namespace):
 
 def slabutil_key_to_start_index(namespace, slabkey):
     """Return the start index of elements in a slab."""
-    assert slabkey[1] == 'L'
+    assert slabkey[1] in 'LX'
     if slabutil_use_slab(namespace):
         return int(slabkey[2:])
     else:
         return slabkey[2:]
 
-def slabutil_make_slab(namespace, items):
-    """Return a populated slab of the appropriate kind."""
+def slabutil_make_lazy_slab(namespace, data, handles, loader, slabkey=None):
+    """Return a slab whose items are created when first retrieved.
+
+    namespace -- the namespace for the slab; it should use slabs.
+    data      -- the data needed to create the slab's items.
+    handles   -- a non-empty list of (key, handle) pairs.
+    loader    -- a function returning the item for (data, handle).
+    slabkey   -- the slab's key, for geographically keyed slabs.
+    """
+
+    if namespace in _geo_config:
+        return _GeoKeySlab(namespace, slabkey, [], data, handles, loader)
+    return _LazyNumericKeySlab(namespace, data, handles, loader)
+
+def slabutil_make_slab(namespace, items, slabkey=None):
+    """Return a populated slab of the appropriate kind.
+
+    Geographically keyed slabs need their 'slabkey', and may be
+    empty."""
 
+    if namespace in _geo_config:
+        return _GeoKeySlab(namespace, slabkey, items)
     if slabutil_use_slab(namespace):
         return _NumericKeySlab(namespace, items)
     else:
-        return _AlphabeticKeySlab(namespace, items)
+        if len(items) != 1:
+            raise ValueError, "items should be a single (key, value) pair."
+        key, item = items[0]
+        return _AlphabeticKeySlab(namespace, key, item)
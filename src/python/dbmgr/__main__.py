@@ -76,6 +76,11 @@ def main():
                       help="Encoding for use for values [%default]"),
     parser.add_option('-I', '--init', dest='doinit', action='store_true',
                       default=False, help='(Re-)initialize the backend'),
+    parser.add_option('-L', '--layout', dest='slab_layout',
+                      metavar='LAYOUT', default=None, type="choice",
+                      choices=[C.ID, C.GEO],
+                      help="Slab layout: 'id' or 'geo' " +
+                      "[from configuration file]"),
     parser.add_option('-n', '--dryrun', dest='dryrun', metavar="BOOLEAN",
                       default=False, action="store_true",
                       help="Parse, but do not upload data [%default]")
@@ -109,6 +114,8 @@ def main():
         cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, options.datastore_encoding)
     if options.backend:
         cfg.set(C.DATASTORE, C.DATASTORE_BACKEND, options.backend)
+    if options.slab_layout:
+        cfg.set(C.DATASTORE, C.SLAB_LAYOUT, options.slab_layout)
 
     # Initialize statistics.
     init_statistics(cfg, options)
@@ -43,12 +43,17 @@ Usage:
 import geohash
 import collections
 import threading
+from operator import itemgetter
 from Queue import Queue
 
 import apiserver.const as C
 from apiserver.osmelement import new_osm_element
-from datastore.lrucache import BoundedLRUBuffer
-from datastore.ds_geohash import geohash_key_for_element
+from datastore.lrucache import BoundedLRUBuffer, KeyedWaitTable
+from datastore.ds_geohash import geohash_key_for_element, \
+    geohash_summary_lengths
+
+# The order of the nodes in a geodoc: by latitude, then longitude.
+_location_order = itemgetter(1, 2)
 
 class NodeGroup:
     '''A set of OSM nodes, and their coordinates.
@@ -76,9 +81,13 @@ class NodeGroup:
                 assert (lat, lon) == self.nodecoords[nid]
 
     def aslist(self):
-        '''Return the list representation of a nodegroup.'''
-        return [(nodeid, lat, lon) for (nodeid, (lat, lon)) in
-                self.nodecoords.items()]
+        '''Return the list representation of a nodegroup.
+
+        Nodes are listed in order of latitude, then longitude, so
+        that readers may select the nodes in a range of latitudes
+        without examining the others.'''
+        return sorted([(nodeid, lat, lon) for (nodeid, (lat, lon)) in
+                       self.nodecoords.items()], key=_location_order)
 
 class GeoGroupTable:
     '''Group OSM nodes by their geographical coordinates.
@@ -88,6 +97,13 @@ class GeoGroupTable:
 
     Grouping of nodes is implemented by restricting the length of
     the geohash codes used.
+
+    If the 'geodoc-occupancy' configuration option is set, a pyramid
+    of summary geodocs with shorter keys is maintained above the
+    geodocs.  Each summary lists the non-empty cells of the level
+    below in its area, along with their node counts, so that readers
+    need not look up empty cells.  Summaries covering few nodes also
+    hold the nodes themselves, as geodocs do.
     '''
 
     def __init__(self, config, options, db):
@@ -102,6 +118,17 @@ class GeoGroupTable:
         self.geodb = collections.defaultdict(NodeGroup)
         self.db = db
 
+        # Node counts of the geodocs written, for summary geodocs.
+        self.counts = {}
+        if config.has_option(C.DATASTORE, C.GEODOC_OCCUPANCY) and \
+                config.getboolean(C.DATASTORE, C.GEODOC_OCCUPANCY):
+            self.summarylengths = geohash_summary_lengths(
+                config.getint(C.DATASTORE, C.GEOHASH_LENGTH))
+            self.summarynodes = config.getint(C.DATASTORE,
+                                              C.GEODOC_SUMMARY_NODES)
+        else:
+            self.summarylengths = []
+
         lrusize = config.getint(C.DATASTORE, C.GEODOC_LRU_SIZE)
         self.lru = BoundedLRUBuffer(bound=lrusize, callback=self._cb)
 
@@ -113,8 +140,7 @@ class GeoGroupTable:
         if self.nthreads:
             self.wrthreads = []
             self.wrqueue = Queue(self.nthreads)
-            self.wrcond = threading.Condition()
-            self.wrpending = []
+            self.wrpending = KeyedWaitTable()
             for n in range(self.nthreads):
                 t = threading.Thread(target=self._worker)
                 t.name = "GeoWB-%d" % n
@@ -145,21 +171,13 @@ class GeoGroupTable:
             key, nodeset = v
 
             # Mark the item as "I/O in progress".
-            with self.wrcond:
-                while key in self.wrpending:
-                    self.wrcond.wait()
-
-                assert key not in self.wrpending
-                self.wrpending.append(key)
+            self.wrpending.acquire(key)
 
             # Process this node set.
             self._write_geodoc(key, nodeset)
 
             # Remove the "I/O in progress" marker.
-            with self.wrcond:
-                assert key in self.wrpending
-                self.wrpending.remove(key)
-                self.wrcond.notifyAll()
+            self.wrpending.end(key)
 
             self.wrqueue.task_done()
 
@@ -173,6 +191,61 @@ class GeoGroupTable:
         nodegroup.update(geodoc[C.NODES])
         geodoc[C.NODES] = nodegroup.aslist()
         self.db.store_element(C.GEODOC, key, geodoc)
+        if self.summarylengths:
+            self.counts[key] = len(geodoc[C.NODES])
+
+    def _write_summaries(self):
+        "Update the summary geodocs above the geodocs written."
+        counts = self.counts
+        for length in self.summarylengths: # Finest level first.
+            cells = collections.defaultdict(dict)
+            for (key, count) in counts.items():
+                cells[key[:length]][key[length:]] = count
+            counts = self._write_summary_level(cells)
+        self.counts = {}
+
+    def _write_summary_level(self, cells):
+        """Merge node counts for cells into the summary geodocs of a level.
+
+        'cells' maps summary keys to the node counts of their cells.
+        The summaries, and the geodocs below them whose nodes they
+        hold, are each read using one multi-key request.
+
+        Returns a mapping from summary keys to the number of nodes in
+        their areas."""
+        summaries = self.db.retrieve_elements(C.GEODOC, cells.keys())
+
+        allcounts = {}
+        children = []
+        for (key, cellcounts) in cells.items():
+            if summaries[key] is None:
+                summaries[key] = new_osm_element(C.GEODOC, key)
+            counts = dict(summaries[key].get(C.CELLS, ()))
+            counts.update(cellcounts)
+            allcounts[key] = counts
+            if sum(counts.values()) <= self.summarynodes:
+                children.extend([key + c for c in counts])
+
+        # Small areas hold their nodes, read from the level below.
+        if children:
+            childdocs = self.db.retrieve_elements(C.GEODOC, children)
+        else:
+            childdocs = {}
+
+        nnodes = {}
+        for (key, counts) in allcounts.items():
+            summary = summaries[key]
+            summary[C.CELLS] = sorted([[c, n] for (c, n) in counts.items()])
+            nnodes[key] = sum(counts.values())
+            nodes = []
+            if nnodes[key] <= self.summarynodes:
+                for c in counts:
+                    child = childdocs.get(key + c)
+                    if child is not None:
+                        nodes.extend(child.get_node_info())
+            summary[C.NODES] = sorted(nodes, key=_location_order)
+            self.db.store_element(C.GEODOC, key, summary)
+        return nnodes
 
     def add(self, elem):
         '''Add information about a node 'elem' to the geo table.
@@ -207,3 +280,6 @@ class GeoGroupTable:
         if self.nthreads:
             # Wait for the work queue to drain.
             self.wrqueue.join()
+
+        # Record the geodocs now present.
+        self._write_summaries()
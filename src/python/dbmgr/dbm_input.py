@@ -48,6 +48,8 @@ def _make_osm_iterator(config, f):
 
     depth = 0
     doc = None
+    members = []
+    nodes = []
     ignored_elements = ['bound', 'bounds']
     processed_elements = ('changeset', 'node', 'way', 'relation')
 
@@ -65,10 +67,12 @@ def _make_osm_iterator(config, f):
                 # Start of the element.  Copy 'standard' attributes,
                 # translating them to native values where possible.
                 doc = new_osm_element(element_name.lower(), elem.get('id'))
+                members = []
+                nodes = []
                 for k,v in elem.items():
                     if k == 'visible':
                         v = bool(v)
-                    elif k == 'version' or k == 'uid':
+                    elif k == 'version' or k == 'uid' or k == 'changeset':
                         v = int(v)
                     elif k == 'lat' or k == 'lon':
                         v = encode_coordinate(v)
@@ -80,18 +84,21 @@ def _make_osm_iterator(config, f):
 
             elif element_name == 'nd':
                 # <nd> elements contain references.
-                doc['nodes'].add(int(elem.get('ref')))
+                nodes.append(int(elem.get('ref')))
 
             elif element_name == 'member':
                 # Collect the list of (ref, role, type) tuples.
-                doc.setdefault('members', []).append((elem.get('ref'),
-                                                      elem.get('role'),
-                                                      elem.get('type')))
+                members.append((elem.get('ref'), elem.get('role'),
+                                elem.get('type')))
             depth = depth + 1
 
         elif event == 'end':
             depth = depth - 1
             if depth == 0:
+                if nodes:
+                    doc['nodes'] = nodes
+                if members:
+                    doc['members'] = members
                 yield doc       # Return a complete element to the caller.
 
         root.clear()            # Keep memory usage down.
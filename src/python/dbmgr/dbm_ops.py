@@ -50,10 +50,16 @@ class DBOps:
     def add_element(self, elem):
         "Add an element to the datastore."
 
-        self.db.store(elem)
+        ns = elem.namespace
+        if ns == C.WAY:
+            # Ways are stored where their first node lies, for
+            # geographically keyed slabs.
+            nodes = list(self.db.fetch_keys(C.NODE, map(str, elem[C.NODES])))
+            self.db.store(elem, self._location(elem, nodes))
+        else:
+            self.db.store(elem)
 
         # If the element is a node, add it to the appropriate geodoc.
-        ns = elem.namespace
         backreference = make_backreference(ns, elem.id)
 
         if self.verbose:
@@ -66,8 +72,7 @@ class DBOps:
 
         elif ns == C.WAY:
             # Backlink referenced nodes to the current way.
-            for (rstatus, node_or_key) in \
-                    self.db.fetch_keys(C.NODE, map(str, elem[C.NODES])):
+            for (rstatus, node_or_key) in nodes:
                 if rstatus:
                     node = node_or_key
                 else:
@@ -104,6 +109,16 @@ class DBOps:
                     elem[C.REFERENCES].add(backreference)
                     self.db.store(elem)
 
+    def _location(self, way, nodes):
+        "Return the location of the first of a way's nodes, if known."
+        if not way[C.NODES]:
+            return None
+        first = str(way[C.NODES][0])
+        for (rstatus, node) in nodes:
+            if rstatus and node.id == first and node.get(C.LAT) is not None:
+                return (node[C.LAT], node[C.LON])
+        return None
+
     def add_changeset(self, changeset):
         "Add a changeset to the database."
         raise NotImplementedError
@@ -24,10 +24,17 @@
 
 import os.path
 import sys
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
 import tornado.options
+import tornado.process
+import signal
+import time
 
 import apiserver.const as C
 from fe import OSMFrontEndServer
+from prefork import Supervisor, WorkerStats
 from apiserver.osmelement import init_osm_factory
 from datastore.slabutil import init_slabutil
 
@@ -35,6 +42,9 @@ from datastore.slabutil import init_slabutil
 default_config_directory	= "config"
 default_config_file		= "osm-api-server.cfg"
 
+# Seconds a worker is given to finish requests in progress on SIGTERM.
+shutdown_grace_period		= 10
+
 tornado.options.define("backend", default=None,
                        type=str, metavar="BACKEND",
                        help="datastore backend to use")
@@ -44,6 +54,12 @@ tornado.options.define("config", default=default_config_file,
 tornado.options.define("encoding", default=None,
                        type=str, metavar="ENCODING",
                        help="Encoding used for values")
+tornado.options.define("processes", default=1,
+                       type=int, metavar="N",
+                       help="number of worker processes (0: one per CPU)")
+tornado.options.define("slab_trace", default=None,
+                       type=str, metavar="FILE",
+                       help="record slab cache lookups to FILE")
 tornado.options.define("verbose", default=False,
                        type=bool, metavar="BOOLEAN",
                        help="Control verbosity")
@@ -53,14 +69,8 @@ def error(message):
     sys.stderr.write("Error: " + message + "\n")
     sys.exit(1)
 
-##
-## Script entry point.
-##
-def main():
-    """Launch the API server."""
-    # Parse command line options if present.
-    tornado.options.parse_command_line()
-    options = tornado.options.options
+def read_configuration(options):
+    "Read configuration information, applying command line overrides."
 
     # Bring in (server-wide) configuration information.
     try:
@@ -86,6 +96,15 @@ def main():
     if options.encoding:
         cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, options.encoding)
 
+    return cfg
+
+def serve(cfg, options, sockets, workers=None):
+    """Serve requests on the listening sockets until stopped.
+
+    'workers' is a WorkerStats object, set when running as one of a
+    set of worker processes.
+    """
+
     # Load the desired interface to the datastore.
     backend = cfg.get(C.DATASTORE, C.DATASTORE_BACKEND)
     try:
@@ -95,23 +114,76 @@ def main():
         error("Could not initialize datastore of type \"%s\": %s" %
               (backend, str(x)))
 
+    # Record slab accesses for later analysis, if requested.
+    if options.slab_trace:
+        tracefile = options.slab_trace
+        if workers:
+            tracefile += ".%d" % workers.index
+        datastore.cache.trace = open(tracefile, 'a')
+
     # Initialize the OSM element factory and other modules.
     init_slabutil(cfg)
     init_osm_factory(cfg)
 
     # Create an instance of the front-end server.
-    port = cfg.getint(C.FRONT_END, C.PORT)
-    feserver = OSMFrontEndServer(cfg, options, datastore)
+    feserver = OSMFrontEndServer(cfg, options, datastore, workers)
     http_server = tornado.httpserver.HTTPServer(feserver.application)
-    http_server.listen(port)
+    http_server.add_sockets(sockets)
+
+    # Stop accepting connections on SIGTERM, and exit once requests
+    # in progress have had time to complete.  The datastore is closed
+    # first, so that the slab trace is complete.
+    ioloop = tornado.ioloop.IOLoop.instance()
+    def _stop():
+        datastore.close()
+        ioloop.stop()
+    def _shutdown():
+        http_server.stop()
+        ioloop.add_timeout(time.time() + shutdown_grace_period, _stop)
+    signal.signal(signal.SIGTERM,
+                  lambda sig, frame: ioloop.add_callback_from_signal(_shutdown))
 
     # Start the server.
     try:
-        tornado.ioloop.IOLoop.instance().start()
+        ioloop.start()
     except KeyboardInterrupt:
+        datastore.close()
         if options.verbose:
             pass                # Print statistics etc.
 
+##
+## Script entry point.
+##
+def main():
+    """Launch the API server."""
+    # Parse command line options if present.
+    tornado.options.parse_command_line()
+    options = tornado.options.options
+
+    cfg = read_configuration(options)
+
+    port = cfg.getint(C.FRONT_END, C.PORT)
+    sockets = tornado.netutil.bind_sockets(port)
+
+    nprocesses = options.processes
+    if nprocesses <= 0:
+        nprocesses = tornado.process.cpu_count()
+
+    if nprocesses == 1:
+        serve(cfg, options, sockets)
+        return
+
+    # Fork worker processes sharing the listening sockets.  Each
+    # worker re-reads the configuration when it starts, so a SIGHUP
+    # to the parent picks up configuration changes (other than the
+    # listening port).  Workers and their replacements use separate
+    # slots (see 'Supervisor').
+    workers = WorkerStats(2 * nprocesses)
+    def _start_worker(index):
+        workers.attach(index)
+        serve(read_configuration(options), options, sockets, workers)
+    sys.exit(Supervisor(nprocesses, _start_worker).run())
+
 #
 # Invoke main()
 #
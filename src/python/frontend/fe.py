@@ -32,9 +32,12 @@ import sys
 #
 import	apiserver.const as C                   # 'constants'
 from	capabilities import CapabilitiesHandler
+from	mapcache     import MapCache
 from	maphandler   import MapHandler
 from	osmelement   import OsmElementHandler, OsmElementRelationsHandler, \
     OsmFullQueryHandler, OsmMultiElementHandler, OsmWaysForNodeHandler
+from	status       import StatusHandler
+from	util         import DatastoreGeneration
 
 #
 # Handling access to '/'.
@@ -137,7 +140,7 @@ class OSMFrontEndServer:
         datastore       Datastore in use.
     """
 
-    def __init__(self, cfg, options, datastore):
+    def __init__(self, cfg, options, datastore, workers=None):
         """Initialize an OSMFrontEnd.
 
         Parameters:
@@ -145,14 +148,29 @@ class OSMFrontEndServer:
         config          Configuration information.
         options         Command line options.
         datastore       Datastore in use.
+        workers         Per-worker statistics (a prefork.WorkerStats
+                        object), if running as a worker process.
         """
 
         osm_api_version = cfg.get(C.FRONT_END, C.API_VERSION)
 
+        # The generation of the data store is used for the entity
+        # tags of /map responses, and to flush the map cache and the
+        # data store's caches, which may hold elements of the previous
+        # load.
+        generation = DatastoreGeneration(datastore)
+        generation.add_listener(lambda value: datastore.discard_cache())
+        if cfg.has_option(C.FRONT_END, C.MAP_CACHE_BYTES) and \
+                cfg.getint(C.FRONT_END, C.MAP_CACHE_BYTES) > 0:
+            mapcache = MapCache(cfg, generation)
+        else:
+            mapcache = None
+
         # Link URLs to their handlers.
         application = tornado.web.Application([
             (r"/api/%s/map" % osm_api_version, MapHandler,
-             dict(cfg=cfg, datastore=datastore)),
+             dict(cfg=cfg, datastore=datastore, generation=generation,
+                  mapcache=mapcache)),
             (r"/api/%s/capabilities" % osm_api_version, CapabilitiesHandler,
              dict(cfg=cfg)),
             (r"/api/%s/changeset/([0-9]+)/close" % osm_api_version,
@@ -185,9 +203,20 @@ class OSMFrontEndServer:
             (r"/api/%s/(way|relation)/([0-9]+)/full" % osm_api_version,
              OsmFullQueryHandler, dict(datastore=datastore)),
             (r"/api/capabilities", CapabilitiesHandler, dict(cfg=cfg)),
+            (r"/status", StatusHandler,
+             dict(datastore=datastore, workers=workers,
+                  mapcache=mapcache)),
             (r"/", RootHandler, dict(cfg=cfg))
         ])
 
+        # Count requests served by this worker.
+        if workers:
+            log_request = application.log_request
+            def _log_request(handler):
+                workers.record(handler)
+                log_request(handler)
+            application.log_request = _log_request
+
         self._application = application
         self._config = cfg
         self._datastore = datastore
@@ -0,0 +1,203 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+## A cache of the contents of /map responses, kept per geohash tile.
+
+import geohash
+import time
+
+from operator import itemgetter
+from tornado.concurrent import Future
+
+import apiserver.const as C
+from apiserver.osmelement import encode_coordinate, new_osm_element
+from datastore.lrucache import BoundedLRUBuffer
+from datastore.slabutil import slabutil_footprint
+
+def _references(prefix, refsets):
+    "Return the ids referenced by 'refsets' with the given prefix."
+    return set([r[1:] for refs in refsets for r in refs if r[0] == prefix])
+
+
+class ElementCollector:
+    """Collect the elements of a response instead of sending them.
+
+    Has the 'add()' and 'flush()' methods of an XMLResponseWriter."""
+
+    def __init__(self):
+        self.elements = []
+
+    def add(self, elem):
+        self.elements.append(elem)
+
+    def flush(self):
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+class MapTile:
+    """The elements of the /map response for one geohash tile.
+
+    Only element ids and the references between elements are kept.
+
+    geodoc    -- A geodoc holding the nodes lying in the tile.
+    nodes     -- Maps the ids of the nodes of the response to their
+                 (lat, lon, references).
+    ways      -- Maps way ids to their (node ids, references).
+    relations -- Maps relation ids to their references.
+    """
+
+    def __init__(self, key, elements):
+        bb = geohash.bbox(key)
+        w, s, e, n = [encode_coordinate(bb[k]) for k in 'wsen']
+
+        self.nodes = {}
+        self.ways = {}
+        self.relations = {}
+        inside = []
+        for elem in elements:
+            refs = tuple(elem.get(C.REFERENCES, ()))
+            if elem.namespace == C.NODE:
+                lat, lon = elem[C.LAT], elem[C.LON]
+                self.nodes[elem.id] = (lat, lon, refs)
+                if s <= lat < n and w <= lon < e:
+                    inside.append((elem.id, lat, lon))
+            elif elem.namespace == C.WAY:
+                self.ways[elem.id] = (tuple(elem.get_node_ids()), refs)
+            else:
+                self.relations[elem.id] = refs
+        inside.sort(key=itemgetter(1, 2))
+
+        self.geodoc = new_osm_element(C.GEODOC, key)
+        self.geodoc[C.NODES] = inside
+        self.expiry = None
+        self.footprint = slabutil_footprint((inside, self.nodes, self.ways,
+                                             self.relations))
+
+
+def merge_tiles(tiles, nodelocs):
+    """Return the ids of the elements of a /map response.
+
+    'nodelocs' maps the ids of the nodes of 'tiles' lying in the
+    bounding box of the response to their locations.  The steps of
+    'MapHandler.handle_map()' are replayed on the references recorded
+    in the tiles, which hold all the elements reached from their
+    nodes.  Returns a tuple (nodelocs, wayids, relationids) where
+    'nodelocs' also holds the additional nodes of the ways.
+    """
+    nodes, ways, relations = {}, {}, {}
+    for t in tiles:
+        nodes.update(t.nodes)
+        ways.update(t.ways)
+        relations.update(t.relations)
+
+    nodeset = set(nodelocs)
+    nodelocs = dict(nodelocs)
+    wayids = [w for w in _references('W', [nodes[n][2] for n in nodeset])
+              if w in ways]
+
+    extranodes = [n for w in wayids for n in ways[w][0]
+                  if n not in nodeset and n in nodes]
+    for n in extranodes:
+        nodelocs[n] = nodes[n][:2]
+    nodeset.update(extranodes)
+
+    relset = _references('R', [nodes[n][2] for n in nodeset]) | \
+        _references('R', [ways[w][1] for w in wayids])
+    relset.intersection_update(relations)
+    parents = _references('R', [relations[r] for r in relset])
+    relset.update(parents.intersection(relations))
+
+    return (nodelocs, wayids, list(relset))
+
+
+class MapCache:
+    """A cache of the tiles of /map responses.
+
+    Tiles are kept in a buffer with 'least recently used' semantics,
+    bounded by their approximate size in memory.  The cache is
+    flushed when the generation of the data store, tracked by a
+    'util.DatastoreGeneration', changes.
+    """
+
+    def __init__(self, cfg, generation):
+        self.generation = generation
+        self.tilelength = cfg.getint(C.FRONT_END, C.MAP_CACHE_GEOHASH_LENGTH)
+        self.ttl = cfg.getint(C.FRONT_END, C.MAP_CACHE_TTL)
+        self.tiles = BoundedLRUBuffer(
+            bound=cfg.getint(C.FRONT_END, C.MAP_CACHE_BYTES),
+            weigher=lambda tile: tile.footprint)
+        self.pending = {}       # Tiles being built.
+        self.hits = 0
+        self.misses = 0
+        generation.add_listener(lambda value: self.flush())
+
+    def flush(self):
+        "Empty the cache."
+        self.tiles.flush()
+        self.pending.clear()
+
+    def get(self, key):
+        "Return the tile for 'key', or None if it is not cached."
+        tile = self.tiles.get(key)
+        if tile is not None and tile.expiry is not None and \
+                tile.expiry <= time.time():
+            del self.tiles[key]
+            tile = None
+        if tile is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return tile
+
+    def fill(self, key, build):
+        """Return a Future for the tile for 'key', built by 'build(key)'.
+
+        Concurrent requests for a tile share its build.  Tiles built
+        from an older generation of the data store are not cached."""
+        future = self.pending.get(key)
+        if future is not None:
+            return future
+
+        generation = self.generation.value
+        future = self.pending[key] = build(key)
+        def _done(f):
+            if self.pending.get(key) is f:
+                del self.pending[key]
+            if f.exception() is None and \
+                    generation == self.generation.value:
+                tile = f.result()
+                if self.ttl:
+                    tile.expiry = time.time() + self.ttl
+                self.tiles[key] = tile
+        future.add_done_callback(_done)
+        return future
+
+    def statistics(self):
+        "Return a mapping describing the state of the cache."
+        return {
+            'map-cache-bytes': self.tiles.weight,
+            'map-cache-tiles': len(self.tiles),
+            'map-cache-hits': self.hits,
+            'map-cache-misses': self.misses
+            }
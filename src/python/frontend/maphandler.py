@@ -23,39 +23,134 @@
 ## Support retrieval of the map data in a bounding box.
 
 import geohash
+import hashlib
+import time
 import tornado.web
 
 from lxml import etree as ET
+from tornado import gen
 
 import apiserver.const as C
 from apiserver.osmelement import encode_coordinate, new_osm_response
+from datastore.ds_geohash import geohash_cover, geohash_summary_lengths
 
-from util import filter_references, response_to_xml
+# The number of summary geodocs that may be read first.  Reads start
+# at the finest level of summaries covering the bounding box with no
+# more than this many cells.
+_SUMMARY_READS = 16
+
+from mapcache import ElementCollector, MapTile, merge_tiles
+from util import filter_references, not_modified, response_to_xml, \
+    XMLResponseWriter
+
+# Requests covering more tiles of the map cache than this bypass the
+# cache.
+_CACHE_TILES = 64
+
+# Tiles of the map cache are built from the response for a slightly
+# larger area (in degrees), so that nodes on their edges are found
+# whatever the rounding of coordinates.
+_TILE_MARGIN = 1e-6
+
+# Nodes may lie this far (in encoded coordinates) outside the cell of
+# their geodoc, as geohash keys are computed from rounded coordinates.
+_CELL_MARGIN = 1
 
 def _filter_in_bbox(bbox, geodocs):
-    "Return the list of nodes that fall into the given bounding box."
+    """Return the nodes that fall into the given bounding box.
+
+    Geodocs whose cells lie inside the bounding box contribute all
+    their nodes, and those whose cells lie outside it none.  Only the
+    nodes of geodocs on the boundary of the box are examined.
+
+    The result maps node ids to their (lat, lon) locations."""
     w,s,e,n = map(encode_coordinate, bbox)
 
-    nodeset = set()
+    nodelocs = {}
     for gd in geodocs:
-        for (nid, lat, lon) in gd.get_node_info():
-            if w <= lon < e and s <= lat < n:
-                nodeset.add(nid)
-    return nodeset
+        bb = gd[C.BBOX]
+        cw, cs, ce, cn = [encode_coordinate(bb[k]) for k in 'wsen']
+        if cw - _CELL_MARGIN >= w and ce + _CELL_MARGIN < e and \
+                cs - _CELL_MARGIN >= s and cn + _CELL_MARGIN < n:
+            nodelocs.update(gd.get_nodes())
+        elif ce + _CELL_MARGIN < w or cw - _CELL_MARGIN >= e or \
+                cn + _CELL_MARGIN < s or cs - _CELL_MARGIN >= n:
+            continue
+        else:
+            nodelocs.update(gd.get_nodes_in_bbox(w, s, e, n))
+    return nodelocs
+
+
+def _abandon(futures):
+    """Stop waiting for 'futures'.
+
+    Errors from these are marked as seen, so that they are not logged
+    as unhandled."""
+    for future in futures:
+        future.add_done_callback(lambda f: f.exception())
+
+
+class _StageTimings:
+    """Record the time taken by the stages of a request.
+
+    Stages may overlap; each is timed from its start until the Future
+    returned for it completes."""
+
+    def __init__(self):
+        self.origin = time.time()
+        self.stages = []
+
+    def stage(self, name, fn, *args, **kwargs):
+        """Start the stage 'name' by calling 'fn'.
+
+        Returns the Future returned by 'fn'; the stage ends when the
+        Future completes."""
+        start = time.time()
+        def _done(f):
+            self.stages.append((name, start - self.origin,
+                                time.time() - start))
+        future = fn(*args, **kwargs)
+        future.add_done_callback(_done)
+        return future
+
+    def header(self):
+        "Return the timings as the value of a 'Server-Timing' header."
+        stages = sorted(self.stages, key=lambda s: s[1]) + \
+            [('total', 0.0, time.time() - self.origin)]
+        return ", ".join(['%s;desc="+%.1f";dur=%.1f' %
+                          (name, 1000 * start, 1000 * elapsed)
+                          for (name, start, elapsed) in stages])
 
 
 class MapHandler(tornado.web.RequestHandler):
     "Handle requests for the /map API."
 
-    def initialize(self, cfg, datastore):
+    def initialize(self, cfg, datastore, generation, mapcache=None):
         self.datastore = datastore
+        self.generation = generation
+        self.mapcache = mapcache
+        self.debug = cfg.has_option(C.FRONT_END, C.DEBUG) and \
+            cfg.getboolean(C.FRONT_END, C.DEBUG)
+        self.timings = None
         self.precision = cfg.getint(C.DATASTORE, C.GEOHASH_LENGTH)
+        if cfg.has_option(C.DATASTORE, C.GEODOC_OCCUPANCY) and \
+                cfg.getboolean(C.DATASTORE, C.GEODOC_OCCUPANCY):
+            self.summarylengths = geohash_summary_lengths(self.precision)
+        else:
+            self.summarylengths = []
 
+    @gen.coroutine
     def get(self, *args, **kwargs):
         '''Service a GET request to the '/map' URI.
 
         The 'bbox' parameter contains 4 coordinates "l" (w), "b" (s),
-        "r" (e) and "t" (n).'''
+        "r" (e) and "t" (n).
+
+        Once the generation of the data store is known, responses
+        carry an entity tag computed from it and from the bounding
+        box, and requests matching the tag are answered without
+        reading any elements.  The tags are weak, as the order of
+        the elements of a response may vary.'''
         
         # Sanity check the input.
         bbox_arg = self.get_argument('bbox', None)
@@ -77,149 +172,299 @@ class MapHandler(tornado.web.RequestHandler):
            n < s or e < w:
             raise tornado.web.HTTPError(400)
 
-        nodelist, ways, relations = self.handle_map(bbox)
-        response = self.build_bbox_response(nodelist, ways, relations, bbox)
-
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
-        self.write(response_to_xml(response))
+        if self.debug:
+            self.timings = _StageTimings()
 
-    def build_bbox_response(self, nodes, ways, relations, bbox):
-        """Build an OSM response for the query."""
+        root = new_osm_response()
+        yield self._stage('generation', self.generation.check)
+        if self.generation.value is not None:
+            digest = hashlib.sha1(response_to_xml(root))
+            digest.update('%s %s' % (self.generation.value, bbox_arg))
+            if not_modified(self, 'W/"%s"' % digest.hexdigest()):
+                return
 
-        # Create a new response element.
-        osm = new_osm_response()
+        out = XMLResponseWriter(self, root)
 
         # Add a <bounds> element.
-        bb = ET.SubElement(osm, C.BOUNDS)
+        bb = ET.Element(C.BOUNDS)
         (bb.attrib[C.MINLON], bb.attrib[C.MINLAT],
          bb.attrib[C.MAXLON], bb.attrib[C.MAXLAT]) = map(str, bbox)
-
-        # Add nodes, ways and relations in that order.
-        for n in nodes:
-            n.build_response(osm)
-        for w in ways:
-            w.build_response(osm)
-        for r in relations:
-            r.build_response(osm)
-
-        return osm
-
-    def handle_map(self, bbox):
+        out.append(bb)
+
+        tilekeys = None
+        if self.mapcache:
+            tilekeys = geohash_cover(bbox, self.mapcache.tilelength)
+        if tilekeys and len(tilekeys) <= _CACHE_TILES:
+            yield self.handle_cached_map(bbox, tilekeys, out)
+        else:
+            yield self.handle_map(bbox, out)
+
+        if self.timings:
+            self.set_header(C.SERVER_TIMING, self.timings.header())
+        out.finish()
+
+    def _stage(self, name, fn, *args, **kwargs):
+        """Start the stage 'name' of the request by calling 'fn'.
+
+        Returns the Future returned by 'fn'.  The stage is timed if
+        debugging."""
+        if self.timings:
+            return self.timings.stage(name, fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    @gen.coroutine
+    def _flush(self, out):
+        """Send the response written so far to the client.
+
+        When stage timings are reported, the response is held back
+        until its headers are complete."""
+        if not self.timings:
+            yield out.flush()
+
+    @gen.coroutine
+    def handle_map(self, bbox, out):
         """Implementation of the /map API.
 
+        Nodes, ways and relations are added to the response in that
+        order; each is sent to the client as soon as the steps below
+        make it possible to do so.  Reads from the data store that do
+        not depend on each other are made concurrently, and while
+        earlier parts of the response are being sent.
+
         Parameters:
 
         bbox -- Bounding box coordinates.
+        out  -- An XMLResponseWriter for the response.
         """
 
-        nodelist = []
-        relations = []
-        ways = []
+        started = []
+        try:
+            yield self._handle_map(bbox, out, started)
+        except Exception:
+            _abandon(started)
+            raise
+
+    @gen.coroutine
+    def _handle_map(self, bbox, out, started):
+        """The body of 'handle_map()'.
+
+        The Futures of the reads made are appended to 'started'."""
 
         # This implementation follows the current implementation of
         # the API server at api.openstreetmap.org (the 'rails' port).
 
+        def afetch_keys(*args, **kwargs):
+            future = self.datastore.afetch_keys(*args, **kwargs)
+            started.append(future)
+            return future
+
         # Look up the geo coded documents covering the desired bbox.
-        gckeys = self.get_geocodes(bbox)
-        geodocs = self.datastore.fetch_keys(C.GEODOC, gckeys)
+        geodocs = yield self._stage('geodocs', self.get_geodocs, bbox)
 
         # Step 1: Get the list of nodes contained in the given
         #    bounding box.
-        nodeset = _filter_in_bbox(bbox,
-                                  [gd for (st, gd) in geodocs if st])
-        if len(nodeset) == 0:
-            return (nodelist, ways, relations)
+        nodelocs = _filter_in_bbox(bbox, geodocs)
+        if len(nodelocs) == 0:
+            return
 
-        nodelist = [z for (st, z) in self.datastore.fetch_keys(
-                C.NODE, [n for n in nodeset]) if st]
+        nodeset = set(nodelocs)
+        found = yield self._stage('nodes', afetch_keys, C.NODE,
+                                  nodelocs.keys(), locations=nodelocs)
+        nodelist = [z for (st, z) in found if st]
 
         # Step 2: Retrieve all ways that reference at least one node
-        #    in the given bounding box.
+        #    in the given bounding box, along with the relations
+        #    referencing these nodes (see step 4).
         wayset = filter_references(C.WAY, nodelist)
+        relset = filter_references(C.RELATION, nodelist)
+        waysfuture = self._stage('ways', afetch_keys, C.WAY, list(wayset))
+        relsfuture = self._stage('relations', afetch_keys, C.RELATION,
+                                 list(relset))
 
+        for n in nodelist:
+            out.add(n)
+        yield self._flush(out)
 
         # Step 3: Retrieve any additional nodes referenced by the ways
-        # retrieved.
+        # retrieved, along with the relations referencing the ways.
+        ways = []
         waynodeset = set()
 
-        for (st,w) in self.datastore.fetch_keys(C.WAY, [w for w in wayset]):
+        found = yield waysfuture
+        for (st,w) in found:
             if st:
                 ways.append(w)
                 waynodeset.update(w.get_node_ids())
 
         extranodeset = waynodeset - nodeset
-        nodelist.extend([n for (st,n) in
-                         self.datastore.fetch_keys(C.NODE,
-                                                   [n for n in extranodeset])
-                         if st])
+        wayrelset = filter_references(C.RELATION, ways) - relset
+        wayrelsfuture = self._stage('way-relations', afetch_keys,
+                                    C.RELATION, list(wayrelset))
+        found = yield self._stage('extra-nodes', afetch_keys, C.NODE,
+                                  list(extranodeset))
+        extranodes = [n for (st,n) in found if st]
         nodeset = nodeset | extranodeset
 
-        # Step 4: Retrieve the relations associated with these nodes.
-
-        # ... all relations that reference nodes being returned.
-        relset = filter_references(C.RELATION, nodelist)
-
-        # ... and relations that reference one of the ways in the wayset.
-        relset.update(filter_references(C.RELATION, ways))
+        # Step 4: Retrieve the relations associated with these nodes
+        # and ways: those referencing nodes in the bounding box and
+        # ways are already being read; read those referencing the
+        # additional nodes while the nodes and ways are being sent.
+        extrarelset = filter_references(C.RELATION, extranodes) - \
+            relset - wayrelset
+        extrarelsfuture = self._stage('extra-node-relations', afetch_keys,
+                                      C.RELATION, list(extrarelset))
+        relset.update(wayrelset, extrarelset)
+
+        # All nodes are known at this point; send the remaining nodes
+        # and the ways.
+        for n in extranodes:
+            out.add(n)
+        for w in ways:
+            out.add(w)
+        yield self._flush(out)
 
-        # ... retrieve relations from the data store.
-        relations = [xr for (st,xr) in
-                     self.datastore.fetch_keys(C.RELATION,
-                                               [r for r in relset])
-                     if st]
+        found = yield [relsfuture, wayrelsfuture, extrarelsfuture]
+        relations = [xr for f in found for (st,xr) in f if st]
 
         # ... and relations referenced by existing relations
         # (one-pass only).
         extrarelset = filter_references(C.RELATION, relations)
         newrelset = extrarelset - relset
 
-        newrels = [nr for (st, nr) in
-                   self.datastore.fetch_keys(C.RELATION,
-                                             [r for r in newrelset])
-                   if st]
-        relations.extend(newrels)
+        found = yield self._stage('parent-relations', afetch_keys,
+                                  C.RELATION, list(newrelset))
+        relations.extend([nr for (st, nr) in found if st])
+
+        for r in relations:
+            out.add(r)
 
-        return (nodelist, ways, relations)
 
+    @gen.coroutine
+    def handle_cached_map(self, bbox, tilekeys, out):
+        """Implementation of the /map API using the map cache.
 
-    def get_geocodes(self, bbox):
-        """Return a list of keys covering a given area.
+        The bounding box is covered by geohash tiles, each holding
+        the ids of the elements of the response for the tile, and the
+        references between them.  Tiles missing from the cache are
+        built concurrently, using 'handle_map()'.  The elements of the
+        response are found from the references held by the tiles,
+        and then read from the data store.
 
         Parameters:
 
-        bbox -- Bounding box of the desired region.
+        bbox     -- Bounding box coordinates.
+        tilekeys -- The geohash keys of the tiles covering the box.
+        out      -- An XMLResponseWriter for the response.
         """
 
-        # TODO: Make this more efficient for sparse areas of the map.
-        w, s, e, n = map(float, bbox)
-
-        n = min(C.MAXGHLAT, n)  # work around a geohash library
-        s = min(C.MAXGHLAT, s)  # limitation
-
-        assert(w <= e and s <= n)
+        afetch_keys = self.datastore.afetch_keys
 
-        gcset = set()
-        gc = geohash.encode(s, w, self.precision)
+        tiles = yield self._stage('tiles', self.get_tiles, tilekeys)
 
-        bl = geohash.bbox(gc)   # Box containing point (s,w).
+        nodelocs = _filter_in_bbox(bbox, [t.geodoc for t in tiles])
+        if len(nodelocs) == 0:
+            return
+        nodelocs, wayids, relids = merge_tiles(tiles, nodelocs)
 
-        s_ = bl['s'];
-        while s_ < n:           # Step south to north.
-            w_ = bl['w']
-
-            gc = geohash.encode(s_, w_, self.precision)
-            bb_sn = geohash.bbox(gc) # bounding box in S->N direction
-
-            while w_ < e:       # Step west to east.
-                gcset.add(gc)
-
-                bb_we = geohash.bbox(gc) # in W->E direction
-                w_ = bb_we['e']
-
-                gc = geohash.encode(s_, w_, self.precision)
+        futures = [self._stage('nodes', afetch_keys, C.NODE,
+                               nodelocs.keys(), locations=nodelocs),
+                   self._stage('ways', afetch_keys, C.WAY, wayids),
+                   self._stage('relations', afetch_keys, C.RELATION,
+                               relids)]
+        try:
+            for (i, future) in enumerate(futures):
+                found = yield future
+                for (st, elem) in found:
+                    if st:
+                        out.add(elem)
+                if i < len(futures) - 1:
+                    yield self._flush(out)
+        except Exception:
+            _abandon(futures)
+            raise
+
+    @gen.coroutine
+    def get_tiles(self, keys):
+        """Return a Future for the map cache tiles with the given keys.
+
+        Tiles missing from the cache are built and added to it.
+        """
+        mapcache = self.mapcache
+        tiles = []
+        futures = []
+        for key in keys:
+            tile = mapcache.get(key)
+            if tile is None:
+                futures.append(mapcache.fill(key, self.build_tile))
+            else:
+                tiles.append(tile)
+        if futures:
+            built = yield futures
+            tiles.extend(built)
+        raise gen.Return(tiles)
+
+    @gen.coroutine
+    def build_tile(self, key):
+        "Return a Future for the map cache tile for a geohash cell."
+        bb = geohash.bbox(key)
+        bbox = (max(bb['w'] - _TILE_MARGIN, C.LON_MIN),
+                max(bb['s'] - _TILE_MARGIN, C.LAT_MIN),
+                min(bb['e'] + _TILE_MARGIN, C.LON_MAX),
+                min(bb['n'] + _TILE_MARGIN, C.LAT_MAX))
+        collector = ElementCollector()
+        yield self.handle_map(bbox, collector)
+        raise gen.Return(MapTile(key, collector.elements))
+
+    @gen.coroutine
+    def get_geodocs(self, bbox):
+        """Return a Future for the geodocs covering a given area.
+
+        If the data store has summary geodocs, the pyramid of
+        summaries is walked down from a coarse level, one level per
+        read.  Cells inside the area are descended into whole; cells
+        cut by the edge of the area are only descended into where
+        their non-empty children overlap the area.  Summaries holding
+        their nodes end the descent.
 
-            s_ = bb_sn['n']
+        Parameters:
 
-        assert(len(gcset) > 0)
+        bbox -- Bounding box of the desired region.
+        """
 
-        return [gc for gc in gcset]
+        if not self.summarylengths:
+            found = yield self.datastore.afetch_keys(
+                C.GEODOC, geohash_cover(bbox, self.precision))
+            raise gen.Return([gd for (st, gd) in found if st])
+
+        for length in self.summarylengths: # Finest level first.
+            keys = geohash_cover(bbox, length)
+            if len(keys) <= _SUMMARY_READS:
+                break
+
+        geodocs = []
+        while keys:
+            found = yield self.datastore.afetch_keys(C.GEODOC, keys)
+            keys = []
+            for (st, gd) in found:
+                if not st:
+                    continue
+                if gd.get(C.CELLS) is None or gd.get_node_info():
+                    geodocs.append(gd)
+                else:
+                    keys.extend(self._select_cells(bbox, gd))
+        raise gen.Return(geodocs)
+
+    def _select_cells(self, bbox, summary):
+        "Return the keys of the cells of 'summary' overlapping 'bbox'."
+        cells = [summary.id + c for (c, _) in summary[C.CELLS]]
+        if not cells:
+            return cells
+        w, s, e, n = map(float, bbox)
+        bb = geohash.bbox(summary.id)
+        if w <= bb['w'] and bb['e'] <= e and s <= bb['s'] and bb['n'] <= n:
+            return cells
+        cover = set(geohash_cover((max(w, bb['w']), max(s, bb['s']),
+                                   min(e, bb['e']), min(n, bb['n'])),
+                                  len(cells[0])))
+        return [c for c in cells if c in cover]
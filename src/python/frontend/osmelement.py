@@ -24,9 +24,12 @@
 
 import tornado.web
 
+from tornado import gen
+
 import apiserver.const as C
 from apiserver.osmelement import new_osm_response
-from util import filter_references, response_to_xml
+from util import filter_references, not_modified, response_etag, \
+    XMLResponseWriter
 
 class OsmElementHandler(tornado.web.RequestHandler):
     "Handle requests for the (changeset|node|way|relation)/ API."
@@ -39,14 +42,21 @@ class OsmElementHandler(tornado.web.RequestHandler):
 
         raise tornado.web.HTTPError(501) # Not Implemented.
 
+    @gen.coroutine
     def get(self, namespace, ident):
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
 
-        elem = self.datastore.fetch(namespace, ident)
+        elem = yield self.datastore.afetch(namespace, ident)
         if elem is None:
             raise tornado.web.HTTPError(404)
 
-        self.write(response_to_xml(elem.build_response(new_osm_response())))
+        root = new_osm_response()
+        if not_modified(self, response_etag(root, [elem])):
+            return
+
+        out = XMLResponseWriter(self, root)
+        out.add(elem)
+        out.finish()
 
     def put(self, element):
         """Handle a PUT HTTP request."""
@@ -60,6 +70,7 @@ class OsmMultiElementHandler(tornado.web.RequestHandler):
         """Initialize the handler."""
         self.datastore = datastore
 
+    @gen.coroutine
     def get(self, element):
         """Retrieve multiple elements.
 
@@ -87,17 +98,15 @@ class OsmMultiElementHandler(tornado.web.RequestHandler):
         if not params:
             raise tornado.web.HTTPError(400)
 
-        # Create a new response.
-        osm = new_osm_response()
-
-        # Add elements to the response.
-        for (st,r) in self.datastore.fetch_keys(namespace, params.split(",")):
-            if st:
-                r.build_response(osm)
+        elems = yield self.datastore.afetch_keys(namespace, params.split(","))
 
         # Send the XML representation back to the client.
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
-        self.write(response_to_xml(osm))
+        out = XMLResponseWriter(self, new_osm_response())
+        for (st,r) in elems:
+            if st:
+                out.add(r)
+        out.finish()
 
 
 class OsmElementRelationsHandler(tornado.web.RequestHandler):
@@ -107,6 +116,7 @@ class OsmElementRelationsHandler(tornado.web.RequestHandler):
         """Initialize the handler."""
         self.datastore = datastore
 
+    @gen.coroutine
     def get(self, namespace, ident):
         """Retrieve relations for an element.
 
@@ -116,21 +126,21 @@ class OsmElementRelationsHandler(tornado.web.RequestHandler):
         if namespace not in [C.NODE, C.WAY, C.RELATION]:
             raise tornado.web.HTTPError(500)
 
-        elem = self.datastore.fetch(namespace, ident)
-
-        osm = new_osm_response()
+        elem = yield self.datastore.afetch(namespace, ident)
 
+        relations = []
         if elem:
             relset = filter_references(C.RELATION, [elem])
             if len(relset) > 0:
-                relations = self.datastore.fetch_keys(C.RELATION,
-                                                      [r for r in relset])
-                for (st,r) in relations:
-                    if st:
-                        r.build_response(osm)
+                relations = yield self.datastore.afetch_keys(
+                    C.RELATION, [r for r in relset])
 
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
-        self.write(response_to_xml(osm))
+        out = XMLResponseWriter(self, new_osm_response())
+        for (st,r) in relations:
+            if st:
+                out.add(r)
+        out.finish()
 
 class OsmWaysForNodeHandler(tornado.web.RequestHandler):
     """Retrieve ways associated with a node."""
@@ -138,25 +148,26 @@ class OsmWaysForNodeHandler(tornado.web.RequestHandler):
     def initialize(self, datastore):
         self.datastore = datastore
 
+    @gen.coroutine
     def get(self, nodeid):
         "Retrieve the ways associated with a node."
 
-        elem = self.datastore.fetch(C.NODE, nodeid)
+        elem = yield self.datastore.afetch(C.NODE, nodeid)
         if elem is None:
             raise tornado.web.HTTPError(404)
 
-        osm = new_osm_response()
-
+        ways = []
         wayset = filter_references(C.WAY, [elem])
         if len(wayset) > 0:
-            ways = self.datastore.fetch_keys(C.WAY,
-                                             [w for w in wayset])
-            for (st,w) in ways:
-                if st:
-                    w.build_response(osm)
+            ways = yield self.datastore.afetch_keys(C.WAY,
+                                                    [w for w in wayset])
 
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
-        self.write(response_to_xml(osm))
+        out = XMLResponseWriter(self, new_osm_response())
+        for (st,w) in ways:
+            if st:
+                out.add(w)
+        out.finish()
 
 class OsmFullQueryHandler(tornado.web.RequestHandler):
     """Handle a `full' query for a way or relation."""
@@ -164,6 +175,7 @@ class OsmFullQueryHandler(tornado.web.RequestHandler):
     def initialize(self, datastore):
         self.datastore = datastore
 
+    @gen.coroutine
     def get(self, namespace, elemid):
         """Implement a 'GET' operation.
 
@@ -178,7 +190,7 @@ class OsmFullQueryHandler(tornado.web.RequestHandler):
         """
 
         # Retrieve the element.
-        element = self.datastore.fetch(namespace, elemid)
+        element = yield self.datastore.afetch(namespace, elemid)
         if element is None:
             raise tornado.web.HTTPError(404)
 
@@ -189,9 +201,9 @@ class OsmFullQueryHandler(tornado.web.RequestHandler):
         if namespace == C.RELATION:
             # Retrieve nodes directly referenced by the relation.
             nodeset = element.get_member_ids(C.NODE)
-            nodes.extend([z for (st,z) in
-                          self.datastore.fetch_keys(C.NODE, [n for n in nodeset])
-                          if st])
+            found = yield self.datastore.afetch_keys(C.NODE,
+                                                     [n for n in nodeset])
+            nodes.extend([z for (st,z) in found if st])
             # Retrieve way IDs directly referenced by the relation.
             wayset = element.get_member_ids(C.WAY)
             # Include the relation itself.
@@ -202,9 +214,9 @@ class OsmFullQueryHandler(tornado.web.RequestHandler):
 
         # Fetch all ways.
         if len(wayset) > 0:
-            ways.extend([z for (st, z) in
-                         self.datastore.fetch_keys(C.WAY, [w for w in wayset])
-                         if st])
+            found = yield self.datastore.afetch_keys(C.WAY,
+                                                     [w for w in wayset])
+            ways.extend([z for (st, z) in found if st])
 
         # Fetch additional nodes referenced by the ways in the
         # way set.
@@ -213,18 +225,19 @@ class OsmFullQueryHandler(tornado.web.RequestHandler):
             additional_nodes.update(w.get_node_ids())
 
         additional_nodes = additional_nodes - nodeset
-        nodes.extend([z for (st, z) in
-                      self.datastore.fetch_keys(C.NODE, [n for n in additional_nodes])
-                      if st])
-
-        # Build and return a response.
-        osm = new_osm_response()
-        for n in nodes:
-            n.build_response(osm)
-        for w in ways:
-            w.build_response(osm)
-        for r in relations:
-            r.build_response(osm)
+        found = yield self.datastore.afetch_keys(C.NODE,
+                                                 [n for n in additional_nodes])
+        nodes.extend([z for (st, z) in found if st])
 
+        # Build and return a response, unless the client already
+        # holds it.
         self.set_header(C.CONTENT_TYPE, C.TEXT_XML)
-        self.write(response_to_xml(osm))
+        root = new_osm_response()
+        elements = nodes + ways + relations
+        if not_modified(self, response_etag(root, elements)):
+            return
+
+        out = XMLResponseWriter(self, root)
+        for e in elements:
+            out.add(e)
+        out.finish()
@@ -0,0 +1,300 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+## Run the front end as a set of pre-forked worker processes.
+
+"""Run the front end as a set of pre-forked worker processes.
+
+The parent process binds the listening sockets and forks workers
+that accept connections on them.  The parent then supervises the
+workers:
+
+- workers that exit are restarted,
+- SIGHUP starts a replacement for each worker (a 'graceful reload');
+  the old worker is stopped once its replacement has run for
+  STARTUP_TIME seconds,
+- SIGINT and SIGTERM stop the workers and the parent.
+
+A worker that fails within STARTUP_TIME seconds of starting is
+assumed to be misconfigured.  A failed replacement leaves the old
+worker running; other failures cause the parent to give up.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+
+from multiprocessing.sharedctypes import RawArray
+
+STARTUP_TIME = 2.0              # Seconds.
+
+# Signals handled by the parent.
+_SIGNALS = [signal.SIGCHLD, signal.SIGHUP, signal.SIGINT, signal.SIGTERM]
+
+# Per-worker counters.
+_PID, _STARTED, _REQUESTS, _ERRORS, _MSECS = range(5)
+_NFIELDS = 5
+
+class WorkerStats:
+    """Request counters for each worker, kept in shared memory.
+
+    The counters are allocated by the parent before forking workers;
+    each worker updates the counters in its own slot, and can report
+    the counters of all workers.  Slots that have not been used have
+    a 'pid' of 0.
+    """
+
+    def __init__(self, nworkers):
+        self.nworkers = nworkers
+        self.counters = RawArray('d', nworkers * _NFIELDS)
+        self.index = None       # Slot used by this process.
+
+    def attach(self, index):
+        "Claim a slot for the current process."
+        base = index * _NFIELDS
+        self.counters[base:base + _NFIELDS] = [0.0] * _NFIELDS
+        self.counters[base + _PID] = os.getpid()
+        self.counters[base + _STARTED] = time.time()
+        self.index = index
+
+    def record(self, handler):
+        "Account for a completed request; usable as a log function."
+        base = self.index * _NFIELDS
+        self.counters[base + _REQUESTS] += 1
+        if handler.get_status() >= 500:
+            self.counters[base + _ERRORS] += 1
+        self.counters[base + _MSECS] += 1000.0 * handler.request.request_time()
+
+    def as_list(self):
+        "Return the counters for all workers."
+        workers = []
+        for i in xrange(self.nworkers):
+            c = self.counters[i * _NFIELDS:(i + 1) * _NFIELDS]
+            workers.append({
+                    'pid': int(c[_PID]),
+                    'started': c[_STARTED],
+                    'requests': int(c[_REQUESTS]),
+                    'errors': int(c[_ERRORS]),
+                    'request-msecs': c[_MSECS]
+                    })
+        return workers
+
+
+class Supervisor:
+    """Start and supervise worker processes.
+
+    'start_worker' is invoked with a slot number in each newly forked
+    worker, and is expected to serve requests until the worker is
+    sent a SIGTERM.  Each of the 'nworkers' workers has two slots,
+    'index' and 'index + nworkers', and a worker replacing another on
+    a reload uses the slot that the other does not, so that the two
+    never share a slot (and its 'WorkerStats' counters).
+    """
+
+    def __init__(self, nworkers, start_worker):
+        self.nworkers = nworkers
+        self.start_worker = start_worker
+        self.workers = {}       # Map of PIDs to (slot, start time).
+        self.replacing = {}     # Map of replacement PIDs to old PIDs.
+        self.signals = []       # Signals yet to be handled.
+        self.stopping = False
+        self.status = 0
+        self.wakeup = None      # Pipe written to when a signal arrives.
+
+    def _onsignal(self, signum, frame):
+        self.signals.append(signum)
+
+    def _spawn(self, slot):
+        "Fork a worker."
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (slot, time.time())
+            return pid
+
+        signal.set_wakeup_fd(-1)
+        for fd in self.wakeup:
+            os.close(fd)
+        for sig in _SIGNALS:
+            signal.signal(sig, signal.SIG_DFL)
+        status = 0
+        try:
+            self.start_worker(slot)
+        except SystemExit, e:
+            status = e.code
+        except:
+            traceback.print_exc()
+            status = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status or 0)
+
+    def _kill(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError, e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def _reload(self):
+        """Start a replacement for each worker.
+
+        Workers already being replaced, and replacements, are left
+        alone."""
+        busy = set(self.replacing.keys() + self.replacing.values())
+        for (pid, (slot, _)) in self.workers.items():
+            if pid not in busy:
+                spare = (slot + self.nworkers) % (2 * self.nworkers)
+                self.replacing[self._spawn(spare)] = pid
+
+    def _retire(self):
+        """Stop the workers whose replacements have started up.
+
+        Returns the number of seconds until the next replacement will
+        have started up, or None."""
+        now = time.time()
+        timeout = None
+        for (pid, oldpid) in self.replacing.items():
+            started = self.workers[pid][1]
+            if now - started < STARTUP_TIME:
+                wait = started + STARTUP_TIME - now
+                if timeout is None or wait < timeout:
+                    timeout = wait
+                continue
+            del self.replacing[pid]
+            if oldpid in self.workers:
+                del self.workers[oldpid] # No longer restarted.
+                self._kill([oldpid])
+        return timeout
+
+    def _stop(self):
+        self.stopping = True
+        self.replacing.clear()
+        self._kill(self.workers.keys())
+
+    def _exited(self, pid, st):
+        "Handle the exit of a worker."
+        if pid not in self.workers: # Retired by a reload.
+            return
+        slot, started = self.workers.pop(pid)
+        if self.stopping:
+            return
+
+        if os.WIFSIGNALED(st):
+            logging.warning("Worker %d (pid %d) killed by signal %d.",
+                            slot, pid, os.WTERMSIG(st))
+        else:
+            logging.warning("Worker %d (pid %d) exited with status %d.",
+                            slot, pid, os.WEXITSTATUS(st))
+
+        failed = time.time() - started < STARTUP_TIME
+        if pid in self.replacing:
+            del self.replacing[pid]
+            if failed:          # Keep the worker it was to replace.
+                logging.error("Worker %d failed on startup, keeping the "
+                              "worker it was to replace.", slot)
+                return
+        for (newpid, oldpid) in self.replacing.items():
+            if oldpid == pid:   # Its replacement takes over.
+                del self.replacing[newpid]
+                return
+
+        if failed:
+            logging.error("Worker %d failed on startup, exiting.", slot)
+            self.status = 1
+            self._stop()
+        else:
+            self._spawn(slot)
+
+    def _reap(self):
+        """Handle workers that have exited.
+
+        Returns False once no worker processes are left."""
+        while True:
+            try:
+                pid, st = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    return False
+                raise
+            if pid == 0:
+                return True
+            self._exited(pid, st)
+
+    def _wait(self, timeout):
+        "Wait for a signal to arrive, for at most 'timeout' seconds."
+        try:
+            select.select([self.wakeup[0]], [], [], timeout)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+        try:
+            while os.read(self.wakeup[0], 512):
+                pass
+        except OSError, e:
+            if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                raise
+
+    def run(self):
+        "Start workers, and supervise them until told to stop."
+
+        # Signals (including SIGCHLD) write to the pipe, so that
+        # a signal arriving just before the wait is not missed.
+        self.wakeup = os.pipe()
+        for fd in self.wakeup:
+            fcntl.fcntl(fd, fcntl.F_SETFL,
+                        fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        signal.set_wakeup_fd(self.wakeup[1])
+        for sig in _SIGNALS:
+            signal.signal(sig, self._onsignal)
+
+        for index in xrange(self.nworkers):
+            self._spawn(index)
+
+        while True:
+            while self.signals:
+                sig = self.signals.pop(0)
+                if sig == signal.SIGHUP and not self.stopping:
+                    logging.info("Reloading workers.")
+                    self._reload()
+                elif sig in [signal.SIGINT, signal.SIGTERM]:
+                    self._stop()
+
+            if not self._reap():
+                break           # All workers have exited.
+            timeout = self._retire()
+            if not self.signals:
+                self._wait(timeout)
+
+        signal.set_wakeup_fd(-1)
+        for fd in self.wakeup:
+            os.close(fd)
+        return self.status
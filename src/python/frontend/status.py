@@ -0,0 +1,49 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+## Report the internal state of the server, for monitoring.
+
+import tornado.web
+
+class StatusHandler(tornado.web.RequestHandler):
+    "Handle requests for the server's status."
+
+    def initialize(self, datastore, workers=None, mapcache=None):
+        self.datastore = datastore
+        self.workers = workers
+        self.mapcache = mapcache
+
+    def get(self):
+        """Return datastore statistics as a JSON object.
+
+        When running as one of a set of worker processes, the index of
+        the responding worker and the request counts of all workers
+        are included, as are the statistics of the map cache, if
+        any."""
+        status = self.datastore.statistics()
+        if self.mapcache:
+            status.update(self.mapcache.statistics())
+        if self.workers:
+            status['worker'] = self.workers.index
+            status['workers'] = self.workers.as_list()
+        self.write(status)
@@ -22,15 +22,193 @@
 
 ## Utility functions.
 
+import hashlib
+import time
+
 from lxml import etree as ET
+from tornado.concurrent import Future
 
 import apiserver.const as C
+from apiserver.osmelement import osm_xml_fragment_cache
+
+# The generation of the data store is read at most this often
+# (in seconds).
+_GENERATION_CHECK_INTERVAL = 10
 
 def response_to_xml(elem):
     'Create a pretty-printed XML response.'
     return ET.tostring(elem, encoding=C.UTF8, pretty_print=True,
                        xml_declaration=True)
 
+class XMLResponseWriter:
+    """Write an XML response to a request handler incrementally.
+
+    Elements are added to the response using 'add()', serialized in
+    batches of up to 'batchsize' elements, and sent to the client by
+    'flush()'.  The document written is identical to the one that
+    'response_to_xml()' would produce for a tree holding the same
+    elements, but no such tree is ever built.
+
+    When the 'xml-fragment-cache' option is enabled, the text of each
+    OSM element is taken from the element's cached XML fragment
+    instead of being serialized anew.
+
+    >> out = XMLResponseWriter(handler, new_osm_response())
+    >> for elem in elements:
+    ..     out.add(elem)
+    >> yield out.flush()
+    >> out.finish()
+    """
+
+    def __init__(self, handler, root, batchsize=256):
+        self.handler = handler
+        self.batchsize = batchsize
+        self.batch = ET.Element(root.tag) # Holds unserialized elements.
+        self.fragments = []             # Holds serialized elements.
+        self.fragment_cache = osm_xml_fragment_cache()
+        self.started = False
+
+        # Split the serialized (empty) root element into the text
+        # preceding and following its children.
+        text = response_to_xml(root)
+        assert text.endswith("/>\n")
+        self.empty = text
+        self.header = text[:-3] + ">\n"
+        self.trailer = "</%s>\n" % root.tag
+
+    def add(self, elem):
+        "Add an OSM element to the response."
+        if self.fragment_cache:
+            if len(self.batch):
+                self._write_batch()
+            self.fragments.append(elem.xml_fragment())
+            if len(self.fragments) >= self.batchsize:
+                self._write_fragments()
+            return
+        elem.build_response(self.batch)
+        if len(self.batch) >= self.batchsize:
+            self._write_batch()
+
+    def append(self, xmlelem):
+        "Add an XML element to the response."
+        self._write_fragments()
+        self.batch.append(xmlelem)
+        if len(self.batch) >= self.batchsize:
+            self._write_batch()
+
+    def _write(self, text):
+        "Write response text, preceded by the document header if needed."
+        if not self.started:
+            self.handler.write(self.header)
+            self.started = True
+        self.handler.write(text)
+
+    def _write_fragments(self):
+        "Copy pending XML fragments into the handler's output buffer."
+        if self.fragments:
+            self._write("".join(self.fragments))
+            self.fragments = []
+
+    def _write_batch(self):
+        "Serialize pending elements into the handler's output buffer."
+        self._write_fragments()
+        if len(self.batch) == 0:
+            return
+        text = ET.tostring(self.batch, encoding=C.UTF8, pretty_print=True,
+                           xml_declaration=False)
+        # Drop the start and end tags of the batch element.
+        text = text[text.index("\n") + 1:-len(self.trailer)]
+        self._write(text)
+        self.batch = ET.Element(self.batch.tag)
+
+    def flush(self):
+        """Send the response written so far to the client.
+
+        Returns the result of the handler's 'flush()', a Future in
+        the case of a Tornado RequestHandler."""
+        self._write_batch()
+        return self.handler.flush()
+
+    def finish(self):
+        "Complete the response."
+        self._write_batch()
+        if self.started:
+            self.handler.write(self.trailer)
+        else:
+            self.handler.write(self.empty)
+        self.handler.finish()
+
+class DatastoreGeneration:
+    """Track the generation of the data store.
+
+    The generation changes whenever a load of the data store
+    completes.  Callbacks added with 'add_listener()' are called with
+    the new generation when a change is seen.
+    """
+
+    def __init__(self, datastore, interval=_GENERATION_CHECK_INTERVAL):
+        self.datastore = datastore
+        self.interval = interval
+        self.value = None
+        self.checked = None     # The time the generation was last read.
+        self.listeners = []
+
+    def add_listener(self, callback):
+        "Call 'callback(generation)' when the generation changes."
+        self.listeners.append(callback)
+
+    def check(self):
+        """Return a Future that completes once 'value' is current.
+
+        The generation is read at most every 'interval' seconds;
+        requests made while it is being read do not wait for it."""
+        now = time.time()
+        if self.checked is not None and now < self.checked + self.interval:
+            future = Future()
+            future.set_result(None)
+            return future
+        self.checked = now
+
+        future = self.datastore.aget_generation()
+        def _check(f):
+            if f.exception() is None and f.result() != self.value:
+                self.value = f.result()
+                for callback in self.listeners:
+                    callback(self.value)
+        future.add_done_callback(_check)
+        return future
+
+
+def response_etag(root, elements):
+    """Return a strong entity tag for a response.
+
+    The tag is computed from the empty response 'root' and from the
+    namespaces, ids and versions of 'elements', in the order in which
+    they appear in the response.  Elements are only serialized if
+    they have no version."""
+    digest = hashlib.sha1(response_to_xml(root))
+    for e in elements:
+        version = e.get(C.VERSION)
+        if version is None:
+            digest.update(e.xml_fragment())
+        else:
+            digest.update('%s%s.%s ' % (e.namespace[0], e.id, version))
+    return '"%s"' % digest.hexdigest()
+
+def not_modified(handler, etag):
+    """Set the entity tag of a response.
+
+    If the client already holds the response (its 'If-None-Match'
+    header matches the tag), a '304 Not Modified' response is sent,
+    and True is returned."""
+    handler.set_header(C.ETAG, etag)
+    if not handler.check_etag_header():
+        return False
+    handler.set_status(304)
+    handler.finish()
+    return True
+
+
 def filter_references(namespace, items):
     "Look for references for items in the specified namespace."
     prefix = namespace[0].upper()
@@ -0,0 +1,61 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Test the 'datastore.asyncmemcache' module."""
+
+import memcache
+import pytest
+
+from tornado.ioloop import IOLoop
+
+from benchmarks.fakememcached import FakeMemcached
+from datastore.asyncmemcache import AsyncMemcacheClient, MemcacheError
+
+def test_get_multi():
+    "Test retrieval of keys spread over several servers."
+
+    fakes = [FakeMemcached() for i in range(3)]
+    servers = ['127.0.0.1:%d' % s.start() for s in fakes]
+
+    values = dict([('K%d' % i, 'value-%d' % i) for i in range(64)])
+    mc = memcache.Client(servers)
+    mc.set_multi(values)
+    mc.disconnect_all()
+    assert all(len(s.data) > 0 for s in fakes)
+
+    client = AsyncMemcacheClient(servers)
+    keys = values.keys() + ['K-missing']
+    found = IOLoop.current().run_sync(lambda: client.get_multi(keys))
+    assert found == values
+    assert IOLoop.current().run_sync(lambda: client.get('K1')) == 'value-1'
+    assert IOLoop.current().run_sync(lambda: client.get('K-missing')) is None
+
+def test_timeout():
+    "Test that requests to a stalled server fail."
+
+    server = FakeMemcached(delay=1.0)
+    client = AsyncMemcacheClient(['127.0.0.1:%d' % server.start()],
+                                 timeout=0.1)
+    with pytest.raises(MemcacheError):
+        IOLoop.current().run_sync(lambda: client.get('K1'))
+    assert client.idle == [[]]  # The connection was not kept.
@@ -0,0 +1,69 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Test the compression of datastore values in 'datastore.compression'."""
+
+import pytest
+
+import apiserver.const as C
+
+from datastore.compression import COMPRESSION_MAGIC, compress, \
+    compression_available, decompress
+
+_VALUE = '[[0, "1", 40]]\n' + '{"id": "1", "tags": {"k": "v"}}' * 64
+
+def test_codecs():
+    "Test that values round trip through each available codec."
+
+    assert compression_available(C.NONE)
+    assert compression_available(C.ZLIB)
+    assert not compression_available("no-such-codec")
+
+    for codec in [C.ZLIB, C.LZ4, C.SNAPPY]:
+        if not compression_available(codec):
+            continue
+        bits = compress(codec, _VALUE)
+        assert bits.startswith(COMPRESSION_MAGIC), codec
+        assert len(bits) < len(_VALUE) / 4, codec
+        assert decompress(bits) == _VALUE, codec
+
+def test_uncompressed():
+    "Test the values that are left uncompressed."
+
+    assert compress(C.NONE, _VALUE) is _VALUE
+
+    # Values below the threshold.
+    assert compress(C.ZLIB, _VALUE, len(_VALUE) + 1) is _VALUE
+    assert compress(C.ZLIB, _VALUE, len(_VALUE)) != _VALUE
+
+    # Values that do not shrink.
+    assert compress(C.ZLIB, "[]") == "[]"
+
+    # Uncompressed values are read back unchanged.
+    for bits in [None, "", _VALUE, "\xb5\x01", "\xb6\x01"]:
+        assert decompress(bits) is bits
+
+def test_unknown_codec():
+    "Test reading a value written by an unknown codec."
+
+    with pytest.raises(ValueError):
+        decompress(COMPRESSION_MAGIC + "?" + _VALUE)
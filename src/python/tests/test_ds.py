@@ -0,0 +1,295 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Test the 'datastore.ds' module using an in-memory datastore."""
+
+import threading
+import time
+
+from ConfigParser import ConfigParser
+from StringIO import StringIO
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+import apiserver.const as C
+from datastore.ds import DatastoreBase
+from datastore.slabutil import init_slabutil
+
+_PER_SLAB = 8
+_SLAB_LRU_SIZE = 8
+
+class _DictDatastore(DatastoreBase):
+    "A datastore keeping slabs in a dictionary."
+
+    def __init__(self, config, slabs):
+        DatastoreBase.__init__(self, config)
+        self.slabs = slabs
+        self.reads = []
+
+    def retrieve_slab(self, namespace, slabkey):
+        self.reads.append(slabkey)
+        return self.slabs.get(slabkey)
+
+class _Element(dict):
+    "A minimal element."
+
+    def __init__(self, namespace, elemid):
+        dict.__init__(self, id=elemid)
+        self.namespace = namespace
+        self.id = elemid
+
+def pytest_funcarg__config(request):
+    "Prepare a configuration parser object."
+
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, '256')
+
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, str(_PER_SLAB))
+
+    cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, C.JSON)
+    cfg.set(C.DATASTORE, C.SLAB_LRU_SIZE, str(_SLAB_LRU_SIZE))
+
+    init_slabutil(cfg)
+
+    return cfg
+
+def _make_slabs(start, count):
+    "Return slabs holding {'id': key} values for even keys."
+    slabs = {}
+    for s in range(start, start + count * _PER_SLAB, _PER_SLAB):
+        slabs["NL%d" % s] = [(str(k), {'id': str(k)})
+                             for k in range(s, s + _PER_SLAB, 2)]
+    return slabs
+
+def test_fetch_keys(config):
+    "Test retrieval of present and missing keys."
+
+    ds = _DictDatastore(config, _make_slabs(0, 2))
+
+    keys = map(str, range(0, 3 * _PER_SLAB))
+    present = {}
+    for (st, v) in ds.fetch_keys(C.NODE, keys):
+        if st:
+            present[v['id']] = True
+        else:
+            present[v] = False
+    for k in keys:
+        assert present[k] == (int(k) % 2 == 0 and int(k) < 2 * _PER_SLAB)
+
+    assert sorted(ds.reads) == ['NL0', 'NL16', 'NL8']
+
+    # Elements in slabs that were read in are served from the cache.
+    ds.reads = []
+    assert ds.fetch(C.NODE, '2') == {'id': '2'}
+    assert ds.fetch(C.NODE, '3') is None
+    assert ds.reads == []
+
+def test_single_flight(config):
+    "Test that concurrent reads of a slab share one retrieval."
+
+    entered = threading.Event()
+    proceed = threading.Event()
+
+    class _SlowDatastore(_DictDatastore):
+        def retrieve_slab(self, namespace, slabkey):
+            entered.set()
+            proceed.wait(10)
+            return _DictDatastore.retrieve_slab(self, namespace, slabkey)
+
+    ds = _SlowDatastore(config, _make_slabs(0, 1))
+
+    results = []
+    def _fetch(key):
+        results.append(ds.fetch(C.NODE, key))
+
+    first = threading.Thread(target=_fetch, args=('2',))
+    first.start()
+    entered.wait(10)
+    second = threading.Thread(target=_fetch, args=('4',))
+    second.start()
+    time.sleep(0.1)             # Let the second reader block.
+    proceed.set()
+    first.join(10)
+    second.join(10)
+
+    assert ds.reads == ['NL0']
+    assert sorted(r['id'] for r in results) == ['2', '4']
+
+def test_batched_reads(config):
+    "Test that the slabs needed by a fetch are read in one batch."
+
+    class _BatchingDatastore(_DictDatastore):
+        def __init__(self, config, slabs):
+            _DictDatastore.__init__(self, config, slabs)
+            self.batches = []
+
+        def retrieve_slabs(self, namespace, slabkeys):
+            self.batches.append(sorted(slabkeys))
+            for sk in slabkeys:
+                yield (sk, self.slabs.get(sk))
+
+    ds = _BatchingDatastore(config, _make_slabs(0, 2))
+
+    keys = map(str, range(0, 3 * _PER_SLAB, 2))
+    found = [v['id'] for (st, v) in ds.fetch_keys(C.NODE, keys) if st]
+    assert sorted(found, key=int) == keys[:_PER_SLAB]
+    assert ds.batches == [['NL0', 'NL16', 'NL8']]
+
+    # Abandoning a fetch part way releases slabs left unread.
+    ds = _BatchingDatastore(config, _make_slabs(0, 2))
+    ds.fetch_keys(C.NODE, keys).next()
+    assert len(ds.loading) == 0
+
+def test_store_while_fetching(config):
+    "Test that callers may store elements while iterating over a fetch."
+
+    ds = _DictDatastore(config, _make_slabs(0, 2))
+
+    def _fetch_and_store():
+        keys = ['0', str(_PER_SLAB)]
+        for (st, v) in ds.fetch_keys(C.NODE, keys):
+            for k in keys:      # Reaches the slab not yet returned.
+                ds.store(_Element(C.NODE, str(int(k) + 1)))
+
+    t = threading.Thread(target=_fetch_and_store)
+    t.daemon = True
+    t.start()
+    t.join(10)
+    assert not t.is_alive()
+    assert ds.fetch(C.NODE, str(_PER_SLAB + 1)) == {'id': str(_PER_SLAB + 1)}
+    assert sorted(ds.reads) == ['NL0', 'NL8']
+
+def test_negative_cache(config):
+    "Test that absent slabs are not read again."
+
+    config.set(C.DATASTORE, C.NEGATIVE_CACHE_SIZE, '16')
+    ds = _DictDatastore(config, _make_slabs(0, 1))
+
+    keys = [str(k) for k in range(0, 3 * _PER_SLAB, _PER_SLAB)]
+    for _ in range(2):
+        found = [v for (st, v) in ds.fetch_keys(C.NODE, keys) if st]
+        assert found == [{'id': '0'}]
+    assert sorted(ds.reads) == ['NL0', 'NL16', 'NL8']
+    assert ds.statistics()['negative-hits'] == 2
+
+    # Storing an element in an absent slab makes it visible.
+    ds.store(_Element(C.NODE, '9'))
+    assert ds.fetch(C.NODE, '9') == {'id': '9'}
+
+def test_store_evicted_slab(config):
+    "Test that storing into an uncached slab keeps its other elements."
+
+    ds = _DictDatastore(config, _make_slabs(0, 1))
+    ds.store(_Element(C.NODE, '1'))
+    assert ds.reads == ['NL0']
+    for k in ['0', '1', '2', '4', '6']:
+        assert ds.fetch(C.NODE, k) == {'id': k}
+    assert ds.fetch(C.NODE, '3') is None
+    assert ds.reads == ['NL0']
+
+def test_negative_cache_geo(config):
+    "Test that absent slabs keyed by location are not read again."
+
+    config.set(C.DATASTORE, C.NEGATIVE_CACHE_SIZE, '16')
+    config.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    config.set(C.DATASTORE, C.SLAB_LAYOUT, C.GEO)
+    config.set(C.DATASTORE, C.SLAB_GEOHASH_LENGTH, '4')
+    init_slabutil(config)
+    try:
+        ds = _DictDatastore(config, {})
+        locations = {'1': (100000000, 200000000)}
+        for _ in range(2):
+            assert list(ds.fetch_keys(C.NODE, ['1'], locations=locations)) \
+                == [(False, '1')]
+        assert len(ds.reads) == 1 and ds.reads[0].startswith('NG')
+        assert ds.statistics()['negative-hits'] == 1
+
+        # Absent slabs are read again once the data store is reloaded.
+        ds.discard_cache()
+        list(ds.fetch_keys(C.NODE, ['1'], locations=locations))
+        assert len(ds.reads) == 2
+    finally:
+        config.remove_option(C.DATASTORE, C.SLAB_LAYOUT)
+        init_slabutil(config)
+
+def test_afetch_keys(config):
+    "Test asynchronous retrieval of present and missing keys."
+
+    ds = _DictDatastore(config, _make_slabs(0, 2))
+
+    keys = map(str, range(0, 3 * _PER_SLAB))
+    elems = IOLoop.current().run_sync(lambda: ds.afetch_keys(C.NODE, keys))
+    present = dict([(v['id'], True) if st else (v, False)
+                    for (st, v) in elems])
+    for k in keys:
+        assert present[k] == (int(k) % 2 == 0 and int(k) < 2 * _PER_SLAB)
+    assert sorted(ds.reads) == ['NL0', 'NL16', 'NL8']
+
+    assert IOLoop.current().run_sync(
+        lambda: ds.afetch(C.NODE, '2')) == {'id': '2'}
+    assert len(ds.reads) == 3
+
+def test_async_single_flight(config):
+    "Test that concurrent asynchronous reads of a slab share one request."
+
+    reply = Future()
+
+    class _AsyncDatastore(_DictDatastore):
+        @gen.coroutine
+        def aretrieve_slabs(self, namespace, slabkeys):
+            self.reads.extend(slabkeys)
+            yield reply
+            raise gen.Return(dict([(sk, self.slabs.get(sk))
+                                   for sk in slabkeys]))
+
+    ds = _AsyncDatastore(config, _make_slabs(0, 1))
+
+    @gen.coroutine
+    def _fetch_both():
+        first = ds.afetch(C.NODE, '2')
+        second = ds.afetch(C.NODE, '4')
+        reply.set_result(None)
+        results = yield [first, second]
+        raise gen.Return(results)
+
+    results = IOLoop.current().run_sync(_fetch_both)
+    assert ds.reads == ['NL0']
+    assert [r['id'] for r in results] == ['2', '4']
+
+def test_close(config):
+    "Test that closing a datastore closes its slab trace."
+
+    ds = _DictDatastore(config, _make_slabs(0, 1))
+    trace = ds.cache.trace = StringIO()
+    ds.fetch(C.NODE, '0')
+    assert trace.getvalue() == "NL0\n"
+    ds.close()
+    assert trace.closed and ds.cache.trace is None
+    ds.fetch(C.NODE, '2')
@@ -25,8 +25,13 @@ import memcache
 import json
 import pytest
 
+from tornado.ioloop import IOLoop
+
+from benchmarks.fakememcached import FakeMemcached
+from datastore.asyncmemcache import MemcacheError
 from datastore.ds_membase import Datastore
-from datastore.slabutil import slabutil_init
+from datastore.slabutil import init_slabutil, slabutil_init, \
+    slabutil_make_slab
 from ConfigParser import ConfigParser
 import apiserver.osmelement as O
 
@@ -45,8 +50,8 @@ def insert_key(key, value):
     c = memcache.Client(['%s:%s' % (__DBHOST, __DBPORT)])
     c.set(key, value)
 
-def retrieve_key(key):
-    c = memcache.Client(['%s:%s' % (__DBHOST, __DBPORT)])
+def retrieve_key(key, port=__DBPORT):
+    c = memcache.Client(['%s:%s' % (__DBHOST, port)])
     return c.get(key)
 
 def pytest_funcarg__datastore(request):
@@ -137,3 +142,198 @@ def test_datastore_write_element(datastore):
     
     v = retrieve_key(_geodoc_key)
     assert v == O.encode_json(_geodoc_val)
+
+def test_datastore_indirect_elements():
+    "Test that elements larger than the inline size are stored separately."
+
+    server = FakeMemcached()
+    port = server.start()
+
+    for encoding in [C.JSON, C.BINARY, C.PROTOBUF]:
+        cfg = ConfigParser()
+        cfg.add_section(C.DATASTORE)
+        cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+        for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+                  C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+            cfg.set(C.DATASTORE, k, str(__INLINE_SIZE))
+        for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+                  C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+            cfg.set(C.DATASTORE, k, str(__PER_SLAB))
+        cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, encoding)
+        cfg.set(C.DATASTORE, C.SLAB_LRU_SIZE, str(__SLAB_LRU_SIZE))
+        cfg.add_section(C.FRONT_END)
+        cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+        cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+        cfg.add_section(C.MEMBASE)
+        cfg.set(C.MEMBASE, C.DBHOST, '127.0.0.1')
+        cfg.set(C.MEMBASE, C.DBPORT, str(port))
+        init_slabutil(cfg)
+        O.init_osm_factory(cfg)
+
+        datastore = Datastore(cfg, writeback=True)
+        datastore.initialize()
+
+        items = []
+        for k in range(__PER_SLAB, 2 * __PER_SLAB, 2):
+            w = O.new_osm_element(C.WAY, str(k))
+            w[C.NODES] = range(k)
+            if k % 4 == 0:
+                w[C.TAGS] = {'note': 'x' * __INLINE_SIZE}
+            items.append((w.id, w))
+        datastore.store_slab(C.WAY, 'WL8', slabutil_make_slab(C.WAY, items))
+
+        assert len(retrieve_key('WL8', port)) < 4 * __INLINE_SIZE
+        assert retrieve_key('W8', port) is not None
+        assert retrieve_key('W10', port) is None
+
+        slab = datastore.retrieve_slab(C.WAY, 'WL8')
+        for (k, w) in items:
+            assert slab.get(k) == (True, w)
+        assert slab.get('9') == (False, '9')
+
+        slabs = IOLoop.current().run_sync(
+            lambda: datastore.aretrieve_slabs(C.WAY, ['WL8', 'WL16']))
+        assert slabs['WL16'] is None
+        assert [e for (st, e) in slabs['WL8'].items() if st] == \
+            [w for (_, w) in items]
+
+        # A missing element is reported as not present.
+        del server.data['W8']
+        slab = datastore.retrieve_slab(C.WAY, 'WL8')
+        assert slab.get('8') == (False, '8')
+        assert slab.get('10') == (True, items[1][1])
+        slabs = IOLoop.current().run_sync(
+            lambda: datastore.aretrieve_slabs(C.WAY, ['WL8']))
+        assert slabs['WL8'].get('8') == (False, '8')
+
+        # Elements that shrink are moved into the slab.
+        datastore.store_slab(C.WAY, 'WL8', slabutil_make_slab(C.WAY, items))
+        assert retrieve_key('W12', port) is not None
+        w = O.new_osm_element(C.WAY, '12')
+        w[C.NODES] = range(12)
+        items[2] = (w.id, w)
+        datastore.store_slab(C.WAY, 'WL8', slabutil_make_slab(C.WAY, items))
+        assert retrieve_key('W8', port) is not None
+        assert retrieve_key('W12', port) is None
+        slab = datastore.retrieve_slab(C.WAY, 'WL8')
+        for (k, w) in items:
+            assert slab.get(k) == (True, w)
+
+def test_datastore_geo_layout():
+    "Test that nodes and ways may be grouped into slabs by location."
+
+    server = FakeMemcached()
+    port = server.start()
+
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, str(__INLINE_SIZE))
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, str(__PER_SLAB))
+    cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, C.JSON)
+    cfg.set(C.DATASTORE, C.SLAB_LRU_SIZE, str(__SLAB_LRU_SIZE))
+    cfg.set(C.DATASTORE, C.SLAB_LAYOUT, C.GEO)
+    cfg.set(C.DATASTORE, C.SLAB_GEOHASH_LENGTH, '4')
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+    cfg.add_section(C.MEMBASE)
+    cfg.set(C.MEMBASE, C.DBHOST, '127.0.0.1')
+    cfg.set(C.MEMBASE, C.DBPORT, str(port))
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+
+    datastore = Datastore(cfg, writeback=True)
+    datastore.initialize()
+
+    # Nodes 0..19 lie in two cells, alternately; node 20 has no location.
+    locations = {}
+    for k in range(20):
+        n = O.new_osm_element(C.NODE, str(k))
+        n[C.LAT] = 10000000 * (10 + 20 * (k % 2)) + k
+        n[C.LON] = 20000000
+        locations[n.id] = (n[C.LAT], n[C.LON])
+        datastore.store(n)
+    datastore.store(O.new_osm_element(C.NODE, '20'))
+    w = O.new_osm_element(C.WAY, '3')
+    w[C.NODES] = [3, 4]
+    datastore.store(w, locations['3'])
+    datastore.finalize()
+
+    assert retrieve_key('NX0', port) is not None
+    assert retrieve_key('NL0', port) is None
+    assert retrieve_key('NU16', port) is not None
+    assert retrieve_key('WX0', port) is not None
+
+    # The front end reads the layout from the data store.
+    cfg.remove_option(C.DATASTORE, C.SLAB_LAYOUT)
+    datastore = Datastore(cfg)
+    assert cfg.get(C.DATASTORE, C.SLAB_LAYOUT) == C.GEO
+    init_slabutil(cfg)
+
+    keys = map(str, range(22))
+    found = [(e.id if st else e, st)
+             for (st, e) in datastore.fetch_keys(C.NODE, keys)]
+    assert dict(found) == dict([(k, k != '21') for k in keys])
+
+    found = IOLoop.current().run_sync(
+        lambda: datastore.afetch_keys(C.NODE, locations.keys(),
+                                      locations=locations))
+    assert sorted([n.id for (st, n) in found if st]) == \
+        sorted(locations.keys())
+
+    found = list(datastore.fetch_keys(C.WAY, ['3', '4']))
+    assert [list(e[C.NODES]) for (st, e) in found if st] == [[3, 4]]
+
+    # Each completed load records a new generation.
+    generation = IOLoop.current().run_sync(datastore.aget_generation)
+    assert generation is not None
+    Datastore(cfg, writeback=True).finalize()
+    assert IOLoop.current().run_sync(datastore.aget_generation) not in \
+        (None, generation)
+
+def test_datastore_stalled():
+    "Test that reads from a stalled data store fail, and can be retried."
+
+    server = FakeMemcached()
+    port = server.start()
+
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, str(__INLINE_SIZE))
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, str(__PER_SLAB))
+    cfg.set(C.DATASTORE, C.DATASTORE_ENCODING, C.JSON)
+    cfg.set(C.DATASTORE, C.SLAB_LRU_SIZE, str(__SLAB_LRU_SIZE))
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+    cfg.add_section(C.MEMBASE)
+    cfg.set(C.MEMBASE, C.DBHOST, '127.0.0.1')
+    cfg.set(C.MEMBASE, C.DBPORT, str(port))
+    cfg.set(C.MEMBASE, C.DBTIMEOUT, '0.1')
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+
+    datastore = Datastore(cfg, writeback=True)
+    datastore.initialize()
+    datastore.store(O.new_osm_element(C.NODE, '1'))
+    datastore.finalize()
+
+    datastore = Datastore(cfg)
+    server.delay = 1.0
+    with pytest.raises(MemcacheError):
+        IOLoop.current().run_sync(lambda: datastore.afetch(C.NODE, '1'))
+    assert datastore.aloading == {}
+
+    server.delay = 0.0
+    node = IOLoop.current().run_sync(lambda: datastore.afetch(C.NODE, '1'))
+    assert node.id == '1'
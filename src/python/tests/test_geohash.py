@@ -22,11 +22,14 @@
 
 """Test the 'datastore.geohash' utility module."""
 
+import geohash
 import pytest
+import random
 
 import apiserver.const as C
 from apiserver.osmelement import new_osm_element
-from datastore.ds_geohash import init_geohash, geohash_key_for_element
+from datastore.ds_geohash import init_geohash, geohash_cover, \
+    geohash_key_for_element, geohash_summary_lengths
 
 _GHKEYLENGTH = 5
 _SCALEFACTOR = 10000000
@@ -57,3 +60,38 @@ def test_geokeys():
         res = geohash_key_for_element(elem)
 
         assert res == ghkey
+
+def test_cover():
+    "Test the geohash cells returned as covering bounding boxes."
+
+    assert geohash_cover((0.0, 0.0, 0.0, 0.0), 5) == ['s0000']
+    assert sorted(geohash_cover((-0.01, -0.01, 0.01, 0.01), 2)) == \
+        ['7z', 'eb', 'kp', 's0']
+    assert len(geohash_cover((-180, -90, 180, 90), 2)) == 32 * 32
+
+    rng = random.Random(0)
+    for _ in xrange(100):
+        precision = rng.randint(1, 6)
+        w, s = rng.uniform(-180, 179), rng.uniform(-90, 89)
+        size = rng.uniform(0, 10.0 / 4**precision)
+        bbox = (w, s, min(180, w + size), min(90, s + size))
+        cover = geohash_cover(bbox, precision)
+        assert len(set(cover)) == len(cover)
+
+        # Every cell overlaps the box ...
+        for c in cover:
+            bb = geohash.bbox(c)
+            assert bb['w'] <= bbox[2] and bbox[0] < bb['e']
+            assert bb['s'] <= bbox[3] and bbox[1] < bb['n']
+
+        # ... and every point in the box lies in a cell.
+        for _ in xrange(20):
+            lat = min(C.MAXGHLAT, rng.uniform(bbox[1], bbox[3]))
+            lon = rng.uniform(bbox[0], bbox[2])
+            assert geohash.encode(lat, lon, precision) in cover
+
+def test_summary_lengths():
+    "Test the lengths of summary geodoc keys."
+    assert geohash_summary_lengths(5) == [3, 1]
+    assert geohash_summary_lengths(6) == [4, 2]
+    assert geohash_summary_lengths(2) == []
@@ -0,0 +1,103 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Test the summary geodocs written by 'dbmgr.dbm_geotables'."""
+
+from ConfigParser import ConfigParser
+from optparse import Values
+
+import apiserver.const as C
+from apiserver.osmelement import encode_coordinate, init_osm_factory, \
+    new_osm_element
+from datastore.ds_geohash import init_geohash
+from dbmgr.dbm_geotables import GeoGroupTable
+
+_GHKEYLENGTH = 5
+_SCALEFACTOR = 10000000
+
+class _Store:
+    "An in-memory store for geodocs."
+    def __init__(self):
+        self.geodocs = {}
+        self.reads = 0
+    def retrieve_element(self, namespace, key):
+        self.reads += 1
+        return self.geodocs.get(key)
+    def retrieve_elements(self, namespace, keys):
+        self.reads += 1
+        return dict([(k, self.geodocs.get(k)) for k in keys])
+    def store_element(self, namespace, key, value):
+        self.geodocs[key] = value
+
+def pytest_funcarg__config(request):
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.GEODOC_LRU_SIZE, '8')
+    cfg.set(C.DATASTORE, C.GEODOC_OCCUPANCY, 'true')
+    cfg.set(C.DATASTORE, C.GEODOC_SUMMARY_NODES, '3')
+    cfg.set(C.DATASTORE, C.GEOHASH_LENGTH, str(_GHKEYLENGTH))
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, str(_SCALEFACTOR))
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+    init_geohash(_GHKEYLENGTH, _SCALEFACTOR)
+    init_osm_factory(cfg)
+    return cfg
+
+def _add_nodes(geotable, locations, start=0):
+    for (i, (lat, lon)) in enumerate(locations):
+        n = new_osm_element(C.NODE, str(start + i))
+        n[C.LAT] = encode_coordinate(lat)
+        n[C.LON] = encode_coordinate(lon)
+        geotable.add(n)
+    geotable.flush()
+
+def test_summaries(config):
+    "Test that summary geodocs list non-empty cells and their counts."
+
+    store = _Store()
+    geotable = GeoGroupTable(config, Values({'nothreading': True}), store)
+    _add_nodes(geotable, [(0.001, 0.001), (0.002, 0.002), (0.1, 0.1)])
+
+    # Geodocs 's0000' and 's000d', under summaries 's00' and 's'.
+    assert sorted(store.geodocs) == ['s', 's00', 's0000', 's000d']
+    s00 = store.geodocs['s00']
+    assert s00[C.CELLS] == [['00', 2], ['0d', 1]]
+    assert sorted(s00[C.NODES]) == \
+        sorted(store.geodocs['s0000'][C.NODES] +
+               store.geodocs['s000d'][C.NODES])
+    assert store.geodocs['s'][C.CELLS] == [['00', 3]]
+    for geodoc in store.geodocs.values(): # In order of latitude.
+        nodes = geodoc[C.NODES]
+        assert nodes == sorted(nodes, key=lambda n: (n[1], n[2]))
+    assert len(store.geodocs['s'][C.NODES]) == 3
+
+    # Two geodocs, then two reads per summary level.
+    assert store.reads == 2 + 2 * 2
+
+    # Summaries are merged with those already present, and stop
+    # holding nodes once they cover too many.
+    geotable = GeoGroupTable(config, Values({'nothreading': True}), store)
+    _add_nodes(geotable, [(0.001, 0.1)], 3)
+    assert store.geodocs['s00'][C.CELLS] == [['00', 2], ['04', 1], ['0d', 1]]
+    assert store.geodocs['s00'][C.NODES] == []
+    assert store.geodocs['s'][C.CELLS] == [['00', 4]]
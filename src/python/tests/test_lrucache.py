@@ -21,10 +21,12 @@
 # SOFTWARE.
 
 import pytest
+import threading
 from ConfigParser import ConfigParser
 
 import apiserver.const as C
-from datastore.lrucache import LRUCache
+from datastore.lrucache import BoundedLRUBuffer, KeyedWaitTable, LRUCache, \
+    TwoQueueBuffer
 from datastore.slabutil import slabutil_make_slab, slabutil_init
 
 _INLINE_SIZE = 256
@@ -235,3 +237,237 @@ def test_flush(slabutil):
 
     lc.flush()
     assert seen[0] is True
+
+
+def test_discard(slabutil):
+    "Test that discarded slabs are not written back."
+
+    def _cb(slabkey, slabdesc):
+        assert False, "Slab written back: %s" % slabkey
+
+    for policy in [C.LRU, C.TWOQ]:
+        lc = LRUCache(_LRUSZ, _cb, nsbytebounds={_NS1: 65536},
+                      policy=policy, negbound=4)
+        for (ns, i) in [(_NS, 0), (_NS, 1), (_NS1, 0)]:
+            v = [i * _SLABSZ]
+            lc.insert_slab(slabutil_make_slab(ns, zip(map(str, v), v)))
+        lc.insert_negative('NL%d' % (2 * _SLABSZ))
+        lc.discard()
+        assert len(lc) == 0 and len(lc.negative) == 0
+        assert lc.get(_NS, '0') is None
+        assert lc.bytes_by_namespace() == {}
+
+
+def test_buffer_lru_order():
+    "Test that lookups and updates move keys to the most recently used end."
+
+    ejected = []
+    def _cb(key, value):
+        ejected.append((key, value))
+
+    b = BoundedLRUBuffer(bound=3, callback=_cb)
+    for k in ['a', 'b', 'c']:
+        b[k] = k.upper()
+
+    b['a']                      # 'b' is now the least recently used.
+    b['c'] = 'CC'               # Overwrites do not eject.
+    assert len(b) == 3
+    assert ejected == []
+
+    b['d'] = 'D'
+    assert ejected == [('b', 'B')]
+    assert 'b' not in b
+
+    assert b.pop() == ('a', 'A')
+    del b['c']
+    assert list(b) == ['d']
+
+
+def test_buffer_flush():
+    "Test that flush() ejects entries in least recently used order."
+
+    ejected = []
+    b = BoundedLRUBuffer(bound=8,
+                         callback=lambda k, v: ejected.append(k))
+    for k in ['a', 'b', 'c', 'd']:
+        b[k] = k
+    for _ in xrange(100):       # Repeated touches leave no residue.
+        b['b']
+        b['a']
+
+    b.flush()
+    assert ejected == ['c', 'd', 'b', 'a']
+    assert len(b) == 0
+    with pytest.raises(IndexError):
+        b.pop()
+
+
+def test_weighted_buffer():
+    "Test that a weighed buffer is bounded by the sum of its weights."
+
+    ejected = []
+    b = BoundedLRUBuffer(bound=10, callback=lambda k, v: ejected.append(k),
+                         weigher=len)
+    b['a'] = 'aaaa'
+    b['b'] = 'bbbb'
+    assert b.weight == 8
+    b['c'] = 'cccc'             # Ejects 'a'.
+    assert ejected == ['a']
+    assert b.weight == 8
+
+    b['b'] = 'bbbbbbbbbbbbbbbb' # Oversized, but most recently used.
+    assert ejected == ['a', 'c']
+    assert list(b) == ['b']
+    assert b.weight == 16
+
+
+def test_byte_bound(slabutil):
+    "Test that a byte-bounded cache ejects slabs by footprint."
+
+    slabutil.set(C.DATASTORE, C.SLAB_LRU_BYTES, '65536')
+    slabutil_init(slabutil)
+    slabs = [slabutil_make_slab(_NS, [(str(i * _SLABSZ), i)])
+             for i in xrange(4)]
+    footprint = slabs[0].footprint
+    assert footprint > 0
+
+    ejected = []
+    lc = LRUCache(_LRUSZ, lambda k, s: ejected.append(s),
+                  bytebound=3 * footprint)
+    for sl in slabs:
+        lc.insert_slab(sl)
+
+    assert ejected == [slabs[0]]
+    assert lc.bytes_by_namespace() == {_NS: 3 * footprint}
+
+
+def test_namespace_partitions(slabutil):
+    "Test that per-namespace budgets isolate namespaces from each other."
+
+    slabutil.set(C.DATASTORE, C.WAYS_LRU_BYTES, '65536')
+    slabutil_init(slabutil)
+
+    def _mkslab(ns, i):
+        return slabutil_make_slab(ns, [(str(i * _SLABSZ), i)])
+
+    footprint = _mkslab(_NS, 0).footprint
+    ejected = []
+    lc = LRUCache(_LRUSZ, lambda k, s: ejected.append(s.namespace),
+                  bytebound=2 * footprint,
+                  nsbytebounds={_NS1: footprint})
+
+    for i in xrange(2):
+        lc.insert_slab(_mkslab(_NS, i))
+    for i in xrange(3):
+        lc.insert_slab(_mkslab(_NS1, i))
+
+    assert ejected == [_NS1, _NS1]
+    assert lc.bytes_by_namespace() == {_NS: 2 * footprint, _NS1: footprint}
+
+    lc.flush()
+    assert lc.bytes_by_namespace() == {}
+
+
+def test_twoqueue_scan_resistance():
+    "Test that a scan does not eject frequently used keys from a 2Q buffer."
+
+    ejected = []
+    b = TwoQueueBuffer(bound=8, callback=lambda k, v: ejected.append(k))
+
+    # Make 'hot' a frequently used key: it passes through 'A1in',
+    # is remembered in the ghost queue, and then enters 'Am'.
+    b['hot'] = 'hot'
+    for i in xrange(8):
+        b['cold%d' % i] = i
+    assert 'hot' not in b
+    b['hot'] = 'hot'
+    assert 'hot' in b
+
+    # Scan a large number of keys.
+    for i in xrange(100):
+        b['scan%d' % i] = i
+        assert len(b) <= 8
+
+    assert b['hot'] == 'hot'
+    assert 'hot' not in ejected[1:]
+
+    b.flush()
+    assert len(b) == 0
+
+
+def test_cache_policy(slabutil):
+    "Test that the cache can use a non-default replacement policy."
+
+    with pytest.raises(ValueError):
+        LRUCache(_LRUSZ, policy='no-such-policy')
+
+    ejected = []
+    lc = LRUCache(_LRUSZ, lambda k, s: ejected.append(s), policy='2q')
+    for i in xrange(2 * _LRUSZ):
+        v = [i * _SLABSZ]
+        lc.insert_slab(slabutil_make_slab(_NS, zip(map(str, v), v)))
+        st, value = lc.get(_NS, str(i * _SLABSZ))
+        assert st and value == i * _SLABSZ
+    assert len(ejected) == _LRUSZ
+
+    lc.flush()
+    assert len(lc) == 0
+
+
+def test_wait_table():
+    "Test that waiters on a busy key are released when it completes."
+
+    t = KeyedWaitTable()
+    assert t.begin('a')
+    assert not t.begin('a')
+    assert t.begin('b')
+    assert 'a' in t and len(t) == 2
+
+    released = []
+    def _waiter(key):
+        t.wait(key)
+        released.append(key)
+
+    waiters = [threading.Thread(target=_waiter, args=(k,))
+               for k in ['a', 'a', 'b']]
+    for w in waiters:
+        w.start()
+
+    t.end('a')
+    for w in waiters[:2]:
+        w.join(10)
+    assert released == ['a', 'a']
+
+    t.end('b')
+    waiters[2].join(10)
+    assert released == ['a', 'a', 'b']
+
+    t.wait('c')                 # Keys that are not busy do not block.
+    t.acquire('c')
+    assert 'c' in t
+
+def test_negative_cache(slabutil):
+    "Test remembering slabs that are absent from the data store."
+
+    lc = LRUCache(_LRUSZ, negbound=2, negttl=10)
+    now = [1000.0]
+    lc.clock = lambda: now[0]
+
+    for sk in ['NL0', 'NL16', 'NL32']:
+        lc.insert_negative(sk)
+    assert lc.get(_NS, '0') is None # Oldest entry was ejected.
+    assert lc.get(_NS, '17') == (False, '17')
+    assert lc.negative_hits == 1
+
+    # Entries expire.
+    now[0] += 10
+    assert lc.get(_NS, '33') is None
+    assert 'NL32' not in lc.negative
+
+    # Inserting a slab discards its negative entry.
+    lc.insert_negative('NL16')
+    lc.insert_slab(slabutil_make_slab(_NS, [('16', 16)]))
+    assert lc.get(_NS, '16') == (True, 16)
+    assert lc.get(_NS, '17') == (False, '17')
+    assert lc.negative_hits == 2
+    assert len(lc.negative) == 0
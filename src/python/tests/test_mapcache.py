@@ -0,0 +1,129 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Test the /map response cache in 'frontend.mapcache'."""
+
+from ConfigParser import ConfigParser
+from tornado.concurrent import Future
+
+import apiserver.const as C
+from apiserver.osmelement import encode_coordinate, init_osm_factory, \
+    new_osm_element
+from datastore.ds_geohash import init_geohash
+from frontend.mapcache import MapCache, MapTile, merge_tiles
+from frontend.util import DatastoreGeneration
+
+_GHKEYLENGTH = 5
+_SCALEFACTOR = 10000000
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+class _Store:
+    "A data store with a settable generation."
+    def __init__(self):
+        self.generation = 'a'
+    def aget_generation(self):
+        return _resolved(self.generation)
+
+def pytest_funcarg__config(request):
+    cfg = ConfigParser()
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, str(_SCALEFACTOR))
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.MAP_CACHE_BYTES, '1000000')
+    cfg.set(C.FRONT_END, C.MAP_CACHE_GEOHASH_LENGTH, str(_GHKEYLENGTH))
+    cfg.set(C.FRONT_END, C.MAP_CACHE_TTL, '0')
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+    init_geohash(_GHKEYLENGTH, _SCALEFACTOR)
+    init_osm_factory(cfg)
+    return cfg
+
+def _elements():
+    "Return the elements of the response for tile 's0000'."
+    elements = []
+    for (nodeid, lat, refs) in [('1', 0.001, ['W1', 'R1']),
+                                ('2', 0.1, ['W1', 'R2'])]:
+        n = new_osm_element(C.NODE, nodeid)
+        n[C.LAT] = n[C.LON] = encode_coordinate(lat)
+        n[C.REFERENCES].update(refs)
+        elements.append(n)
+    w = new_osm_element(C.WAY, '1')
+    w[C.NODES] = [1, 2]
+    w[C.REFERENCES].add('R3')
+    elements.append(w)
+    for (relid, refs) in [('1', ['R4']), ('2', []), ('3', []), ('4', [])]:
+        r = new_osm_element(C.RELATION, relid)
+        r[C.REFERENCES].update(refs)
+        elements.append(r)
+    return elements
+
+def test_merge_tiles(config):
+    "Test that the elements of a response are found from tiles."
+
+    tile = MapTile('s0000', _elements())
+    nodelocs = dict(tile.geodoc.get_nodes())
+    assert nodelocs.keys() == ['1']     # Only node '1' lies in the tile.
+
+    nodelocs, wayids, relids = merge_tiles([tile], nodelocs)
+    assert sorted(nodelocs) == ['1', '2']
+    assert nodelocs['2'] == (encode_coordinate(0.1),) * 2
+    assert wayids == ['1']
+    assert sorted(relids) == ['1', '2', '3', '4']
+
+    assert merge_tiles([tile], {}) == ({}, [], [])
+
+def test_cache_generation(config):
+    "Test that the cache is flushed when the data store changes."
+
+    store = _Store()
+    generation = DatastoreGeneration(store)
+    mapcache = MapCache(config, generation)
+    generation.check()
+    assert generation.value == 'a'
+    assert mapcache.get('s0000') is None
+
+    tile = MapTile('s0000', _elements())
+    future = mapcache.fill('s0000', lambda key: _resolved(tile))
+    assert future.result() is tile
+    assert mapcache.get('s0000') is tile
+    assert (mapcache.hits, mapcache.misses) == (1, 1)
+
+    # Generations are only read once in a while.
+    store.generation = 'b'
+    generation.check()
+    assert mapcache.get('s0000') is tile
+    generation.checked = None
+    generation.check()
+    assert mapcache.get('s0000') is None
+
+    # Tiles built from an older generation are not kept.
+    building = Future()
+    mapcache.fill('s0000', lambda key: building)
+    store.generation = 'c'
+    generation.checked = None
+    generation.check()
+    building.set_result(tile)
+    assert mapcache.get('s0000') is None
@@ -0,0 +1,254 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Test the /map handler in 'frontend.maphandler'.
+
+The handler is run against a synthetic map held in a fake memcached
+server (see 'benchmarks.bench_frontend')."""
+
+import gc
+import geohash
+import logging
+
+from lxml import etree as ET
+from tornado import gen
+from tornado.httpserver import HTTPServer
+from tornado.log import app_log
+from tornado.testing import AsyncHTTPTestCase, ExpectLog, bind_unused_port
+
+import apiserver.const as C
+from benchmarks.bench_frontend import grid_bbox, make_config, populate, \
+    ORIGIN, SPACING
+from benchmarks.fakememcached import FakeMemcached
+from datastore.asyncmemcache import MemcacheError
+from datastore.ds_geohash import geohash_cover
+from datastore.ds_membase import DatastoreMembase
+from frontend.fe import OSMFrontEndServer
+from frontend.maphandler import _filter_in_bbox
+from frontend.util import filter_references
+
+_SIDE = 20                      # Nodes per side of the map.
+
+_port = None
+
+def _config():
+    "Return a configuration for a data store holding the map."
+    global _port
+    if _port is None:
+        _port = FakeMemcached().start()
+        populate(make_config(_port), _SIDE)
+    return make_config(_port)
+
+def _bboxes():
+    "Return bounding boxes covering various parts of the map."
+    lat, lon = ORIGIN
+    return [grid_bbox(5),
+            (lon + 3.5 * SPACING, lat + 2.5 * SPACING,
+             lon + 12.5 * SPACING, lat + 7.5 * SPACING),
+            (lon - 1.0, lat - 1.0, lon + 1.0, lat + 1.0),
+            (lon - 1.0, lat - 1.0, lon - 0.5, lat - 0.5)]
+
+def _url(bbox):
+    return '/api/0.6/map?bbox=%.7f,%.7f,%.7f,%.7f' % tuple(bbox)
+
+def _elements(body):
+    "Return the (namespace, id) pairs of a response, in order."
+    return [(e.tag, e.get(C.ID)) for e in ET.fromstring(body)
+            if e.tag in (C.NODE, C.WAY, C.RELATION)]
+
+def _sequential_map(config, datastore, bbox):
+    """Return the elements of a /map response, one read at a time.
+
+    This follows the original, sequential implementation of the
+    handler.  The result is a list of groups of (namespace, id)
+    pairs; a response lists the groups in order, and the elements of
+    each group in any order."""
+
+    def fetch(namespace, keys):
+        return [e for (st, e) in datastore.fetch_keys(namespace, list(keys))
+                if st]
+    def ids(elements):
+        return set([(e.namespace, e.id) for e in elements])
+
+    precision = config.getint(C.DATASTORE, C.GEOHASH_LENGTH)
+    geodocs = fetch(C.GEODOC, geohash_cover(bbox, precision))
+    nodeset = set(_filter_in_bbox(bbox, geodocs))
+    if not nodeset:
+        return []
+    nodes = fetch(C.NODE, nodeset)
+    ways = fetch(C.WAY, filter_references(C.WAY, nodes))
+    waynodeset = set()
+    for w in ways:
+        waynodeset.update(w.get_node_ids())
+    extranodes = fetch(C.NODE, waynodeset - nodeset)
+    relset = filter_references(C.RELATION, nodes + extranodes)
+    relset.update(filter_references(C.RELATION, ways))
+    relations = fetch(C.RELATION, relset)
+    parents = fetch(C.RELATION,
+                    filter_references(C.RELATION, relations) - relset)
+    return [ids(nodes), ids(extranodes), ids(ways), ids(relations),
+            ids(parents)]
+
+def _in_groups(elements, groups):
+    "Return whether 'elements' lists the members of 'groups' in order."
+    start = 0
+    for group in groups:
+        if set(elements[start:start + len(group)]) != group:
+            return False
+        start += len(group)
+    return start == len(elements)
+
+
+class _MapTestCase(AsyncHTTPTestCase):
+    "Run a front end against the map."
+
+    options = {}
+
+    def get_app(self):
+        self.config = _config()
+        for (k, v) in self.options.items():
+            self.config.set(C.FRONT_END, k, v)
+        self.datastore = DatastoreMembase(self.config)
+        return OSMFrontEndServer(self.config, None,
+                                 self.datastore).application
+
+    def tearDown(self):
+        self.datastore.aclient.close()
+        self.datastore._get_connection().disconnect_all()
+        super(_MapTestCase, self).tearDown()
+
+
+class MapHandlerTest(_MapTestCase):
+
+    options = {C.MAP_CACHE_BYTES: '0'}
+
+    def test_map(self):
+        "Test that /map responses match those of the sequential version."
+        for bbox in _bboxes():
+            response = self.fetch(_url(bbox))
+            assert response.code == 200
+            elements = _elements(response.body)
+            groups = _sequential_map(self.config, self.datastore, bbox)
+            assert _in_groups(elements, groups), bbox
+            assert len(elements) == len(set(elements))
+
+    def test_failed_read(self):
+        "Test that reads are all waited for when one of them fails."
+
+        afetch_keys = self.datastore.afetch_keys
+        @gen.coroutine
+        def failing_afetch_keys(namespace, keys, **kwargs):
+            if namespace in (C.WAY, C.RELATION):
+                yield gen.moment
+                raise MemcacheError, "Read failed"
+            found = yield afetch_keys(namespace, keys, **kwargs)
+            raise gen.Return(found)
+        self.datastore.afetch_keys = failing_afetch_keys
+
+        unobserved = []
+        class _Handler(logging.Handler):
+            def emit(self, record):
+                if 'never retrieved' in record.getMessage():
+                    unobserved.append(record)
+        handler = _Handler()
+        app_log.addHandler(handler)
+        try:
+            with ExpectLog(app_log, "Uncaught exception"):
+                response = self.fetch(_url(grid_bbox(5)))
+            gc.collect()
+        finally:
+            app_log.removeHandler(handler)
+        assert '</osm>' not in response.body
+        assert unobserved == []
+
+
+class MapCacheTest(_MapTestCase):
+
+    options = {C.MAP_CACHE_BYTES: '1000000'}
+
+    def test_cached_map(self):
+        "Test that /map responses are the same with and without the cache."
+
+        config = _config()
+        config.set(C.FRONT_END, C.MAP_CACHE_BYTES, '0')
+        server = HTTPServer(OSMFrontEndServer(config, None,
+                                              self.datastore).application)
+        sock, port = bind_unused_port()
+        server.add_sockets([sock])
+
+        # Include boxes whose edges lie on the edges of tiles.
+        length = self.config.getint(C.FRONT_END, C.MAP_CACHE_GEOHASH_LENGTH)
+        bb = geohash.bbox(geohash.encode(ORIGIN[0] + 5 * SPACING,
+                                         ORIGIN[1] + 5 * SPACING, length))
+        bboxes = _bboxes() + [(bb['w'], bb['s'], bb['e'], bb['n']),
+                              (bb['e'], bb['s'], bb['e'] + 0.01, bb['n']),
+                              (bb['w'], bb['n'], bb['e'], bb['n'] + 0.005),
+                              (bb['w'], bb['s'], bb['e'] + 0.005, bb['n'])]
+        try:
+            for bbox in bboxes + bboxes:
+                self.http_client.fetch('http://127.0.0.1:%d%s' %
+                                       (port, _url(bbox)), self.stop)
+                expected = self.wait()
+                response = self.fetch(_url(bbox))
+                assert response.code == expected.code == 200
+                assert sorted(response.body.splitlines()) == \
+                    sorted(expected.body.splitlines()), bbox
+                elements = _elements(response.body)
+                namespaces = [ns for (ns, _) in elements]
+                assert namespaces == sorted(namespaces, key=[
+                        C.NODE, C.WAY, C.RELATION].index)
+        finally:
+            server.stop()
+
+
+class ConditionalGetTest(_MapTestCase):
+
+    def _generation(self):
+        "Return the tracker of the data store generation."
+        for rule in self._app.wildcard_router.rules:
+            if 'generation' in rule.target_kwargs:
+                return rule.target_kwargs['generation']
+
+    def test_not_modified(self):
+        "Test that responses the client holds are not sent again."
+        for url in [_url(grid_bbox(5)), '/api/0.6/node/3',
+                    '/api/0.6/way/1/full']:
+            response = self.fetch(url)
+            assert response.code == 200
+            etag = response.headers['Etag']
+            response = self.fetch(url, headers={'If-None-Match': etag})
+            assert response.code == 304
+            assert response.body == ''
+            response = self.fetch(url, headers={'If-None-Match': '"x"'})
+            assert response.code == 200
+
+    def test_generation(self):
+        "Test that /map responses change tags when the data is reloaded."
+        url = _url(grid_bbox(5))
+        response = self.fetch(url)
+        etag = response.headers['Etag']
+
+        DatastoreMembase(self.config, writeback=True).finalize()
+        self._generation().checked = None
+        response = self.fetch(url, headers={'If-None-Match': etag})
+        assert response.code == 200
+        assert response.headers['Etag'] != etag
+        assert '</osm>' in response.body
@@ -0,0 +1,98 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Test the binary encoding in 'apiserver.osmbinary'."""
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from apiserver.osmbinary import *
+from tests.test_osmelement import pytest_funcarg__config
+
+def test_values():
+    "Test that Python values round trip through the binary encoding."
+
+    values = [None, True, False, 0, 1, -1, 300, -300, 2**70, 1.5,
+              "", "0", "42", "042", "W1234", "N", "x1y", u"caf\xe9",
+              [], ["1", 2, [3]], {"k": "v", "n": {"m": 1}}]
+    for v in values:
+        bits = encode_binary(v)
+        assert decode_binary(bits) == v, v
+        assert type(decode_binary(bits)) == type(v) or \
+            isinstance(v, basestring)
+
+    # Strings are returned as the JSON decoder would return them.
+    assert type(decode_binary(encode_binary(u"abc"))) is str
+    assert decode_binary(encode_binary("caf\xc3\xa9")) == u"caf\xe9"
+    assert decode_binary(encode_binary((1, 2))) == [1, 2]
+
+def test_slab(config):
+    "Test encoding and random access of a slab."
+
+    O.init_osm_factory(config)
+
+    mappings = []
+    for i in range(8, 16):
+        n = O.new_osm_element(C.NODE, str(i))
+        n[C.LAT] = O.encode_coordinate("51.%d" % i)
+        n[C.LON] = O.encode_coordinate("-0.%d" % i)
+        n[C.VERSION] = 2
+        n[C.USER] = "mapper"
+        n[C.UID] = 1000 + i
+        n[C.TIMESTAMP] = "2011-01-%02dT10:11:12Z" % i
+        n[C.VISIBLE] = True
+        n[C.TAGS] = {"amenity": "pub", "name": u"The %d \xe9" % i}
+        n[C.REFERENCES].add("W%d" % i)
+        n["extra"] = "value"
+        mappings.append(n.as_mapping())
+    w = O.new_osm_element(C.WAY, "16")
+    w[C.NODES] = [100, 99, 3000000000, 7]
+    w[C.TIMESTAMP] = "not a timestamp"
+    w[C.VERSION] = -1
+    mappings.append(w.as_mapping())
+    r = O.new_osm_element(C.RELATION, "20")
+    r[C.MEMBERS] = [("1", "outer", "way"), ("2", "", "node")]
+    mappings.append(r.as_mapping())
+
+    bits = encode_binary_slab(mappings)
+    assert bits.startswith(SLAB_MAGIC)
+    assert len(bits) < len(O.encode_json(mappings)) / 2
+
+    slab = BinarySlab(bits)
+    assert len(slab) == len(mappings)
+    assert slab.ids == [m[C.ID] for m in mappings]
+    for slot in [9, 3, 0, 8]:
+        m = slab.mapping(slot)
+        assert m == mappings[slot]
+    assert slab.indirect == []
+    assert is_binary_slab(bits)
+
+    # Slabs in the first version of the format.
+    v1bits = "\xb5\x01" + bits[2] + bits[4:]
+    assert is_binary_slab(v1bits)
+    assert BinarySlab(v1bits).mapping(9) == mappings[9]
+
+    # Slabs with elements stored outside the slab.
+    slab = BinarySlab(encode_binary_slab(mappings[:2], ["30", "21"]))
+    assert slab.ids == ["8", "9"]
+    assert slab.indirect == ["30", "21"]
+    assert slab.mapping(1) == mappings[1]
@@ -78,7 +78,7 @@ def test_new_way(config):
     # Check the "id", NODES and REFERENCES attributes.
     assert w.id == str(wayid)
     assert w[C.REFERENCES] == set()
-    assert w[C.NODES] == set()
+    assert w[C.NODES] == ()
 
 
 def test_new_relation(config):
@@ -91,7 +91,7 @@ def test_new_relation(config):
     # Check the "id", MEMBER and REFERENCES attributes. 
     assert r.id == str(relid)
     assert r[C.REFERENCES] == set()
-    assert r[C.MEMBERS] == []
+    assert r[C.MEMBERS] == ()
 
 
 def test_new_geodoc(config):
@@ -110,6 +110,38 @@ def test_new_geodoc(config):
     assert set(bbox.keys()) == set(['n', 's', 'e', 'w'])
 
 
+def test_geodoc_nodes_in_bbox(config):
+    "Test the selection of the nodes of a geodoc lying in a bounding box."
+
+    O.init_osm_factory(config)
+    g = O.new_osm_element(C.GEODOC, 'szmyg')
+    assert list(g.get_nodes_in_bbox(0, 0, 10, 10)) == []
+
+    # Nodes need not be in order of latitude.
+    nodes = [['1', 0, 0], ['2', 5, 9], ['3', 10, 5], ['4', 5, -1]]
+    g[C.NODES] = nodes
+    expected = {'1': (0, 0), '2': (5, 9)}
+    assert dict(g.get_nodes_in_bbox(0, 0, 10, 10)) == expected
+    assert dict(g.get_nodes_in_bbox(-1, 0, 10, 11)) == \
+        dict(g.get_nodes()) == \
+        {'1': (0, 0), '2': (5, 9), '3': (10, 5), '4': (5, -1)}
+
+    # Replacing the nodes of the geodoc is noticed.
+    g[C.NODES] = set([('5', 1, 1)])
+    assert list(g.get_nodes_in_bbox(0, 0, 10, 10)) == [('5', (1, 1))]
+
+    # The result is the same without NumPy.
+    numpy = O.numpy
+    O.numpy = None
+    try:
+        g[C.NODES] = list(nodes)
+        assert dict(g.get_nodes_in_bbox(0, 0, 10, 10)) == expected
+        assert list(g.get_nodes_in_bbox(20, 20, 30, 30)) == []
+        assert len(dict(g.get_nodes())) == 4
+    finally:
+        O.numpy = numpy
+
+
 def test_encode_coordinate(config):
     "Test encoding of a coordinate string."
 
@@ -150,3 +182,85 @@ def test_encode_coordinate(config):
     for (flval, refval) in inputlist:
         v = O.encode_coordinate(flval)
         assert v == refval
+
+def test_xml_fragment(config):
+    "Test caching of the XML text for an element."
+
+    config.set(C.FRONT_END, C.XML_FRAGMENT_CACHE, 'true')
+    O.init_osm_factory(config)
+
+    n = O.new_osm_element(C.NODE, '42')
+    n[C.LAT] = O.encode_coordinate(1.0)
+    n[C.LON] = O.encode_coordinate(2.0)
+
+    xml = n.xml_fragment()
+    assert xml.startswith('  <node ') and xml.endswith('/>\n')
+    assert n.xml_fragment() is xml
+
+    # Changing the element discards the cached text.
+    n[C.TAGS] = {'name': 'x'}
+    assert '<tag k="name" v="x"/>' in n.xml_fragment()
+    for change in [lambda: n.pop(C.TAGS),
+                   lambda: n.update({C.VERSION: '2'}),
+                   lambda: n.setdefault('user', 'u'),
+                   lambda: n.__delitem__('user')]:
+        xml = n.xml_fragment()
+        change()
+        assert n.xml_fragment() != xml
+
+    # Without the option, the text is recomputed each time.
+    config.set(C.FRONT_END, C.XML_FRAGMENT_CACHE, 'false')
+    O.init_osm_factory(config)
+    n = O.new_osm_element(C.NODE, '42')
+    n[C.LAT] = n[C.LON] = O.encode_coordinate(1.0)
+    assert n.xml_fragment() == n.xml_fragment()
+    assert n._xml is None
+
+def test_compact_attributes(config):
+    "Test the translation of elements to and from mappings."
+
+    O.init_osm_factory(config)
+
+    d = {C.ID: '7', C.VERSION: 2, C.CHANGESET: '1234',
+         C.TIMESTAMP: '2011-04-07T17:40:53Z', C.USER: 'someone', C.UID: 9,
+         C.REFERENCES: ['R1'], C.TAGS: {'highway': 'residential'},
+         C.NODES: [3, 1, 2], 'other': 'x'}
+    ways = []
+    for i in range(2):
+        w = O.new_osm_element(C.WAY, '7')
+        w.from_mapping(d)
+        ways.append(w)
+    w = ways[0]
+
+    # Typed and compact representations are used internally...
+    assert w.changeset == 1234
+    assert w.timestamp == 1302198053
+    assert w.nodes == (3, 1, 2)
+    assert w.get_node_ids() == ['3', '1', '2']
+
+    # ... but not in the mapping interface.
+    assert w[C.TIMESTAMP] == '2011-04-07T17:40:53Z'
+    assert w.get('other') == 'x'
+    assert w.get('missing', 42) == 42
+    assert 'missing' not in w and C.REFERENCES in w
+    m = w.as_mapping()
+    assert m[C.NODES] == [3, 1, 2]
+    assert m[C.REFERENCES] == ['R1']
+    assert set(m.keys()) == set(d.keys())
+
+    # Identical tags are shared, and are read-only.
+    assert w.get(C.TAGS) is ways[1].get(C.TAGS)
+    try:
+        w[C.TAGS]['name'] = 'Main Street'
+        assert False, "Expected a TypeError."
+    except TypeError:
+        pass
+
+    # References become a set when retrieved for modification.
+    w[C.REFERENCES].add('R2')
+    assert w.get(C.REFERENCES) == set(['R1', 'R2'])
+    assert ways[1].get(C.REFERENCES) == ('R1',)
+
+    del w['other']
+    assert 'other' not in w
+    assert w != ways[1]
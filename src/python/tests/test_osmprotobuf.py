@@ -0,0 +1,107 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Test the protobuf encoding in 'apiserver.osmprotobuf'."""
+
+import pytest
+
+pytest.importorskip("google.protobuf")
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from apiserver.osmprotobuf import *
+from tests.test_osmelement import pytest_funcarg__config
+
+def _make_elements():
+    "Return a node, a way and a relation."
+    n = O.new_osm_element(C.NODE, "8")
+    n[C.LAT] = O.encode_coordinate("51.5")
+    n[C.LON] = O.encode_coordinate("-0.1")
+    n[C.VERSION] = 2
+    n[C.CHANGESET] = 4567
+    n[C.USER] = u"mapper \xe9"
+    n[C.UID] = 1000
+    n[C.TIMESTAMP] = "2011-01-02T10:11:12Z"
+    n[C.VISIBLE] = True
+    n[C.TAGS] = {"amenity": "pub", "name": "The Crown"}
+    n[C.REFERENCES].add("W9")
+    n["extra"] = [1, 2.5, None, {"k": "v"}]
+
+    w = O.new_osm_element(C.WAY, "9")
+    w[C.NODES] = [100, 99, 3000000000, 7]
+    w[C.TAGS] = {"highway": "residential", "name": "The Crown"}
+    w[C.TIMESTAMP] = "not a timestamp"
+
+    r = O.new_osm_element(C.RELATION, "10")
+    r[C.MEMBERS] = [("9", "outer", "way"), ("8", "", "node")]
+    return [n, w, r]
+
+def _vivify(namespace, m):
+    e = O.new_osm_element(namespace, m[C.ID])
+    e.from_mapping(m)
+    return e
+
+def test_elements(config):
+    "Test that elements round trip through the protobuf encoding."
+
+    O.init_osm_factory(config)
+
+    for e in _make_elements():
+        m = e.as_mapping()
+        bits = encode_protobuf(m)
+        assert len(bits) < len(O.encode_json(m))
+        assert _vivify(e.namespace, decode_protobuf(bits)) == e
+
+    # Geodocs, and the configuration element.
+    g = O.new_osm_element(C.GEODOC, "tdr4t")
+    g[C.NODES] = [("8", 515000000, -1000000), ("12", 515000001, -999999)]
+    m = decode_protobuf(encode_protobuf(g.as_mapping()))
+    assert C.REFERENCES not in m
+    assert _vivify(C.GEODOC, m) == g
+
+    cfg = {C.ID: C.CFGSLAB, C.NODES_PER_SLAB: "256"}
+    assert decode_protobuf(encode_protobuf(cfg)) == cfg
+
+def test_slab(config):
+    "Test encoding and random access of a slab."
+
+    O.init_osm_factory(config)
+
+    elements = _make_elements()
+    slab = ProtobufSlab(encode_protobuf_slab([e.as_mapping()
+                                              for e in elements]))
+    assert len(slab) == 3
+    assert slab.ids == ["8", "9", "10"]
+    for slot in [2, 0, 1]:
+        e = elements[slot]
+        assert _vivify(e.namespace, slab.mapping(slot)) == e
+    assert slab.indirect == []
+
+    # Slabs with elements stored outside the slab.
+    slab = ProtobufSlab(encode_protobuf_slab([elements[0].as_mapping()],
+                                             ["30", "21"]))
+    assert slab.ids == ["8"]
+    assert slab.indirect == ["30", "21"]
+
+    with pytest.raises(ValueError):
+        encode_protobuf_slab([{C.ID: "tdr4t"}])
@@ -0,0 +1,141 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Test the 'frontend.prefork' module."""
+
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import frontend.prefork as prefork
+from frontend.prefork import Supervisor, WorkerStats
+
+class _Request:
+    def request_time(self):
+        return 0.5
+
+class _Handler:
+    "A stand-in for a completed request handler."
+    def __init__(self, status):
+        self.status = status
+        self.request = _Request()
+    def get_status(self):
+        return self.status
+
+def test_worker_stats():
+    "Test that counters updated by a worker are seen by other processes."
+
+    workers = WorkerStats(2)
+    pid = os.fork()
+    if pid == 0:
+        workers.attach(1)
+        for st in [200, 404, 500]:
+            workers.record(_Handler(st))
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    idle, busy = workers.as_list()
+    assert idle['requests'] == 0
+    assert busy['pid'] == pid
+    assert busy['requests'] == 3
+    assert busy['errors'] == 1
+    assert busy['request-msecs'] == 1500.0
+
+def _wait_for(predicate, timeout=10.0):
+    "Wait for 'predicate()' to become true."
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.05)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+def test_supervisor():
+    "Test that workers are restarted, replaced on reload, and stopped."
+
+    logfile = tempfile.NamedTemporaryFile()
+    failflag = logfile.name + ".fail"
+
+    def _worker(slot):
+        if os.path.exists(failflag):
+            sys.exit(1)
+        with open(logfile.name, 'a') as f:
+            f.write("%d %d\n" % (slot, os.getpid()))
+        while True:
+            time.sleep(1)       # Until killed by a SIGTERM.
+
+    def _started():
+        "Return a mapping from worker PIDs to slots."
+        with open(logfile.name) as f:
+            return dict((int(pid), int(slot)) for (slot, pid) in
+                        [line.split() for line in f])
+
+    def _running():
+        "Return a mapping from the slots of running workers to PIDs."
+        return dict((slot, pid) for (pid, slot) in _started().items()
+                    if _alive(pid))
+
+    supervisor = os.fork()
+    if supervisor == 0:
+        prefork.STARTUP_TIME = 0.5
+        os._exit(Supervisor(2, _worker).run())
+
+    try:
+        _wait_for(lambda: sorted(_running()) == [0, 1])
+
+        # A worker that exits is restarted in its slot.
+        first = _running()
+        time.sleep(prefork.STARTUP_TIME + 0.1)
+        os.kill(first[0], signal.SIGKILL)
+        _wait_for(lambda: _running().get(0) not in [None, first[0]])
+
+        # A reload moves the workers to their other slots.
+        time.sleep(prefork.STARTUP_TIME + 0.1)
+        os.kill(supervisor, signal.SIGHUP)
+        _wait_for(lambda: sorted(_running()) == [2, 3])
+
+        # Workers whose replacements fail to start are kept.
+        replaced = _running()
+        open(failflag, 'w').close()
+        os.kill(supervisor, signal.SIGHUP)
+        time.sleep(3 * prefork.STARTUP_TIME)
+        assert _running() == replaced
+
+        os.kill(supervisor, signal.SIGTERM)
+        _, status = os.waitpid(supervisor, 0)
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        _wait_for(lambda: _running() == {})
+    finally:
+        if _alive(supervisor):
+            os.kill(supervisor, signal.SIGKILL)
+        for pid in _running().values():
+            os.kill(pid, signal.SIGKILL)
+        if os.path.exists(failflag):
+            os.unlink(failflag)
@@ -130,3 +130,92 @@ def test_make_slabkey(config):
     for (ns, key, slabkey) in expected:
         v = slabutil_make_slabkey(ns, key)
         assert v == slabkey
+
+def test_footprint(config):
+    "Test that slab footprints track their contents."
+
+    # Footprints are only measured for byte-bounded caches.
+    slabutil_init(config)
+    slab = slabutil_make_slab(C.NODE, [('0', {'k': 'v'})])
+    slab.add('1', {'key': 'a much longer value'})
+    assert slab.footprint == 0
+
+    config.set(C.DATASTORE, C.SLAB_LRU_BYTES, '65536')
+    slabutil_init(config)
+
+    slab = slabutil_make_slab(C.NODE, [('0', {'k': 'v'})])
+    empty = slab.footprint
+    assert empty > 0
+
+    slab.add('1', {'key': 'a much longer value'})
+    assert slab.footprint > empty
+
+    slab = slabutil_make_slab(C.GEODOC, [('s0000', {'k': 'v'})])
+    assert slab.footprint == slabutil_footprint({'k': 'v'})
+
+def test_lazy_slab(config):
+    "Test that lazy slabs create items only when asked for."
+
+    config.set(C.DATASTORE, C.NODES_LRU_BYTES, '65536')
+    slabutil_init(config)
+
+    loaded = []
+    def loader(data, handle):
+        loaded.append(handle)
+        return {'v': data[handle]}
+
+    data = "abcd"
+    slab = slabutil_make_lazy_slab(C.NODE, data,
+                                   [(str(i), i) for i in range(len(data))],
+                                   loader)
+    before = slab.footprint
+
+    assert slab.get('2') == (True, {'v': 'c'})
+    assert slab.get('2') == (True, {'v': 'c'})
+    assert loaded == [2]
+    assert slab.footprint > before
+
+    # Later additions override pending items.
+    slab.add('3', {'v': 'x'})
+    assert slab.get('3') == (True, {'v': 'x'})
+    assert loaded == [2]
+
+    # Retrieving all items creates the rest and releases the data.
+    assert [v for (st, v) in slab.items() if st] == \
+        [{'v': 'a'}, {'v': 'b'}, {'v': 'c'}, {'v': 'x'}]
+    assert sorted(loaded) == [0, 1, 2]
+    assert slab._data is None
+    assert slab.get('5') == (False, '5')
+
+def test_geo_layout(config):
+    "Test slab keys and slabs for the geographically keyed layout."
+
+    config.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    config.set(C.DATASTORE, C.SLAB_LAYOUT, C.GEO)
+    config.set(C.DATASTORE, C.SLAB_GEOHASH_LENGTH, '5')
+    slabutil_init(config)
+
+    assert slabutil_use_geo_slab(C.NODE)
+    assert not slabutil_use_geo_slab(C.RELATION)
+    assert slabutil_index_namespace(C.WAY) == C.WAY_INDEX
+
+    # Element ids map to index slabs.
+    assert slabutil_make_slabkey(C.NODE, '5000') == "NX4096"
+    assert slabutil_group_keys(C.WAY, ['1', '4097']) == \
+        {"WX0": set(['1']), "WX4096": set(['4097'])}
+
+    assert slabutil_make_geo_slabkey(C.NODE, '1', (429000000, -711000000)) \
+        == "NGdrtkn"
+    assert slabutil_make_geo_slabkey(C.NODE, '1025', None) == "NU1024"
+
+    slab = slabutil_make_slab(C.NODE, [], "NGdrtkn")
+    assert slab.slabkey == "NGdrtkn"
+    assert len(slab) == 0
+    slab.add('7', {'k': 'v'})
+    assert slab.keys() == ['7']
+    assert slab.get('7') == (True, {'k': 'v'})
+    assert slab.get('8') == (False, '8')
+
+    config.set(C.DATASTORE, C.SLAB_LAYOUT, C.ID)
+    slabutil_init(config)
+    assert not slabutil_use_geo_slab(C.NODE)
@@ -0,0 +1,167 @@
+# Copyright (c) 2011 AOL Inc.  All Rights Reserved.
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""Test the 'frontend.util' module."""
+
+from ConfigParser import ConfigParser
+from lxml import etree as ET
+
+import apiserver.const as C
+import apiserver.osmelement as O
+
+from datastore.slabutil import init_slabutil
+from frontend.util import XMLResponseWriter, response_etag, \
+    response_to_xml
+
+def pytest_funcarg__config(request):
+    "Prepare a configuration parser object."
+
+    cfg = ConfigParser()
+
+    cfg.add_section(C.DATASTORE)
+    cfg.set(C.DATASTORE, C.SCALE_FACTOR, '10000000')
+    for k in [C.CHANGESETS_INLINE_SIZE, C.NODES_INLINE_SIZE,
+              C.RELATIONS_INLINE_SIZE, C.WAYS_INLINE_SIZE]:
+        cfg.set(C.DATASTORE, k, '1024')
+    for k in [C.CHANGESETS_PER_SLAB, C.NODES_PER_SLAB,
+              C.RELATIONS_PER_SLAB, C.WAYS_PER_SLAB]:
+        cfg.set(C.DATASTORE, k, '8')
+
+    cfg.add_section(C.FRONT_END)
+    cfg.set(C.FRONT_END, C.SERVER_VERSION, '0.6')
+    cfg.set(C.FRONT_END, C.SERVER_NAME, 'Test')
+
+    init_slabutil(cfg)
+    O.init_osm_factory(cfg)
+
+    return cfg
+
+class _Handler:
+    "Collect the output of an XMLResponseWriter."
+
+    def __init__(self):
+        self.chunks = []
+        self.pending = []
+        self.finished = False
+
+    def write(self, text):
+        self.pending.append(text)
+
+    def flush(self):
+        self.chunks.append("".join(self.pending))
+        self.pending = []
+
+    def finish(self):
+        self.flush()
+        self.finished = True
+
+def _elements():
+    elements = []
+    for i in range(5):
+        n = O.new_osm_element(C.NODE, str(i))
+        n[C.LAT] = O.encode_coordinate(float(i))
+        n[C.LON] = O.encode_coordinate(-0.5 * i)
+        n[C.TAGS] = {'name': 'node <%d> & "more"' % i}
+        elements.append(n)
+    w = O.new_osm_element(C.WAY, '1')
+    w[C.NODES] = [0, 1, 2]
+    w[C.TAGS] = {'highway': 'residential'}
+    elements.append(w)
+    r = O.new_osm_element(C.RELATION, '1')
+    r[C.MEMBERS] = [('1', 'outer', C.WAY), ('3', '', C.NODE)]
+    elements.append(r)
+    return elements
+
+def test_writer(config):
+    "Test that streamed output matches that of the whole tree."
+
+    elements = _elements()
+    osm = O.new_osm_response()
+    for e in elements:
+        e.build_response(osm)
+    expected = response_to_xml(osm)
+
+    for batchsize in [1, 2, 256]:
+        h = _Handler()
+        out = XMLResponseWriter(h, O.new_osm_response(), batchsize)
+        out.add(elements[0])
+        out.flush()
+        for e in elements[1:]:
+            out.add(e)
+        out.finish()
+        assert h.finished
+        assert "".join(h.chunks) == expected
+        assert h.chunks[0].startswith("<?xml")
+
+def test_writer_empty(config):
+    "Test writing a response with no elements."
+
+    h = _Handler()
+    XMLResponseWriter(h, O.new_osm_response()).finish()
+    assert "".join(h.chunks) == response_to_xml(O.new_osm_response())
+
+def test_response_etag(config):
+    "Test that entity tags follow the versions and order of elements."
+
+    elements = _elements()
+    etag = response_etag(O.new_osm_response(), elements)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert response_etag(O.new_osm_response(), _elements()) == etag
+    assert response_etag(O.new_osm_response(), elements[::-1]) != etag
+    elements[0][C.VERSION] = '2'
+    assert response_etag(O.new_osm_response(), elements) != etag
+
+    # Elements without versions are told apart by their contents.
+    elements = _elements()
+    etag = response_etag(O.new_osm_response(), elements)
+    assert response_etag(O.new_osm_response(), elements) == etag
+    elements[0][C.TAGS] = {'name': 'changed'}
+    assert response_etag(O.new_osm_response(), elements) != etag
+
+def test_writer_fragments(config):
+    "Test that output using cached XML fragments is unchanged."
+
+    elements = _elements()
+    osm = O.new_osm_response()
+    elements[0].build_response(osm)
+    ET.SubElement(osm, C.BOUNDS, minlat='0')
+    for e in elements[1:]:
+        e.build_response(osm)
+    expected = response_to_xml(osm)
+
+    config.set(C.FRONT_END, C.XML_FRAGMENT_CACHE, 'true')
+    O.init_osm_factory(config)
+    try:
+        for batchsize in [1, 2, 256]:
+            h = _Handler()
+            out = XMLResponseWriter(h, O.new_osm_response(), batchsize)
+            out.add(elements[0])
+            out.append(ET.Element(C.BOUNDS, minlat='0'))
+            for e in elements[1:]:
+                out.add(e)
+            out.finish()
+            assert "".join(h.chunks) == expected
+        assert elements[0]._xml is not None
+    finally:
+        config.remove_option(C.FRONT_END, C.XML_FRAGMENT_CACHE)
+        O.init_osm_factory(config)